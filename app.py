@@ -3,32 +3,124 @@
 Запуск: python app.py  →  открыть http://localhost:5000
 """
 
+import gzip
+import hashlib
 import json
 import os
 import re
+import secrets
 import sys
 import threading
+from concurrent.futures import TimeoutError as FuturesTimeout
 from datetime import datetime
 from pathlib import Path
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from flask import Flask, jsonify, render_template_string, request, send_file, Response
+from flask import Flask, jsonify, request, send_file, Response
+
+try:
+    import brotli
+except ImportError:  # brotli не установлен — отдаём только gzip
+    brotli = None
 
 sys.path.insert(0, str(Path(__file__).parent))
+import articles
 import config
-from generator import generate_article
-from photos import pick_photos
+import images
+import jobs
+import outbox
+import publish_log
+import tasks
+from generator import GeneratedArticle, generate_article
+from photos import PhotoInfo, photo_index, pick_photos, release_photos
 from publisher import VcPublisher
 
 app = Flask(__name__)
 
-ARTICLES_DIR = Path(__file__).parent / "articles"
+ARTICLES_DIR = articles.ARTICLES_DIR
 ARTICLES_DIR.mkdir(exist_ok=True)
 
-# Состояние фоновых задач
-tasks: dict[str, dict] = {}
+THUMB_MAX_AGE = 365 * 24 * 3600  # Превью адресуются хэшем содержимого — кэшируем на год
+THUMB_WAIT = 30                  # Сек. ожидания превью, которое готовится прямо сейчас
+SSE_KEEPALIVE = 15               # Сек. между keepalive-комментариями в потоке событий задачи
+
+# Состояние фоновых задач (в базе состояния — переживает перезапуск)
+task_registry = tasks.TaskRegistry()
+
+_publisher: VcPublisher | None = None
+_publisher_lock = threading.Lock()
+
+_outbox_worker: outbox.OutboxWorker | None = None
+_outbox_lock = threading.Lock()
+
+
+def get_publisher() -> VcPublisher:
+    """
+    Общий для всех запросов VcPublisher: одна сессия с keep-alive пулом соединений
+    к api.vc.ru, общий ограничитель скорости и кэш проверки токена.
+    """
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = VcPublisher(
+                token=config.VC_TOKEN,
+                base_url=config.VC_BASE_URL,
+                upload_concurrency=config.VC_UPLOAD_CONCURRENCY,
+                rate_limit=config.VC_RATE_LIMIT,
+                max_rate_limit=config.VC_RATE_LIMIT_MAX,
+            )
+        return _publisher
+
+
+def get_outbox_worker() -> outbox.OutboxWorker:
+    """Фоновый воркер очереди публикации (запускается один раз на процесс)."""
+    global _outbox_worker
+    with _outbox_lock:
+        if _outbox_worker is None:
+            _outbox_worker = outbox.OutboxWorker(get_publisher)
+            _outbox_worker.start()
+        return _outbox_worker
+
+
+def _pick_article_photos(article: GeneratedArticle) -> list[Path]:
+    """Фото под готовую статью: по её ключевым словам и заголовкам разделов."""
+    return pick_photos(
+        config.PHOTOS_DIR, count=config.PHOTOS_PER_ARTICLE,
+        keywords=article.keywords,
+        headings=[article.title] + [s.get("heading", "") for s in article.sections],
+    )
+
+
+_photo_maps: tuple[list[PhotoInfo], dict[str, PhotoInfo], dict[str, PhotoInfo]] | None = None
+
+
+def _photo_lookup() -> tuple[dict[str, PhotoInfo], dict[str, PhotoInfo]]:
+    """Фото из индекса по имени файла и по SHA-256 (пересобирается при смене индекса)."""
+    global _photo_maps
+    infos = photo_index(config.PHOTOS_DIR)
+    maps = _photo_maps
+    if maps is None or maps[0] is not infos:
+        maps = _photo_maps = (
+            infos,
+            {info.path.name: info for info in infos},
+            {info.sha256: info for info in infos},
+        )
+    return maps[1], maps[2]
+
+
+def _photo_json(info: PhotoInfo) -> dict:
+    # Превью, которого ещё нет, начинаем готовить заранее — к запросу браузера оно будет в кэше
+    if not images.thumbnail_path(info.sha256).exists():
+        images.request_thumbnail(info.path, info.sha256)
+    return {
+        "name": info.path.name,
+        "width": info.width,
+        "height": info.height,
+        "tags": list(info.tags),
+        "thumb": f"/photos/thumb/{info.sha256}.jpg",
+    }
 
 
 # ─── HTML-шаблон ─────────────────────────────────────────────────────────────
@@ -106,6 +198,7 @@ TEMPLATE = """<!DOCTYPE html>
                    width:0%; transition:width .4s; animation:pulse 1.5s infinite; }
   @keyframes pulse { 0%,100%{opacity:1} 50%{opacity:.6} }
   .progress-label { font-size:.82rem; color:var(--muted); margin-top:6px; }
+  .progress-cancel { font-size:.78rem; color:var(--muted); }
 
   /* Article list */
   .art-list { display:flex; flex-direction:column; gap:2px; }
@@ -137,6 +230,7 @@ TEMPLATE = """<!DOCTYPE html>
   .preview-body .photo-slot { background:#f0f9ff; border:1px dashed #93c5fd;
     border-radius:8px; padding:14px; text-align:center; color:#3b82f6;
     font-size:.83rem; margin:12px 0; }
+  .preview-body .photo-slot img { display:block; max-width:100%; margin:0 auto; border-radius:6px; }
   .preview-empty { display:flex; align-items:center; justify-content:center;
                    height:400px; color:var(--muted); flex-direction:column; gap:12px; }
   .preview-empty svg { opacity:.3; }
@@ -203,6 +297,7 @@ TEMPLATE = """<!DOCTYPE html>
         <div class="progress-wrap" id="progress">
           <div class="progress-bar"><div class="progress-fill" id="progressFill"></div></div>
           <div class="progress-label" id="progressLabel">Запускаем генерацию...</div>
+          <a href="#" class="progress-cancel" onclick="cancelTask(); return false;">Отменить</a>
         </div>
       </div>
     </div>
@@ -266,6 +361,12 @@ async function loadArticles() {
   renderList();
 }
 
+function publishBadge(p) {
+  if (!p || p.status !== 'done') return '';
+  if (p.published === false) return ' · черновик на VC.RU';
+  return p.published ? ' · ✓ на VC.RU' : ' · на VC.RU';
+}
+
 function renderList() {
   const list = document.getElementById('artList');
   document.getElementById('artCount').textContent = articles.length ? `(${articles.length})` : '';
@@ -278,7 +379,7 @@ function renderList() {
       <div class="art-dot ${i === 0 ? 'new' : ''}"></div>
       <div class="art-info">
         <div class="art-title">${a.title}</div>
-        <div class="art-meta">${a.date} · ${a.words} слов</div>
+        <div class="art-meta">${a.date} · ${a.words} слов${publishBadge(a.publish)}</div>
       </div>
     </div>
   `).join('');
@@ -300,6 +401,7 @@ function showPreview(data) {
     `${data.date}  ·  ~${data.words} слов  ·  ${data.filename}`;
 
   let html = '';
+  const photos = [...(data.photos || [])];
   if (data.intro) html += data.intro.split('\\n\\n').map(p => `<p>${p}</p>`).join('');
 
   (data.sections || []).forEach(s => {
@@ -309,7 +411,10 @@ function showPreview(data) {
       html += '<ul>' + s.list_items.map(i => `<li>${i}</li>`).join('') + '</ul>';
     }
     if (s.has_image_placeholder) {
-      html += '<div class="photo-slot">📷 Место для фотографии</div>';
+      const photo = photos.shift();
+      html += photo
+        ? `<div class="photo-slot"><img src="${photo.thumb}" alt="${photo.name}" loading="lazy"></div>`
+        : '<div class="photo-slot">📷 Место для фотографии</div>';
     }
   });
 
@@ -345,48 +450,84 @@ async function generateArticle() {
     })
   });
   const data = await res.json();
+  if (res.status === 429) {
+    hideProgress();
+    document.getElementById('genBtn').disabled = false;
+    showToast(`⏳ ${data.error} (в очереди ${data.queued} из ${data.max_queued})`, 4000);
+    return;
+  }
   currentTask = data.task_id;
-  pollTask(currentTask);
+  if (data.position > 1) setProgress(5, `В очереди: ${data.position}-я`);
+  watchTask(currentTask);
 }
 
-function pollTask(taskId) {
-  let progress = 5;
-  const stages = [
-    'Claude AI пишет статью...',
-    'Генерация разделов...',
-    'Добавляем SEO-ссылки...',
-    'Финализируем статью...',
-    'Сохраняем...',
-  ];
-  let stageIdx = 0;
+const STAGES = {
+  queued:     [5,  'Задача в очереди...'],
+  photos:     [10, 'Подбираем фото...'],
+  generating: [20, 'Claude AI пишет статью...'],
+  parsing:    [75, 'Разбираем ответ Claude...'],
+  uploading:  [85, 'Загружаем фото на VC.RU...'],
+  publishing: [92, 'Публикуем...'],
+};
+
+function onTaskState(data) {
+  if (data.status === 'done') {
+    setProgress(100, 'Готово!');
+    setTimeout(() => {
+      hideProgress();
+      document.getElementById('genBtn').disabled = false;
+      document.getElementById('topic').value = '';
+      document.getElementById('description').value = '';
+      showToast('✅ Статья сгенерирована!');
+      if (data.outbox_id) watchOutbox(data.outbox_id);
+      loadArticles().then(() => {
+        if (articles.length) loadArticle(articles[0].filename);
+      });
+    }, 600);
+    return true;
+  }
+  if (data.status === 'cancelled') {
+    hideProgress();
+    document.getElementById('genBtn').disabled = false;
+    showToast('Генерация отменена');
+    return true;
+  }
+  if (data.status === 'error' || data.status === 'unknown') {
+    hideProgress();
+    document.getElementById('genBtn').disabled = false;
+    showToast('❌ Ошибка: ' + (data.error || 'задача не найдена'), 4000);
+    return true;
+  }
+  const [pct, label] = STAGES[data.stage] || STAGES.queued;
+  setProgress(pct, label);
+  return false;
+}
 
-  pollInterval = setInterval(async () => {
-    progress = Math.min(progress + Math.random() * 8, 90);
-    if (stageIdx < stages.length - 1 && progress > (stageIdx + 1) * 18) stageIdx++;
-    setProgress(progress, stages[stageIdx]);
+function watchTask(taskId) {
+  // Этапы приходят через SSE в момент смены; без EventSource или при обрыве — опрос
+  if (!window.EventSource) return pollTask(taskId);
+  const es = new EventSource(`/api/task/${taskId}/events`);
+  let finished = false;
+  es.onmessage = e => {
+    finished = onTaskState(JSON.parse(e.data));
+    if (finished) es.close();
+  };
+  es.onerror = () => {
+    if (finished) return;
+    es.close();
+    pollTask(taskId);
+  };
+}
 
-    const res = await fetch(`/api/task/${taskId}`);
-    const data = await res.json();
+async function cancelTask() {
+  if (!currentTask) return;
+  await fetch(`/api/task/${currentTask}/cancel`, {method: 'POST'});
+}
 
-    if (data.status === 'done') {
-      clearInterval(pollInterval);
-      setProgress(100, 'Готово!');
-      setTimeout(() => {
-        hideProgress();
-        document.getElementById('genBtn').disabled = false;
-        document.getElementById('topic').value = '';
-        document.getElementById('description').value = '';
-        showToast('✅ Статья сгенерирована!');
-        loadArticles().then(() => {
-          if (articles.length) loadArticle(articles[0].filename);
-        });
-      }, 600);
-    } else if (data.status === 'error') {
-      clearInterval(pollInterval);
-      hideProgress();
-      document.getElementById('genBtn').disabled = false;
-      showToast('❌ Ошибка: ' + data.error, 4000);
-    }
+function pollTask(taskId) {
+  pollInterval = setInterval(async () => {
+    const res = await fetch(`/api/task/${taskId}`);
+    if (onTaskState(await res.json())) clearInterval(pollInterval);
   }, 2000);
 }
 
@@ -428,10 +569,28 @@ async function publishCurrent() {
     body: JSON.stringify({ filename: currentArticle.filename })
   });
   const data = await res.json();
-  if (data.ok) showToast('✅ Опубликовано: ' + (data.url || ''), 5000);
+  if (data.ok && data.queued) {
+    showToast('🕓 Статья в очереди на публикацию', 3000);
+    watchOutbox(data.outbox_id);
+  }
+  else if (data.ok) showToast('✅ Опубликовано: ' + (data.url || ''), 5000);
   else showToast('❌ ' + (data.error || 'Ошибка публикации'), 8000);
 }
 
+function watchOutbox(itemId) {
+  const timer = setInterval(async () => {
+    const res = await fetch(`/api/outbox/${itemId}`);
+    const data = await res.json();
+    if (data.status === 'done') {
+      clearInterval(timer);
+      showToast('✅ Опубликовано: ' + (data.url || ''), 5000);
+    } else if (data.status === 'failed' || data.status === 'unknown') {
+      clearInterval(timer);
+      showToast('❌ ' + (data.last_error || 'Ошибка публикации'), 8000);
+    }
+  }, 3000);
+}
+
 // ─── Toast ────────────────────────────────────────────────────────────────
 
 function showToast(msg, ms=2500) {
@@ -479,207 +638,254 @@ loadArticles();
 
 # ─── API ─────────────────────────────────────────────────────────────────────
 
-def _parse_html_article(filepath: Path) -> dict:
-    """Читает сохранённый HTML и возвращает базовую мета-инфу."""
-    html = filepath.read_text(encoding="utf-8")
-    title_m = re.search(r"<h1[^>]*>(.*?)</h1>", html, re.S)
-    title = title_m.group(1).strip() if title_m else filepath.stem
-    text = re.sub(r"<[^>]+>", "", html)
-    words = len(text.split())
-    mtime = datetime.fromtimestamp(filepath.stat().st_mtime)
-    return {
-        "filename": filepath.name,
-        "title": title,
-        "date": mtime.strftime("%d.%m.%Y %H:%M"),
-        "words": words,
-    }
-
-
-@app.route("/")
-def index():
-    return render_template_string(TEMPLATE)
-
-
 @app.route("/article/<filename>")
 def serve_article(filename):
-    path = ARTICLES_DIR / filename
-    if path.exists():
-        return send_file(path)
+    path = articles.html_path(filename, ARTICLES_DIR)
+    if path is not None:
+        return send_file(path.resolve())
     return "Not found", 404
 
 
 @app.route("/api/articles")
 def api_articles():
-    files = sorted(ARTICLES_DIR.glob("*.html"), key=lambda f: f.stat().st_mtime, reverse=True)
-    return jsonify([_parse_html_article(f) for f in files])
+    items = articles.catalog(ARTICLES_DIR)
+    # CLI и веб-интерфейс публикуют статью под ключом её файла
+    keys = {a["filename"]: publish_log.article_key(a["filename"], config.VC_SUBSITE_ID) for a in items}
+    published = publish_log.statuses(list(keys.values()))
+    for a in items:
+        a["publish"] = published.get(keys[a["filename"]])
+    return jsonify(items)
 
 
 @app.route("/api/article/<filename>")
 def api_article(filename):
-    path = ARTICLES_DIR / filename
-    if not path.exists():
+    data = articles.load(filename, ARTICLES_DIR)
+    if data is None:
         return jsonify({"error": "not found"}), 404
 
-    html = path.read_text(encoding="utf-8")
-    title_m = re.search(r"<h1[^>]*>(.*?)</h1>", html, re.S)
-    title = title_m.group(1).strip() if title_m else path.stem
-
-    # Ищем JSON в мете (если есть) или парсим из HTML
-    json_m = re.search(r"<!--JSON:(.*?)-->", html, re.S)
-    if json_m:
-        data = json.loads(json_m.group(1))
-        data["filename"] = filename
-        data["date"] = datetime.fromtimestamp(path.stat().st_mtime).strftime("%d.%m.%Y %H:%M")
-        data["words"] = len(re.sub(r"<[^>]+>", "", html).split())
-        return jsonify(data)
-
-    # Fallback: парсим из HTML-текста
-    text = re.sub(r"<[^>]+>", "", html)
-    words = len(text.split())
-    mtime = datetime.fromtimestamp(path.stat().st_mtime)
-    return jsonify({
-        "filename": filename,
-        "title": title,
-        "date": mtime.strftime("%d.%m.%Y %H:%M"),
-        "words": words,
-        "intro": "",
-        "sections": [],
-        "conclusion": "",
-    })
-
-
-@app.route("/api/generate", methods=["POST"])
-def api_generate():
-    body = request.get_json()
-    topic = (body.get("topic") or "").strip()
-    if not topic:
-        return jsonify({"error": "Нет темы"}), 400
-
-    task_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
-    tasks[task_id] = {"status": "running"}
-
-    def worker():
-        try:
-            article = generate_article(
-                topic_title=topic,
-                topic_description=body.get("description", ""),
-                niche_keywords=config.NICHE_KEYWORDS,
-                site_url=config.YOUR_SITE_URL,
-                site_anchor=config.YOUR_SITE_ANCHOR,
-                api_key=config.ANTHROPIC_API_KEY,
-                min_words=config.ARTICLE_MIN_WORDS,
-                links_count=config.ARTICLE_LINKS_COUNT,
-                tone=config.ARTICLE_TONE,
+    by_name, _ = _photo_lookup()
+    data["filename"] = filename
+    data["photos"] = [_photo_json(by_name[n]) for n in data.get("photos", []) if n in by_name]
+    data["words"] = articles.count_words(articles.to_article(data))
+    created = data.get("created")
+    if created:
+        data["date"] = datetime.fromisoformat(created).strftime("%d.%m.%Y %H:%M")
+    else:
+        mtime = (ARTICLES_DIR / filename).stat().st_mtime
+        data["date"] = datetime.fromtimestamp(mtime).strftime("%d.%m.%Y %H:%M")
+    return jsonify(data)
+
+
+def _run_generation(job: jobs.Job) -> None:
+    """Задача очереди генерации: payload — тело запроса /api/generate, id — id задачи."""
+    task_id, body = job.id, job.payload
+    topic = body["topic"]
+
+    def stage(name: str) -> None:
+        job.check_cancelled()
+        task_registry.set(task_id, "running", stage=name)
+
+    photos, prefetch, saved = None, None, False
+    try:
+        publish = body.get("publish", False)
+        local_only = body.get("local_only", False)
+
+        # С конвейером фото выбираем заранее по теме и загружаем на VC.RU,
+        # пока Claude пишет статью; без него — подбираем по готовой статье
+        if not local_only and config.PIPELINE_UPLOADS:
+            stage("photos")
+            photos = pick_photos(
+                config.PHOTOS_DIR, count=config.PHOTOS_PER_ARTICLE,
+                keywords=[topic], headings=[body.get("description", "")],
             )
+            if photos:
+                prefetch = get_publisher().prefetch_uploads(photos)
+
+        article = generate_article(
+            topic_title=topic,
+            topic_description=body.get("description", ""),
+            niche_keywords=config.NICHE_KEYWORDS,
+            site_url=config.YOUR_SITE_URL,
+            site_anchor=config.YOUR_SITE_ANCHOR,
+            api_key=config.ANTHROPIC_API_KEY,
+            min_words=config.ARTICLE_MIN_WORDS,
+            links_count=config.ARTICLE_LINKS_COUNT,
+            tone=config.ARTICLE_TONE,
+            on_stage=stage,
+        )
 
-            # Сохраняем HTML + JSON-мету внутри
-            import json as _json
-            output_dir = ARTICLES_DIR
-            safe = "".join(c if c.isalnum() or c in " _-" else "_" for c in article.title)[:60]
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filepath = output_dir / f"{ts}_{safe}.html"
-
-            sections_html = ""
-            for section in article.sections:
-                sections_html += f'<h2>{section.get("heading","")}</h2>\n'
-                for p in section.get("paragraphs", []):
-                    sections_html += f"<p>{p}</p>\n"
-                items = section.get("list_items", [])
-                if items:
-                    sections_html += "<ul>\n" + "".join(f"  <li>{it}</li>\n" for it in items) + "</ul>\n"
-                if section.get("has_image_placeholder"):
-                    sections_html += '<p><em>[ФОТО]</em></p>\n'
-
-            meta_json = _json.dumps({
-                "title": article.title,
-                "intro": article.intro,
-                "sections": article.sections,
-                "conclusion": article.conclusion,
-                "meta_description": article.meta_description,
-                "keywords": article.keywords,
-            }, ensure_ascii=False)
-
-            html = f"""<!DOCTYPE html>
-<html lang="ru"><head><meta charset="utf-8">
-<title>{article.title}</title>
-<style>body{{max-width:860px;margin:40px auto;font-family:Georgia,serif;line-height:1.7;padding:0 20px}}
-h1{{font-size:2em;margin-bottom:.3em}}h2{{margin-top:1.8em;color:#1e40af}}
-p{{margin:.8em 0}}ul{{margin:.5em 0 1em 1.5em}}.meta{{color:#888;font-size:.9em;margin-bottom:2em}}</style>
-</head><body>
-<!--JSON:{meta_json}-->
-<h1>{article.title}</h1>
-<p class="meta">{article.meta_description}</p>
-{article.intro.replace(chr(10)*2,"</p><p>")}
-{sections_html}
-<h2>Заключение</h2>
-<p>{article.conclusion.replace(chr(10)*2,"</p><p>")}</p>
-</body></html>"""
-            filepath.write_text(html, encoding="utf-8")
-
-            # Публикуем если нужно
-            publish = body.get("publish", False)
-            local_only = body.get("local_only", False)
-            entry_url = None
-
-            if not local_only:
-                photos = pick_photos(config.PHOTOS_DIR, count=config.PHOTOS_PER_ARTICLE)
-                pub = VcPublisher(token=config.VC_TOKEN, base_url=config.VC_BASE_URL)
-                result = pub.publish_article(
+        if not local_only and photos is None:
+            stage("photos")
+            photos = _pick_article_photos(article)
+
+        filepath = articles.save(article, photos=[p.name for p in photos or []], articles_dir=ARTICLES_DIR)
+        saved = True
+
+        # Публикуем если нужно
+        entry_url = None
+        outbox_id = None
+
+        if not local_only:
+            if prefetch:
+                stage("uploading")
+            uploaded = prefetch.result() if prefetch else None
+            stage("publishing")
+            # Ключ по имени файла: кнопка «Опубликовать» потом правит эту же запись
+            key = publish_log.article_key(filepath.name, config.VC_SUBSITE_ID)
+            if config.PUBLISH_VIA_OUTBOX:
+                # Публикует фоновый воркер — генерация не ждёт VC.RU,
+                # загруженные заранее фото он возьмёт из upload_cache
+                outbox_id = outbox.enqueue(
+                    article, photos, subsite_id=config.VC_SUBSITE_ID, publish=publish, publish_key=key,
+                )
+                get_outbox_worker().notify()
+            else:
+                result = get_publisher().publish_article(
                     article=article,
                     image_paths=photos,
                     subsite_id=config.VC_SUBSITE_ID,
                     publish=publish,
+                    publish_key=key,
+                    uploaded_images=uploaded,
                 )
                 if result:
                     entry_url = result.get("url") or f"https://vc.ru/id/{result.get('id','?')}"
 
-            tasks[task_id] = {"status": "done", "url": entry_url, "filename": filepath.name}
+        task_registry.set(task_id, "done", stage="done", url=entry_url, filename=filepath.name, outbox_id=outbox_id)
+
+    except jobs.JobCancelled:
+        task_registry.set(task_id, "cancelled", stage="cancelled")
+        raise
+    except Exception as e:
+        task_registry.set(task_id, "error", stage="error", error=str(e))
+        # Очередь запишет задачу как failed (счётчик failed в /api/jobs)
+        raise
+    finally:
+        # Статья не сохранилась — фото не засчитываются и возвращаются в ротацию;
+        # уже загруженные остались в upload_cache и повторно не загрузятся
+        if not saved:
+            if prefetch:
+                prefetch.cancel()
+            if photos:
+                release_photos(config.PHOTOS_DIR, photos)
 
-        except Exception as e:
-            tasks[task_id] = {"status": "error", "error": str(e)}
 
-    threading.Thread(target=worker, daemon=True).start()
-    return jsonify({"task_id": task_id})
+# Генерации идут через ограниченную очередь с пулом воркеров, а не поток на запрос.
+# Очередь общая для всех процессов веб-сервера — задачу возьмёт любой свободный воркер
+job_queue = jobs.JobQueue(config.JOB_WORKERS, config.JOB_QUEUE_MAX, _run_generation, name="generate")
+
+
+@app.route("/api/generate", methods=["POST"])
+def api_generate():
+    body = request.get_json()
+    topic = (body.get("topic") or "").strip()
+    if not topic:
+        return jsonify({"error": "Нет темы"}), 400
+    try:
+        priority = int(body.get("priority", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "priority должен быть целым числом"}), 400
+
+    # Время + случайный хвост: id уникален и при нескольких процессах
+    task_id = datetime.now().strftime("%Y%m%d%H%M%S%f") + secrets.token_hex(2)
+    payload = {
+        "topic": topic,
+        "description": body.get("description", ""),
+        "publish": bool(body.get("publish", False)),
+        "local_only": bool(body.get("local_only", False)),
+    }
+    # Ожидающую задачу никто не ведёт — аренду возьмёт воркер, который её заберёт
+    task_registry.set(task_id, "running", lease=False, stage="queued")
+    try:
+        position = job_queue.submit(task_id, payload, priority=priority)
+    except jobs.QueueFull as e:
+        task_registry.discard(task_id)
+        resp = jsonify({
+            "error": "Очередь генерации заполнена, попробуйте позже",
+            "queued": e.queued,
+            "max_queued": e.max_queued,
+            "position": e.queued + 1,
+        })
+        resp.headers["Retry-After"] = "30"
+        return resp, 429
+    return jsonify({"task_id": task_id, "position": position})
 
 
 @app.route("/api/task/<task_id>")
 def api_task(task_id):
-    return jsonify(tasks.get(task_id, {"status": "unknown"}))
+    state = task_registry.get(task_id) or {"status": "unknown"}
+    if state.get("stage") == "queued":
+        state["position"] = job_queue.position(task_id)
+    return jsonify(state)
+
+
+@app.route("/api/task/<task_id>/cancel", methods=["POST"])
+def api_task_cancel(task_id):
+    if not job_queue.cancel(task_id):
+        return jsonify({"ok": False, "error": "Задача не найдена или уже завершена"}), 404
+    # Ожидавшая задача снята сразу; выполняющаяся сообщит об отмене сама на смене этапа
+    if (task_registry.get(task_id) or {}).get("stage") == "queued":
+        task_registry.set(task_id, "cancelled", stage="cancelled")
+    return jsonify({"ok": True})
+
+
+@app.route("/api/jobs")
+def api_jobs():
+    return jsonify(job_queue.stats())
+
+
+@app.route("/api/task/<task_id>/events")
+def api_task_events(task_id):
+    """SSE-поток состояния задачи: событие на каждую смену этапа, затем done/error."""
+    def stream():
+        seen = 0
+        while True:
+            state = task_registry.wait(task_id, seen, timeout=SSE_KEEPALIVE) or {"status": "unknown"}
+            if state.get("seq") == seen:
+                yield ": keepalive\n\n"   # не даём прокси закрыть простаивающее соединение
+                continue
+            seen = state.get("seq", 0)
+            yield f"data: {json.dumps(state, ensure_ascii=False)}\n\n"
+            if state["status"] in tasks.FINAL_STATUSES or state["status"] == "unknown":
+                return
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/api/publish", methods=["POST"])
 def api_publish():
     body = request.get_json()
     filename = body.get("filename")
-    path = ARTICLES_DIR / filename
-    if not path.exists():
-        return jsonify({"ok": False, "error": "Файл не найден"})
-
     try:
-        html = path.read_text(encoding="utf-8")
-        json_m = re.search(r"<!--JSON:(.*?)-->", html, re.S)
-        if not json_m:
-            return jsonify({"ok": False, "error": "Нет данных статьи в файле"})
-
-        import json as _json
-        from generator import GeneratedArticle
-        data = _json.loads(json_m.group(1))
-        article = GeneratedArticle(
-            title=data["title"],
-            intro=data.get("intro", ""),
-            sections=data.get("sections", []),
-            conclusion=data.get("conclusion", ""),
-            meta_description=data.get("meta_description", ""),
-            keywords=data.get("keywords", []),
-        )
+        record = articles.load(filename, ARTICLES_DIR)
+        if record is None:
+            return jsonify({"ok": False, "error": "Файл не найден"})
+        article = articles.to_article(record)
 
         if not config.VC_TOKEN:
             return jsonify({"ok": False, "error": "VC_TOKEN не задан в переменных окружения"})
 
-        photos = pick_photos(config.PHOTOS_DIR, count=config.PHOTOS_PER_ARTICLE)
-        pub = VcPublisher(token=config.VC_TOKEN, base_url=config.VC_BASE_URL)
-        result = pub.publish_article(article=article, image_paths=photos,
-                                     subsite_id=config.VC_SUBSITE_ID, publish=True)
+        # Уже опубликованная статья правится на месте (update=True) с прежними фото:
+        # публикатор берёт их из журнала, а фото статьи загружает, только если журнал их не помнит
+        key = publish_log.article_key(filename, config.VC_SUBSITE_ID)
+        by_name, _ = _photo_lookup()
+        photos = [by_name[n].path for n in record.get("photos", []) if n in by_name]
+        if not photos:
+            photos = _pick_article_photos(article)
+        if config.PUBLISH_VIA_OUTBOX:
+            outbox_id = outbox.enqueue(
+                article, photos, subsite_id=config.VC_SUBSITE_ID, publish=True, publish_key=key, update=True,
+            )
+            get_outbox_worker().notify()
+            return jsonify({"ok": True, "queued": True, "outbox_id": outbox_id})
+
+        result = get_publisher().publish_article(article=article, image_paths=photos,
+                                                 subsite_id=config.VC_SUBSITE_ID, publish=True,
+                                                 publish_key=key, update=True)
         if result:
             url = result.get("url") or f"https://vc.ru/id/{result.get('id','?')}"
             return jsonify({"ok": True, "url": url})
@@ -692,52 +898,191 @@ def api_publish():
 def api_check_vc():
     if not config.VC_TOKEN:
         return jsonify({"ok": False, "error": "VC_TOKEN не задан в переменных окружения Railway"})
-    pub = VcPublisher(token=config.VC_TOKEN, base_url=config.VC_BASE_URL)
-    result = pub.check_token()
+    pub = get_publisher()
+    result = pub.check_token(max_age=config.VC_TOKEN_CHECK_TTL)
+    result["rate_limit"] = round(pub.rate, 2)
     return jsonify(result)
 
 
-@app.route("/manifest.json")
-def manifest():
-    data = {
-        "name": "VC.RU SEO Bot",
-        "short_name": "SEO Bot",
-        "description": "Автогенерация SEO-статей для VC.RU",
-        "start_url": "/",
-        "display": "standalone",
-        "background_color": "#f8fafc",
-        "theme_color": "#2563eb",
-        "lang": "ru",
-        "icons": [
-            {"src": "/icon.svg", "sizes": "any", "type": "image/svg+xml", "purpose": "any maskable"},
-        ]
-    }
-    return Response(json.dumps(data, ensure_ascii=False), mimetype="application/json")
+@app.route("/api/outbox/<int:item_id>")
+def api_outbox(item_id):
+    item = outbox.get(item_id)
+    if item is None:
+        return jsonify({"status": "unknown"}), 404
+    entry = item.pop("result") or {}
+    if entry:
+        item["url"] = entry.get("url") or f"https://vc.ru/id/{entry.get('id','?')}"
+    return jsonify(item)
 
 
-@app.route("/icon.svg")
-def icon():
-    svg = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100">
+@app.route("/api/photos")
+def api_photos():
+    """Фото из PHOTOS_DIR с превью; ?offset=&limit= — постранично."""
+    offset = request.args.get("offset", 0, type=int)
+    limit = min(request.args.get("limit", 200, type=int), 1000)
+    infos = photo_index(config.PHOTOS_DIR)
+    return jsonify({
+        "total": len(infos),
+        "photos": [_photo_json(info) for info in infos[offset:offset + limit]],
+    })
+
+
+@app.route("/photos/thumb/<sha256>.jpg")
+def photo_thumb(sha256):
+    if not re.fullmatch(r"[0-9a-f]{64}", sha256):
+        return "Not found", 404
+    path = images.thumbnail_path(sha256)
+    if not path.exists():
+        _, by_hash = _photo_lookup()
+        info = by_hash.get(sha256)
+        if info is None:
+            return "Not found", 404
+        try:
+            path = images.request_thumbnail(info.path, sha256).result(timeout=THUMB_WAIT)
+        except FuturesTimeout:
+            # Превью ещё готовится (большое фото, занятый пул) — браузер повторит позже
+            return "Thumbnail is not ready", 503, {"Retry-After": "5", "Cache-Control": "no-store"}
+        if path is None:
+            if images.Image is not None:
+                # Pillow есть, но фото не читается (битый файл, неизвестный формат)
+                return "Unsupported image", 415
+            # Без Pillow превью не сделать — отдаём исходное фото
+            return send_file(info.path.resolve(), max_age=3600)
+    # Адрес превью содержит хэш содержимого — ответ никогда не меняется
+    resp = send_file(path.resolve(), mimetype="image/jpeg", max_age=THUMB_MAX_AGE)
+    resp.headers["Cache-Control"] = f"public, max-age={THUMB_MAX_AGE}, immutable"
+    return resp
+
+
+# ─── Статические ответы ──────────────────────────────────────────────────────
+# Оболочка, манифест, иконка и service worker не зависят от запроса: собираются
+# и сжимаются один раз при старте, отдаются с ETag и отвечают 304 без тела.
+
+MANIFEST = {
+    "name": "VC.RU SEO Bot",
+    "short_name": "SEO Bot",
+    "description": "Автогенерация SEO-статей для VC.RU",
+    "start_url": "/",
+    "display": "standalone",
+    "background_color": "#f8fafc",
+    "theme_color": "#2563eb",
+    "lang": "ru",
+    "icons": [
+        {"src": "/icon.svg", "sizes": "any", "type": "image/svg+xml", "purpose": "any maskable"},
+    ]
+}
+
+ICON_SVG = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100">
   <rect width="100" height="100" rx="20" fill="#2563eb"/>
   <text y="62" x="50" text-anchor="middle" font-size="52" font-family="Arial,sans-serif" font-weight="bold" fill="white">S</text>
   <text y="85" x="50" text-anchor="middle" font-size="18" font-family="Arial,sans-serif" fill="#93c5fd">SEO</text>
 </svg>"""
-    return Response(svg, mimetype="image/svg+xml")
 
+# Кэш называется по версии оболочки: после деплоя новый service worker
+# создаёт свежий кэш и удаляет старые
+SERVICE_WORKER = """
+const CACHE = 'seo-bot-%(version)s';
+const SHELL = ['/', '/manifest.json', '/icon.svg'];
 
-@app.route("/sw.js")
-def service_worker():
-    sw = """
-const CACHE = 'seo-bot-v1';
 self.addEventListener('install', e => e.waitUntil(
-  caches.open(CACHE).then(c => c.addAll(['/']))
+  caches.open(CACHE).then(c => c.addAll(SHELL)).then(() => self.skipWaiting())
 ));
+
+self.addEventListener('activate', e => e.waitUntil(
+  caches.keys()
+    .then(keys => Promise.all(keys.filter(k => k !== CACHE).map(k => caches.delete(k))))
+    .then(() => self.clients.claim())
+));
+
 self.addEventListener('fetch', e => {
-  if (e.request.url.includes('/api/')) return;
+  const url = new URL(e.request.url);
+  if (e.request.method !== 'GET' || url.origin !== location.origin || url.pathname.startsWith('/api/')) return;
+
+  // Превью фото неизменны (адрес содержит хэш) — сначала кэш
+  if (url.pathname.startsWith('/photos/thumb/')) {
+    e.respondWith(caches.open(CACHE).then(c => c.match(e.request).then(hit => hit ||
+      fetch(e.request).then(res => { if (res.ok) c.put(e.request, res.clone()); return res; }))));
+    return;
+  }
+
+  // Оболочка: мгновенно из кэша, в фоне — проверка обновления (ETag → 304)
+  if (SHELL.includes(url.pathname)) {
+    e.respondWith(caches.open(CACHE).then(c => c.match(e.request).then(hit => {
+      const update = fetch(e.request).then(res => { if (res.ok) c.put(e.request, res.clone()); return res; });
+      if (hit) { e.waitUntil(update.catch(() => {})); return hit; }
+      return update;
+    })));
+    return;
+  }
+
   e.respondWith(fetch(e.request).catch(() => caches.match(e.request)));
 });
 """
-    return Response(sw, mimetype="application/javascript")
+
+
+class StaticAsset:
+    """Готовый ответ: тело, его gzip/brotli-версии и ETag для каждой."""
+
+    def __init__(self, body: str | bytes, mimetype: str, cache_control: str):
+        raw = body.encode("utf-8") if isinstance(body, str) else body
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.version = hashlib.sha256(raw).hexdigest()[:16]
+        # кодировка → (тело, ETag); сжатая версия хранится, только если она меньше
+        self.variants = {"identity": (raw, f'"{self.version}"')}
+        compressed = {"gzip": gzip.compress(raw, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed["br"] = brotli.compress(raw, quality=11)
+        for encoding, data in compressed.items():
+            if len(data) < len(raw):
+                self.variants[encoding] = (data, f'"{self.version}-{encoding}"')
+
+    def response(self) -> Response:
+        accepted = request.accept_encodings
+        encoding = next(
+            (e for e in ("br", "gzip") if e in self.variants and accepted[e]),
+            "identity",
+        )
+        body, etag = self.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if etag.strip('"') in request.if_none_match:
+            return Response(status=304, headers=headers)
+        return Response(body, mimetype=self.mimetype, headers=headers)
+
+
+def _build_static_assets() -> dict[str, StaticAsset]:
+    shell = StaticAsset(TEMPLATE, "text/html", "no-cache")
+    return {
+        "/": shell,
+        "/manifest.json": StaticAsset(
+            json.dumps(MANIFEST, ensure_ascii=False), "application/manifest+json", "public, max-age=86400",
+        ),
+        "/icon.svg": StaticAsset(ICON_SVG, "image/svg+xml", "public, max-age=86400"),
+        # Браузер сам перепроверяет service worker; no-cache — чтобы обновление приходило сразу
+        "/sw.js": StaticAsset(
+            SERVICE_WORKER % {"version": shell.version}, "application/javascript", "no-cache",
+        ),
+    }
+
+
+STATIC_ASSETS = _build_static_assets()
+
+
+@app.route("/")
+@app.route("/manifest.json")
+@app.route("/icon.svg")
+@app.route("/sw.js")
+def static_asset():
+    return STATIC_ASSETS[request.path].response()
+
+
+# Допубликовать то, что осталось в очереди с прошлого запуска,
+# и взять генерации, принятые до перезапуска или другим процессом
+if config.PUBLISH_VIA_OUTBOX:
+    get_outbox_worker()
+job_queue.start()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,315 @@
+"""
+Хранилище сохранённых статей (articles/).
+Каноническая форма статьи — компактная JSON-запись `<имя>.json`; `<имя>.html` —
+её отрисовка для просмотра и копипасты, пересоздаётся из записи при необходимости.
+Каталог (заголовок, число слов, ключевые слова) хранится в базе состояния
+и пересчитывается только для новых и изменённых файлов (по mtime и размеру) —
+список статей строится без чтения файлов.
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+from datetime import datetime
+from html import unescape
+from pathlib import Path
+from typing import Optional
+
+import storage
+from generator import GeneratedArticle
+
+logger = logging.getLogger(__name__)
+
+ARTICLES_DIR = Path(__file__).parent / "articles"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS article_catalog (
+    dir      TEXT    NOT NULL,
+    filename TEXT    NOT NULL,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    title    TEXT    NOT NULL,
+    words    INTEGER NOT NULL,
+    keywords TEXT    NOT NULL DEFAULT '[]',
+    created  TEXT,
+    PRIMARY KEY (dir, filename)
+);
+"""
+
+
+def _db():
+    return storage.connect(_SCHEMA)
+
+
+def count_words(article) -> int:
+    """Число слов в тексте статьи (GeneratedArticle) без HTML-разметки."""
+    parts = [article.title, article.meta_description, article.intro, article.conclusion]
+    for section in article.sections:
+        parts.append(section.get("heading", ""))
+        parts.extend(section.get("paragraphs", []))
+        parts.extend(section.get("list_items", []))
+    return sum(len(re.sub(r"<[^>]+>", " ", p).split()) for p in parts if p)
+
+
+# ─── Записи статей ───────────────────────────────────────────────────────────
+
+_FIELDS = ("title", "intro", "sections", "conclusion", "meta_description", "keywords")
+
+
+def to_record(article: GeneratedArticle, photos: list[str] = ()) -> dict:
+    record = {name: getattr(article, name) for name in _FIELDS}
+    record["photos"] = list(photos)
+    record["created"] = datetime.now().isoformat(timespec="seconds")
+    return record
+
+
+def to_article(record: dict) -> GeneratedArticle:
+    return GeneratedArticle(
+        title=record["title"],
+        intro=record.get("intro", ""),
+        sections=record.get("sections", []),
+        conclusion=record.get("conclusion", ""),
+        meta_description=record.get("meta_description", ""),
+        keywords=record.get("keywords", []),
+    )
+
+
+def render_html(record: dict) -> str:
+    """HTML-версия статьи для просмотра в браузере и копипасты."""
+    sections_html = ""
+    for section in record.get("sections", []):
+        sections_html += f'<h2>{section.get("heading", "")}</h2>\n'
+        for para in section.get("paragraphs", []):
+            sections_html += f"<p>{para}</p>\n"
+        items = section.get("list_items", [])
+        if items:
+            sections_html += "<ul>\n" + "".join(f"  <li>{it}</li>\n" for it in items) + "</ul>\n"
+        if section.get("has_image_placeholder"):
+            sections_html += "<p><em>[ФОТО]</em></p>\n"
+
+    paras = lambda text: "<p>" + text.replace("\n\n", "</p><p>") + "</p>" if text else ""
+    return f"""<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8">
+<title>{record["title"]}</title>
+<style>body{{max-width:860px;margin:40px auto;font-family:Georgia,serif;line-height:1.7;padding:0 20px}}
+h1{{font-size:2em;margin-bottom:.3em}}h2{{margin-top:1.8em;color:#1e40af}}
+p{{margin:.8em 0}}ul{{margin:.5em 0 1em 1.5em}}.meta{{color:#888;font-size:.9em;margin-bottom:2em}}</style>
+</head><body>
+<h1>{record["title"]}</h1>
+<p class="meta">{record.get("meta_description", "")}</p>
+{paras(record.get("intro", ""))}
+{sections_html}
+<h2>Заключение</h2>
+{paras(record.get("conclusion", ""))}
+</body></html>"""
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=path.suffix)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _record_path(filename: str, articles_dir: Path) -> Path:
+    return articles_dir / (Path(filename).stem + ".json")
+
+
+def save(
+    article: GeneratedArticle,
+    photos: list[str] = (),
+    articles_dir: str | Path = ARTICLES_DIR,
+) -> Path:
+    """Сохраняет запись статьи и её HTML; возвращает путь к HTML (имя файла — id статьи)."""
+    articles_dir = Path(articles_dir)
+    articles_dir.mkdir(exist_ok=True)
+    safe = "".join(c if c.isalnum() or c in " _-" else "_" for c in article.title)[:60]
+    filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{safe}.html"
+
+    record = to_record(article, photos)
+    _write_atomic(_record_path(filename, articles_dir), json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+    html_file = articles_dir / filename
+    _write_atomic(html_file, render_html(record))
+    _record_catalog(html_file, record)
+    return html_file
+
+
+def load(filename: str, articles_dir: str | Path = ARTICLES_DIR) -> Optional[dict]:
+    """
+    Запись статьи по имени её HTML-файла. Статьи старого формата (только HTML)
+    переводятся в запись при первом обращении.
+    """
+    articles_dir = Path(articles_dir)
+    path = _record_path(filename, articles_dir)
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        pass
+    html_file = articles_dir / filename
+    if not html_file.exists():
+        return None
+    record = _migrate_legacy(html_file)
+    _write_atomic(path, json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+    logger.info(f"Article migrated to structured record: {path.name}")
+    return record
+
+
+def html_path(filename: str, articles_dir: str | Path = ARTICLES_DIR) -> Optional[Path]:
+    """HTML статьи; если его нет или он старше записи — перерисовывается из записи."""
+    articles_dir = Path(articles_dir)
+    html_file = articles_dir / filename
+    record_file = _record_path(filename, articles_dir)
+    if record_file.exists() and (
+        not html_file.exists() or html_file.stat().st_mtime_ns < record_file.stat().st_mtime_ns
+    ):
+        _write_atomic(html_file, render_html(json.loads(record_file.read_text(encoding="utf-8"))))
+    return html_file if html_file.exists() else None
+
+
+def _migrate_legacy(html_file: Path) -> dict:
+    """
+    Восстанавливает запись из HTML старого формата: из JSON-комментария
+    (веб-интерфейс) или из разметки h1/h2/p/ul (CLI сохранял только HTML).
+    """
+    html = html_file.read_text(encoding="utf-8")
+    created = datetime.fromtimestamp(html_file.stat().st_mtime).isoformat(timespec="seconds")
+    json_m = re.search(r"<!--JSON:(.*?)-->", html, re.S)
+    if json_m:
+        record = json.loads(json_m.group(1))
+        record.setdefault("photos", [])
+        record.setdefault("created", created)
+        return record
+
+    body = re.sub(r"<head>.*?</head>", "", html, flags=re.S)
+    title_m = re.search(r"<h1[^>]*>(.*?)</h1>", body, re.S)
+    meta_m = re.search(r'<p class="meta">(.*?)</p>', body, re.S)
+    record = {
+        "title": unescape(title_m.group(1).strip()) if title_m else html_file.stem,
+        "intro": "",
+        "sections": [],
+        "conclusion": "",
+        "meta_description": meta_m.group(1).strip() if meta_m else "",
+        "keywords": [],
+        "photos": [],
+        "created": created,
+    }
+    if meta_m:
+        body = body[meta_m.end():]
+    elif title_m:
+        body = body[title_m.end():]
+
+    # Куски между заголовками h2: первый — вступление, «Заключение» — вывод
+    parts = re.split(r"<h2[^>]*>(.*?)</h2>", body, flags=re.S)
+    para = lambda chunk: [p.strip() for p in re.findall(r"<p>(.*?)</p>", chunk, re.S) if p.strip()]
+    record["intro"] = "\n\n".join(para(parts[0])) or re.sub(
+        r"<[^>]+>", "", parts[0].replace("</p><p>", "\n\n")
+    ).strip()
+    for heading, chunk in zip(parts[1::2], parts[2::2]):
+        if heading.strip() == "Заключение":
+            record["conclusion"] = "\n\n".join(para(chunk))
+            continue
+        paragraphs = [p for p in para(chunk) if p != "<em>[ФОТО]</em>"]
+        record["sections"].append({
+            "heading": heading.strip(),
+            "paragraphs": paragraphs,
+            "list_items": [li.strip() for li in re.findall(r"<li>(.*?)</li>", chunk, re.S)],
+            "has_image_placeholder": "<em>[ФОТО]</em>" in chunk,
+        })
+    return record
+
+
+# ─── Каталог ─────────────────────────────────────────────────────────────────
+
+def _upsert(filename: str, dir_key: str, st: os.stat_result, record: dict) -> dict:
+    meta = {
+        "title": record["title"],
+        "words": count_words(to_article(record)),
+        "keywords": record.get("keywords", []),
+        "created": record.get("created") or datetime.fromtimestamp(st.st_mtime).isoformat(timespec="seconds"),
+    }
+    _db().execute(
+        "INSERT OR REPLACE INTO article_catalog (dir, filename, size, mtime_ns, title, words, keywords, created) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            dir_key, filename, st.st_size, st.st_mtime_ns, meta["title"], meta["words"],
+            json.dumps(meta["keywords"], ensure_ascii=False), meta["created"],
+        ),
+    )
+    return meta
+
+
+def _record_catalog(html_file: Path, record: dict) -> None:
+    """Заносит в каталог только что записанную статью — без повторного чтения файлов."""
+    st = _record_path(html_file.name, html_file.parent).stat()
+    _upsert(html_file.name, str(html_file.parent.resolve()), st, record)
+
+
+def catalog(articles_dir: str | Path = ARTICLES_DIR) -> list[dict]:
+    """
+    Метаданные всех статей в папке, новые первыми. С диска читается только
+    список файлов (scandir); записи читаются лишь у новых и изменённых статей.
+    """
+    articles_dir = Path(articles_dir)
+    if not articles_dir.exists():
+        return []
+    dir_key = str(articles_dir.resolve())
+    conn = _db()
+    rows = {
+        r["filename"]: r
+        for r in conn.execute("SELECT * FROM article_catalog WHERE dir = ?", (dir_key,))
+    }
+
+    # Статья — это запись .json; HTML без записи — статья старого формата
+    found: dict[str, os.DirEntry] = {}
+    with os.scandir(articles_dir) as it:
+        for entry in it:
+            stem, ext = os.path.splitext(entry.name)
+            if ext in (".json", ".html") and entry.is_file():
+                if ext == ".json" or stem + ".html" not in found:
+                    found[stem + ".html"] = entry
+
+    items = []
+    for filename, entry in found.items():
+        st = entry.stat()
+        row = rows.get(filename)
+        if (
+            row is None
+            or row["size"] != st.st_size
+            or row["mtime_ns"] != st.st_mtime_ns
+            or row["created"] is None   # строка каталога из версии без записей
+        ):
+            try:
+                record = load(filename, articles_dir)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Cannot read article {filename}: {e}")
+                continue
+            st = _record_path(filename, articles_dir).stat()
+            meta = _upsert(filename, dir_key, st, record)
+        else:
+            meta = {
+                "title": row["title"],
+                "words": row["words"],
+                "keywords": json.loads(row["keywords"]),
+                "created": row["created"],
+            }
+        items.append({
+            "filename": filename,
+            "title": meta["title"],
+            "date": datetime.fromisoformat(meta["created"]).strftime("%d.%m.%Y %H:%M"),
+            "words": meta["words"],
+            "keywords": meta["keywords"],
+            "created": meta["created"],
+        })
+
+    removed = [(dir_key, name) for name in rows if name not in found]
+    if removed:
+        conn.executemany("DELETE FROM article_catalog WHERE dir = ? AND filename = ?", removed)
+
+    items.sort(key=lambda a: a["created"], reverse=True)
+    return items
@@ -0,0 +1,95 @@
+"""
+Бенчмарк публикации на локальной заглушке Osnova API (fake_osnova.py) — без токена VC.RU.
+Публикует N статей с фото и печатает время, число запросов, 429 и итоговую скорость limiter'а.
+
+  python bench_publish.py --articles 10 --photos 3 --concurrency 4 --latency 0.2 --max-rps 5
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк VcPublisher на заглушке Osnova API")
+    parser.add_argument("--articles", type=int, default=10)
+    parser.add_argument("--photos", type=int, default=3, help="Фото на статью")
+    parser.add_argument("--photo-kb", type=int, default=2048, help="Размер одного фото, КБ")
+    parser.add_argument("--concurrency", type=int, default=4, help="Статей публикуется одновременно")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--max-rps", type=float, default=0.0)
+    parser.add_argument("--no-upload-cache", action="store_true", help="Загружать фото заново для каждой статьи")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="vc_bench_"))
+    # Отдельное состояние: бенчмарк не трогает журнал публикаций и кэши бота
+    config.STATE_DB = str(workdir / "state.db")
+    config.IMAGE_CACHE_DIR = str(workdir / "image_cache")
+    config.IMAGE_PREPROCESS = False
+
+    from fake_osnova import FakeOsnova, FakeOsnovaOptions
+    from generator import GeneratedArticle
+    from publisher import VcPublisher
+
+    photos = []
+    for i in range(args.photos):
+        path = workdir / f"photo_{i}.jpg"
+        path.write_bytes(os.urandom(args.photo_kb * 1024))
+        photos.append(path)
+
+    options = FakeOsnovaOptions(
+        latency=args.latency, jitter=args.jitter, rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx, max_rps=args.max_rps,
+    )
+    with FakeOsnova(options=options) as api:
+        pub = VcPublisher(
+            token="bench",
+            base_url=api.url,
+            upload_concurrency=config.VC_UPLOAD_CONCURRENCY,
+            use_upload_cache=not args.no_upload_cache,
+            rate_limit=config.VC_RATE_LIMIT,
+            max_rate_limit=config.VC_RATE_LIMIT_MAX,
+        )
+
+        def publish(i: int) -> float:
+            article = GeneratedArticle(
+                title=f"Benchmark article #{i}",
+                intro="Вступление.\n\nВторой абзац.",
+                sections=[
+                    {"heading": f"Раздел {n}", "paragraphs": ["Текст раздела."], "has_image_placeholder": True}
+                    for n in range(args.photos)
+                ],
+                conclusion="Заключение.",
+            )
+            started = time.perf_counter()
+            pub.publish_article(article, photos)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            latencies = sorted(pool.map(publish, range(args.articles)))
+        total = time.perf_counter() - started
+
+        print(f"\n{'─'*60}")
+        print(f"Articles: {args.articles} × {args.photos} photos ({args.photo_kb} KB), concurrency {args.concurrency}")
+        print(f"Total: {total:.2f}s  |  {args.articles / total:.2f} articles/s")
+        print(f"Per article: p50 {statistics.median(latencies):.2f}s, "
+              f"p95 {latencies[int(0.95 * (len(latencies) - 1))]:.2f}s, max {latencies[-1]:.2f}s")
+        print(f"Requests: {len(api.requests)}  (uploads {api.count('/uploader/upload')}, "
+              f"entry/create {api.count('/entry/create')}, 429 {api.count(status=429)}, "
+              f"5xx {sum(1 for r in api.requests if r.status >= 500)})")
+        print(f"Entries created: {len(api.entries)}  |  limiter rate now {pub.rate:.2f} req/s")
+        print(f"{'─'*60}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Бенчмарк памяти при загрузке фото: files= из requests против потокового
+StreamingMultipart (им пользуется VcPublisher.upload_image).
+Заглушка API (fake_osnova.py) запускается отдельным процессом, чтобы её память не попадала в замер.
+
+  python bench_upload_memory.py --sizes 1 10 50
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import requests
+
+import config
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _peak(fn) -> int:
+    """Пиковый прирост памяти Python-аллокаций во время fn(), в байтах."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память на одну загрузку фото")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50], help="Размеры файлов, МБ")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="vc_membench_"))
+    config.STATE_DB = str(workdir / "state.db")
+    config.IMAGE_PREPROCESS = False
+
+    from publisher import VcPublisher
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, str(Path(__file__).parent / "fake_osnova.py"), "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}/v1.9"
+    try:
+        for _ in range(50):
+            try:
+                requests.get(f"{base_url}/auth/me", timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+
+        pub = VcPublisher(token="bench", base_url=base_url, use_upload_cache=False, rate_limit=100)
+        session = requests.Session()
+        session.trust_env = False
+
+        # Прогрев: ленивые импорты, соединения и пулы не должны попасть в первый замер
+        warmup = workdir / "warmup.jpg"
+        warmup.write_bytes(os.urandom(1024))
+        pub.upload_image(warmup)
+        with open(warmup, "rb") as f:
+            session.post(f"{base_url}/uploader/upload", files={"file": (warmup.name, f, "image/jpeg")})
+
+        print(f"\n{'─'*60}")
+        print(f"{'File':>8} | {'files= (in memory)':>20} | {'streaming':>12}")
+        for size_mb in args.sizes:
+            path = workdir / f"photo_{size_mb}mb.jpg"
+            with open(path, "wb") as f:
+                for _ in range(size_mb):
+                    f.write(os.urandom(1024 * 1024))
+
+            def upload_in_memory():
+                with open(path, "rb") as f:
+                    session.post(f"{base_url}/uploader/upload", files={"file": (path.name, f, "image/jpeg")}).raise_for_status()
+
+            def upload_streaming():
+                assert pub.upload_image(path) is not None
+
+            in_memory = _peak(upload_in_memory)
+            streaming = _peak(upload_streaming)
+            print(f"{size_mb:>6}MB | {in_memory / 2**20:>18.1f}MB | {streaming / 2**20:>10.2f}MB")
+            path.unlink()
+        print(f"{'─'*60}\n")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Бюджет токенов Claude API, общий для всех задач и процессов.
+Учёт ведётся в базе состояния (storage) скользящими окнами «минута» и «сутки»:
+запрос резервирует оценку токенов, после ответа резерв заменяется фактическим расходом.
+Если бюджета не хватает — запрос ждёт ровно до освобождения окна или отклоняется.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+import storage
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+DAY = 24 * 60 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS token_usage (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts      REAL    NOT NULL,
+    tokens  INTEGER NOT NULL,
+    pending INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS token_usage_ts ON token_usage (ts);
+"""
+
+
+class BudgetExceeded(RuntimeError):
+    """Запрос не укладывается в бюджет токенов за отведённое время ожидания."""
+
+
+class TokenBudget:
+    """
+    Ограничитель расхода токенов в минуту и в сутки.
+    Лимиты умножаются на headroom, чтобы держаться чуть ниже rate limit API,
+    а не упираться в него и получать 429.
+    """
+
+    def __init__(
+        self,
+        per_minute: int,
+        per_day: int,
+        headroom: float = 0.9,
+        max_wait: float = 600,
+    ):
+        self.per_minute = int(per_minute * headroom) if per_minute else 0
+        self.per_day = int(per_day * headroom) if per_day else 0
+        self.max_wait = max_wait
+
+    # ─── Резервирование ──────────────────────────────────────────────────────
+
+    def _wait_needed(self, conn, now: float, estimate: int) -> float:
+        """Через сколько секунд резерв `estimate` уложится в оба окна (0 — сразу)."""
+        wait = 0.0
+        for window, limit in ((MINUTE, self.per_minute), (DAY, self.per_day)):
+            if not limit:
+                continue
+            if estimate > limit:
+                raise BudgetExceeded(f"Request needs ~{estimate} tokens, limit is {limit} per {window}s")
+            rows = conn.execute(
+                "SELECT ts, tokens FROM token_usage WHERE ts > ? ORDER BY ts",
+                (now - window,),
+            ).fetchall()
+            excess = sum(r["tokens"] for r in rows) + estimate - limit
+            # Ждём, пока из окна выйдет ровно столько старых записей, сколько нужно
+            for r in rows:
+                if excess <= 0:
+                    break
+                excess -= r["tokens"]
+                wait = max(wait, r["ts"] + window - now)
+        return wait
+
+    def reserve(self, estimate: int) -> int:
+        """Резервирует токены (блокируется до max_wait секунд). Возвращает id резерва."""
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with storage.transaction(_SCHEMA) as conn:
+                now = time.time()
+                wait = self._wait_needed(conn, now, estimate)
+                if wait <= 0:
+                    conn.execute("DELETE FROM token_usage WHERE ts <= ?", (now - DAY,))
+                    cur = conn.execute(
+                        "INSERT INTO token_usage (ts, tokens, pending) VALUES (?, ?, 1)",
+                        (now, estimate),
+                    )
+                    return cur.lastrowid
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                raise BudgetExceeded(
+                    f"Token budget exhausted: ~{estimate} tokens would fit in {wait:.0f}s "
+                    f"(max wait {self.max_wait:.0f}s)"
+                )
+            logger.info(f"Token budget: waiting {wait:.1f}s for ~{estimate} tokens")
+            # Небольшой запас, чтобы к пробуждению запись точно вышла из окна
+            time.sleep(wait + 0.05)
+
+    def settle(self, reservation_id: int, tokens: int) -> None:
+        """Заменяет оценку фактическим расходом."""
+        with storage.transaction(_SCHEMA) as conn:
+            conn.execute(
+                "UPDATE token_usage SET tokens = ?, pending = 0 WHERE id = ?",
+                (tokens, reservation_id),
+            )
+
+    def release(self, reservation_id: int) -> None:
+        """Отменяет резерв (запрос не состоялся)."""
+        with storage.transaction(_SCHEMA) as conn:
+            conn.execute("DELETE FROM token_usage WHERE id = ?", (reservation_id,))
+
+    @contextmanager
+    def reservation(self, estimate: int):
+        """
+        with budget.reservation(n) as settle: ...; settle(actual)
+        Если settle не вызван (ошибка запроса) — резерв снимается.
+        """
+        rid = self.reserve(estimate)
+        settled = False
+
+        def settle(tokens: int) -> None:
+            nonlocal settled
+            self.settle(rid, tokens)
+            settled = True
+
+        try:
+            yield settle
+        finally:
+            if not settled:
+                self.release(rid)
+
+    # ─── Статистика ──────────────────────────────────────────────────────────
+
+    def usage(self) -> dict:
+        conn = storage.connect(_SCHEMA)
+        now = time.time()
+        used = {
+            name: storage.scalar(conn, "SELECT COALESCE(SUM(tokens), 0) FROM token_usage WHERE ts > ?", (now - window,))
+            for name, window in (("minute", MINUTE), ("day", DAY))
+        }
+        return {
+            "tokens_last_minute": used["minute"],
+            "tokens_last_day": used["day"],
+            "limit_per_minute": self.per_minute,
+            "limit_per_day": self.per_day,
+        }
+
+
+_governor: TokenBudget | None = None
+_governor_lock = threading.Lock()
+
+
+def governor() -> TokenBudget:
+    """Бюджет процесса, настроенный по config.py."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = TokenBudget(
+                per_minute=config.CLAUDE_TOKENS_PER_MINUTE,
+                per_day=config.CLAUDE_TOKENS_PER_DAY,
+                headroom=config.CLAUDE_BUDGET_HEADROOM,
+                max_wait=config.CLAUDE_BUDGET_MAX_WAIT,
+            )
+        return _governor
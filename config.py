@@ -15,10 +15,30 @@ ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY", "")
 VC_TOKEN = os.environ.get("VC_TOKEN", "")
 VC_BASE_URL = "https://api.vc.ru/v1.9"
 VC_SUBSITE_ID = None   # None = личный блог. Для компании — ID субсайта (число)
+# Несколько блогов сразу (python main.py --all-targets): у каждой цели свой токен и субсайт
+VC_TARGETS: list[dict] = [
+    # {"name": "osari", "token": os.environ.get("VC_TOKEN_OSARI", ""), "subsite_id": 12345},
+    # {"name": "personal", "token": os.environ.get("VC_TOKEN", ""), "subsite_id": None},
+]
+VC_UPLOAD_CONCURRENCY = 4                # Сколько фото загружать на VC.RU одновременно
+VC_RATE_LIMIT = 2.0                      # Начальная скорость запросов к API, в секунду
+VC_RATE_LIMIT_MAX = 10.0                 # Выше этого скорость не поднимается
+VC_TOKEN_CHECK_TTL = 300                 # Сек. кэширования успешной проверки токена в веб-интерфейсе
+UPLOAD_CACHE_TTL_DAYS = 30               # Сколько дней доверять кэшу уже загруженных фото
 
 # ─── Фото ────────────────────────────────────────────────────────────────────
 PHOTOS_DIR = "./photos"                   # Папка с вашими фото (jpg/png/webp)
 PHOTOS_PER_ARTICLE = 3                   # Сколько фото вставлять в статью
+PHOTO_INDEX_RESCAN = 600                 # Сек. между полными сверками папки с индексом фото
+PHOTO_DUP_DISTANCE = 10                  # Фото с расстоянием dHash не больше этого — почти одинаковые
+PHOTO_USAGE_PENALTY = 1.0                # На столько совпадений тегов «дешевле» фото за каждое использование
+PIPELINE_UPLOADS = True                  # Загружать фото на VC.RU параллельно с генерацией статьи
+IMAGE_PREPROCESS = True                  # Уменьшать и пережимать фото перед загрузкой (нужен Pillow)
+IMAGE_MAX_WIDTH = 1200                   # Максимальная ширина загружаемого фото, px
+IMAGE_FORMAT = "jpeg"                    # "jpeg" или "webp"
+IMAGE_QUALITY = 82                       # Качество сжатия (1–95)
+IMAGE_CACHE_DIR = ".image_cache"         # Кэш обработанных копий
+PHOTO_THUMB_WIDTH = 320                  # Ширина превью фото в веб-интерфейсе, px
 
 # ─── Парсинг конкурентов / трендов ───────────────────────────────────────────
 # URL сайтов конкурентов для парсинга свежих статей
@@ -43,3 +63,30 @@ ARTICLE_LANGUAGE = "Russian"
 ARTICLE_TONE = "экспертный, информативный, с практическими советами"
 ARTICLE_LINKS_COUNT = 2                  # Сколько ссылок на сайт вставить
 PUBLISH_AS_DRAFT = True                  # True = сохранять как черновик, False = сразу публиковать
+
+# ─── Повторы и нагрузка на Claude API ────────────────────────────────────────
+CLAUDE_MAX_RETRIES = 5                   # Повторов при 429/529/5xx и сетевых ошибках
+CLAUDE_RETRY_BASE_DELAY = 2.0            # Базовая задержка (сек), растёт экспоненциально
+CLAUDE_RETRY_MAX_DELAY = 60.0            # Потолок задержки между попытками (сек)
+CLAUDE_MAX_CONCURRENCY = 2               # Одновременных запросов к Claude в одном процессе
+
+# ─── Бюджет токенов Claude (общий для всех процессов) ───────────────────────
+CLAUDE_TOKENS_PER_MINUTE = 80_000        # 0 = без ограничения
+CLAUDE_TOKENS_PER_DAY = 2_000_000        # 0 = без ограничения
+CLAUDE_BUDGET_HEADROOM = 0.9             # Держимся на этой доле лимитов, чтобы не ловить 429
+CLAUDE_BUDGET_MAX_WAIT = 600             # Сек. ожидания в очереди, после — отказ
+
+# ─── Локальное состояние ─────────────────────────────────────────────────────
+STATE_DB = "bot_state.db"                # SQLite (WAL), общий для cron и веб-интерфейса
+
+# ─── Очередь публикации (outbox) ─────────────────────────────────────────────
+PUBLISH_VIA_OUTBOX = True                # Публиковать через очередь: генерация не ждёт VC.RU
+OUTBOX_MAX_ATTEMPTS = 8                  # После стольких неудачных попыток задача — failed
+OUTBOX_MIN_INTERVAL = 5                  # Сек. между публикациями
+OUTBOX_POLL_INTERVAL = 2                 # Как часто воркер проверяет очередь (сек)
+
+# ─── Очередь генерации в веб-интерфейсе ──────────────────────────────────────
+JOB_WORKERS = 2                          # Сколько статей генерируется одновременно (по всем процессам)
+JOB_QUEUE_MAX = 20                       # Сверх этого новые задачи отклоняются (HTTP 429)
+TASK_TTL = 24 * 3600                     # Сек. хранения завершённых задач (статус для опроса)
+TASK_CACHE_SIZE = 200                    # Сколько состояний задач держать в памяти
@@ -0,0 +1,235 @@
+"""
+Локальная заглушка Osnova API для тестов и бенчмарков публикатора без токена VC.RU.
+Реализует /uploader/upload, /entry/create, /entry/edit, /auth/me и списки записей
+в том формате, который разбирает VcPublisher. Умеет добавлять задержку,
+отвечать 429/5xx, ограничивать скорость и записывает все запросы.
+
+Запуск:
+  python fake_osnova.py --port 8081 --latency 0.2 --rate-429 0.05 --max-rps 5
+  # затем в config.py: VC_BASE_URL = "http://127.0.0.1:8081/v1.9"
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+@dataclass
+class RecordedRequest:
+    method: str
+    path: str
+    status: int
+    body_bytes: int
+    started: float
+    duration: float
+
+
+@dataclass
+class FakeOsnovaOptions:
+    latency: float = 0.0            # Базовая задержка ответа, сек
+    jitter: float = 0.0             # Случайная добавка к задержке, сек
+    rate_429: float = 0.0           # Доля запросов, получающих 429
+    rate_5xx: float = 0.0           # Доля запросов, получающих 503
+    retry_after: Optional[float] = 1.0   # Заголовок Retry-After для 429 (None — без него)
+    max_rps: float = 0.0            # Серверный лимит запросов в секунду (0 — без лимита)
+    token: str = ""                 # Если задан — требовать этот X-Device-Token
+
+
+class FakeOsnova:
+    """Заглушка API в фоновом потоке: with FakeOsnova() as api: VcPublisher(base_url=api.url)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, options: Optional[FakeOsnovaOptions] = None):
+        self.options = options or FakeOsnovaOptions()
+        self.requests: list[RecordedRequest] = []
+        self.entries: dict[int, dict] = {}
+        self._lock = threading.Lock()
+        self._next_id = 1000
+        self._bucket = (1.0, time.monotonic())   # (токены, время) серверного лимита
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1.9"
+
+    def start(self) -> "FakeOsnova":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-osnova", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOsnova":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def count(self, path_suffix: str = "", status: Optional[int] = None) -> int:
+        with self._lock:
+            return sum(
+                1 for r in self.requests
+                if r.path.endswith(path_suffix) and (status is None or r.status == status)
+            )
+
+    # ─── Логика ответов ──────────────────────────────────────────────────────
+
+    def _throttled(self) -> bool:
+        """Серверный token bucket: True — запрос сверх max_rps."""
+        rps = self.options.max_rps
+        if not rps:
+            return False
+        with self._lock:
+            tokens, updated = self._bucket
+            now = time.monotonic()
+            tokens = min(max(1.0, rps), tokens + (now - updated) * rps)
+            allowed = tokens >= 1
+            self._bucket = (tokens - 1 if allowed else tokens, now)
+            return not allowed
+
+    def _new_entry(self, form: dict, entry_id: Optional[int] = None) -> dict:
+        with self._lock:
+            if entry_id is None:
+                entry_id = self._next_id
+                self._next_id += 1
+            entry = {
+                "id": entry_id,
+                "title": form.get("title", ""),
+                "url": f"https://vc.ru/fake/{entry_id}",
+                "subsite_id": form.get("subsite_id"),
+                "is_published": form.get("is_published", "1") != "0",
+            }
+            self.entries[entry_id] = entry
+            return dict(entry)
+
+    def _route(self, method: str, path: str, body: bytes, form: dict) -> tuple[int, dict]:
+        if method == "POST" and path.endswith("/uploader/upload"):
+            uuid = hashlib.sha1(body).hexdigest()[:32]
+            return 200, {"result": {"data": {
+                "uuid": uuid, "url": f"https://leonardo.osnova.io/{uuid}/",
+                "width": 1200, "height": 800, "type": "jpg", "size": len(body),
+            }}}
+        if method == "POST" and path.endswith("/entry/create"):
+            return 200, {"result": {"entry": self._new_entry(form)}}
+        if method == "POST" and path.endswith("/entry/edit"):
+            entry_id = int(form.get("id", 0))
+            if entry_id not in self.entries:
+                return 404, {"error": {"message": "Entry not found"}}
+            return 200, {"result": {"entry": self._new_entry(form, entry_id)}}
+        if method == "GET" and path.endswith("/auth/me"):
+            return 200, {"result": {"id": 1, "name": "Fake Osnova User"}}
+        if method == "GET" and (path.endswith("/user/me/entries") or "/timeline/" in path):
+            with self._lock:
+                items = sorted(self.entries.values(), key=lambda e: -e["id"])[:50]
+            return 200, {"result": items}
+        return 404, {"error": {"message": "Not found"}}
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, fmt, *args):
+                pass
+
+            def _read_body(self) -> bytes:
+                if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().strip(), 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            return b"".join(chunks)
+                        chunks.append(self.rfile.read(size))
+                        self.rfile.readline()
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def _handle(self, method: str) -> None:
+                started = time.time()
+                body = self._read_body()
+                path = self.path.split("?", 1)[0]
+                form = {}
+                if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                    from urllib.parse import parse_qsl
+                    form = dict(parse_qsl(body.decode("utf-8")))
+
+                opts = api.options
+                delay = opts.latency + random.uniform(0, opts.jitter)
+                if delay:
+                    time.sleep(delay)
+
+                headers = {}
+                if opts.token and self.headers.get("X-Device-Token") != opts.token:
+                    status, payload = 401, {"error": {"message": "Unauthorized"}}
+                elif api._throttled() or random.random() < opts.rate_429:
+                    status, payload = 429, {"error": {"message": "Too Many Requests"}}
+                    if opts.retry_after is not None:
+                        headers["Retry-After"] = f"{opts.retry_after:g}"
+                elif random.random() < opts.rate_5xx:
+                    status, payload = 503, {"error": {"message": "Service Unavailable"}}
+                else:
+                    status, payload = api._route(method, path, body, form)
+
+                raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                # Записываем до ответа: клиент, получивший ответ, уже видит запрос в api.count()
+                with api._lock:
+                    api.requests.append(RecordedRequest(
+                        method, path, status, len(body), started, time.time() - started,
+                    ))
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(raw)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка Osnova API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, сек")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Доля ответов 503")
+    parser.add_argument("--max-rps", type=float, default=0.0, help="Лимит запросов в секунду (0 — нет)")
+    parser.add_argument("--token", default="", help="Требовать этот X-Device-Token")
+    args = parser.parse_args()
+
+    options = FakeOsnovaOptions(
+        latency=args.latency, jitter=args.jitter, rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx, max_rps=args.max_rps, token=args.token,
+    )
+    api = FakeOsnova(args.host, args.port, options)
+    print(f"Fake Osnova API: {api.url}  (Ctrl+C — остановить)")
+    try:
+        api._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api._server.server_close()
+        print(f"Requests served: {len(api.requests)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Публикация одной статьи в несколько блогов VC.RU сразу.
+Каждая цель (аккаунт/субсайт) получает свой VcPublisher — свою сессию
+и ограничитель скорости аккаунта; публикации идут параллельно.
+Фото на одной платформе загружаются один раз: остальные цели берут их из upload_cache.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import config
+import publish_log
+from generator import GeneratedArticle
+from publisher import VcPublisher
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PublishTarget:
+    name: str
+    token: str
+    subsite_id: Optional[int] = None
+    base_url: str = config.VC_BASE_URL
+
+
+def targets_from_config() -> list[PublishTarget]:
+    """Цели из config.VC_TARGETS (пропускает цели без токена)."""
+    targets = []
+    for raw in config.VC_TARGETS:
+        target = PublishTarget(
+            name=raw["name"],
+            token=raw.get("token", ""),
+            subsite_id=raw.get("subsite_id"),
+            base_url=raw.get("base_url", config.VC_BASE_URL),
+        )
+        if not target.token:
+            logger.warning(f"Target «{target.name}» has no token — skipped")
+            continue
+        targets.append(target)
+    return targets
+
+
+def _make_publisher(target: PublishTarget) -> VcPublisher:
+    return VcPublisher(
+        token=target.token,
+        base_url=target.base_url,
+        upload_concurrency=config.VC_UPLOAD_CONCURRENCY,
+        rate_limit=config.VC_RATE_LIMIT,
+        max_rate_limit=config.VC_RATE_LIMIT_MAX,
+    )
+
+
+def publish_to_targets(
+    article: GeneratedArticle,
+    image_paths: list[str | Path],
+    targets: list[PublishTarget],
+    publish: bool = False,
+    variants: Optional[dict[str, GeneratedArticle]] = None,
+) -> dict[str, dict]:
+    """
+    Публикует статью во все цели параллельно.
+    variants — {имя цели: свой вариант статьи}; остальные цели получают article.
+    Возвращает {имя цели: {"ok": True, "entry": {...}} | {"ok": False, "error": str}}.
+    """
+    if not targets:
+        return {}
+    variants = variants or {}
+    publishers = {t.name: _make_publisher(t) for t in targets}
+
+    # Фото грузим один раз на платформу: остальные цели получат их из upload_cache
+    first_by_platform: dict[str, VcPublisher] = {}
+    for t in targets:
+        first_by_platform.setdefault(t.base_url.rstrip("/"), publishers[t.name])
+    for pub in first_by_platform.values():
+        pub.upload_images(image_paths)
+
+    def publish_one(target: PublishTarget) -> dict:
+        variant = variants.get(target.name, article)
+        try:
+            entry = publishers[target.name].publish_article(
+                article=variant,
+                image_paths=image_paths,
+                subsite_id=target.subsite_id,
+                publish=publish,
+                # У разных аккаунтов может совпадать subsite_id (личный блог) — ключ включает цель
+                publish_key=publish_log.make_key(variant, target.subsite_id, publish, account=target.name),
+            )
+        except Exception as e:
+            logger.error(f"[{target.name}] publishing «{variant.title}» failed: {e}")
+            return {"ok": False, "error": str(e)}
+        if not entry:
+            return {"ok": False, "error": "empty response from VC.RU"}
+        logger.info(f"[{target.name}] «{variant.title}» → {entry.get('url', '?')}")
+        return {"ok": True, "entry": entry}
+
+    with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="vc-target") as pool:
+        results = list(pool.map(publish_one, targets))
+    return {t.name: r for t, r in zip(targets, results)}
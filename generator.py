@@ -5,13 +5,22 @@
 """
 
 import re
+import time
 import logging
 from dataclasses import dataclass, field
+from typing import Callable, Optional
 
 import anthropic
 
+import budget
+import config
+from retry import ConcurrencyGate, backoff_delay, parse_retry_after
+
 logger = logging.getLogger(__name__)
 
+# Общий для всех потоков процесса: параллельные генерации делят лимит и паузы
+_claude_gate = ConcurrencyGate(config.CLAUDE_MAX_CONCURRENCY)
+
 
 @dataclass
 class GeneratedArticle:
@@ -99,10 +108,15 @@ def generate_article(
     tone: str = "экспертный, информативный",
     image_count: int = 3,
     model: str = "claude-opus-4-6",
+    on_stage: Optional[Callable[[str], None]] = None,
 ) -> GeneratedArticle:
-    """Генерирует статью через Claude API и возвращает структурированный объект."""
+    """
+    Генерирует статью через Claude API и возвращает структурированный объект.
+    on_stage — вызывается при смене этапа: "generating", затем "parsing".
+    """
 
-    client = anthropic.Anthropic(api_key=api_key)
+    # Повторы делаем сами (см. _create_message), встроенные в SDK отключаем
+    client = anthropic.Anthropic(api_key=api_key, max_retries=0)
 
     prompt = _build_prompt(
         topic_title=topic_title,
@@ -117,8 +131,11 @@ def generate_article(
     )
 
     logger.info(f"Generating article: «{topic_title}»")
+    if on_stage:
+        on_stage("generating")
 
-    message = client.messages.create(
+    message = _create_message(
+        client,
         model=model,
         max_tokens=16000,
         system=SYSTEM_PROMPT,
@@ -128,6 +145,8 @@ def generate_article(
 
     import json
 
+    if on_stage:
+        on_stage("parsing")
     raw = message.content[0].text.strip()
     logger.debug(f"Raw Claude response (first 500 chars): {raw[:500]}")
 
@@ -175,6 +194,72 @@ def generate_article(
     return article
 
 
+def _status_code(exc: Exception) -> Optional[int]:
+    return getattr(exc, "status_code", None)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    """429, 529 (overloaded), 5xx, 408/409 и сетевые ошибки/таймауты — временные."""
+    if isinstance(exc, anthropic.APIConnectionError):   # включая APITimeoutError
+        return True
+    if isinstance(exc, anthropic.APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+
+def _server_retry_delay(exc: Exception) -> Optional[float]:
+    """Сколько секунд просит подождать сервер (retry-after-ms / retry-after)."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    retry_ms = response.headers.get("retry-after-ms")
+    if retry_ms:
+        try:
+            return max(0.0, float(retry_ms) / 1000)
+        except ValueError:
+            pass
+    return parse_retry_after(response.headers.get("retry-after"))
+
+
+def _estimate_tokens(request: dict) -> int:
+    """Грубая оценка сверху: ~2 символа кириллицы на токен + весь max_tokens на ответ."""
+    chars = len(request.get("system", ""))
+    chars += sum(len(m.get("content", "")) for m in request.get("messages", []))
+    return chars // 2 + request.get("max_tokens", 0)
+
+
+def _create_message(client: anthropic.Anthropic, **kwargs):
+    """
+    messages.create с повторами: экспоненциальная задержка с джиттером,
+    учёт retry-after и общая для процесса пауза при перегрузке API.
+    Каждая попытка проходит через общий бюджет токенов (budget.governor()).
+    """
+    max_retries = config.CLAUDE_MAX_RETRIES
+    estimate = _estimate_tokens(kwargs)
+    for attempt in range(max_retries + 1):
+        try:
+            with budget.governor().reservation(estimate) as settle:
+                with _claude_gate.slot():
+                    message = client.messages.create(**kwargs)
+                settle(message.usage.input_tokens + message.usage.output_tokens)
+                return message
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= max_retries:
+                raise
+            status = _status_code(e)
+            delay = _server_retry_delay(e)
+            if delay is None:
+                delay = backoff_delay(attempt, config.CLAUDE_RETRY_BASE_DELAY, config.CLAUDE_RETRY_MAX_DELAY)
+            if status in (429, 529):
+                # API перегружен — притормаживаем все параллельные генерации
+                _claude_gate.pause(delay)
+            logger.warning(
+                f"Claude API error ({status or type(e).__name__}), "
+                f"retry {attempt + 1}/{max_retries} in {delay:.1f}s: {e}"
+            )
+            time.sleep(delay)
+
+
 def _count_words(article: GeneratedArticle) -> int:
     parts = [article.intro, article.conclusion]
     for s in article.sections:
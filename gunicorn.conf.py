@@ -0,0 +1,51 @@
+"""
+Настройки gunicorn для продакшена: `gunicorn -c gunicorn.conf.py app:app`.
+Несколько процессов делят состояние через bot_state.db (SQLite, WAL): задачи,
+очередь генерации, журнал и очередь публикации, учёт фото.
+"""
+
+import math
+import os
+from pathlib import Path
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+
+def _cpu_limit() -> int:
+    """
+    Ядра, доступные контейнеру: квота cgroup (v2, затем v1), иначе ядра, на которых
+    разрешено работать процессу. cpu_count() в контейнере показывает все ядра хоста.
+    """
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+# Процессов немного: каждый держит свои потоки очередей, опрашивающие общий файл SQLite,
+# а долгие SSE-соединения (/api/task/<id>/events) обслуживают потоки
+workers = int(os.environ.get("WEB_CONCURRENCY", min(_cpu_limit() + 1, 4)))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 8))
+
+# Приложение импортируется в каждом процессе после fork: у каждого свои потоки
+# воркеров очередей и свои соединения с SQLite
+preload_app = False
+
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info")
@@ -0,0 +1,184 @@
+"""
+Подготовка фото к загрузке на VC.RU и превью для веб-интерфейса.
+Уменьшает до IMAGE_MAX_WIDTH, пережимает в JPEG/WebP с заданным качеством
+и удаляет EXIF. Результат кэшируется в IMAGE_CACHE_DIR по хэшу исходника
+и параметрам обработки — каждое фото обрабатывается один раз.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import config
+from photos import file_hash
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не установлен — загружаем оригиналы как есть
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+_FORMATS = {"jpeg": ".jpg", "webp": ".webp"}
+
+
+@dataclass
+class PreparedImage:
+    path: Path                  # Файл, который нужно загружать
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+def image_size(path: str | Path) -> tuple[Optional[int], Optional[int]]:
+    """Размеры изображения (читается только заголовок файла) или (None, None)."""
+    if Image is None:
+        return None, None
+    try:
+        with Image.open(path) as im:
+            return im.size
+    except Exception:
+        return None, None
+
+
+def perceptual_hash(path: str | Path) -> Optional[str]:
+    """
+    dHash 64 бит (16 hex-символов): похожие кадры дают хэши с малым расстоянием Хэмминга.
+    None — без Pillow, "" — файл не удалось прочитать.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as im:
+            im.draft("L", (64, 64))   # JPEG декодируется сразу в уменьшенном виде
+            small = im.convert("L").resize((9, 8), Image.LANCZOS)
+    except Exception:
+        return ""
+    px = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def _save_atomic(im, out: Path, **save_options) -> None:
+    """
+    Пишет изображение во временный файл рядом и атомарно переименовывает: параллельные
+    читатели не увидят недописанный файл. При ошибке временный файл удаляется.
+    """
+    fd, tmp = tempfile.mkstemp(dir=out.parent, suffix=out.suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            im.save(f, **save_options)
+        os.replace(tmp, out)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def prepare_image(path: str | Path) -> PreparedImage:
+    """
+    Возвращает уменьшенную и пережатую копию фото из кэша (создаёт при необходимости).
+    При отключённой обработке, без Pillow или при ошибке — оригинал.
+    """
+    path = Path(path)
+    fmt = config.IMAGE_FORMAT.lower()
+    # GIF может быть анимированным — не трогаем
+    if Image is None or not config.IMAGE_PREPROCESS or path.suffix.lower() == ".gif" or fmt not in _FORMATS:
+        return PreparedImage(path, *image_size(path))
+
+    cache_dir = Path(config.IMAGE_CACHE_DIR)
+    params = f"w{config.IMAGE_MAX_WIDTH}_q{config.IMAGE_QUALITY}"
+    try:
+        out = cache_dir / f"{file_hash(path)}_{params}{_FORMATS[fmt]}"
+        if out.exists():
+            return PreparedImage(out, *image_size(out))
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with Image.open(path) as src:
+            # Поворот по EXIF применяем к пикселям — сами EXIF-данные в копию не попадут
+            im = ImageOps.exif_transpose(src)
+            if im.width > config.IMAGE_MAX_WIDTH:
+                height = round(im.height * config.IMAGE_MAX_WIDTH / im.width)
+                im = im.resize((config.IMAGE_MAX_WIDTH, height), Image.LANCZOS)
+            if im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            # Параллельные загрузки одного фото не увидят недописанный файл
+            _save_atomic(im, out, format=fmt.upper(), quality=config.IMAGE_QUALITY, optimize=True)
+            size = im.size
+
+        logger.info(
+            f"Image prepared: {path.name} {path.stat().st_size // 1024} KB → "
+            f"{out.stat().st_size // 1024} KB, {size[0]}×{size[1]}"
+        )
+        return PreparedImage(out, *size)
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed for {path.name}, uploading original: {e}")
+        return PreparedImage(path, *image_size(path))
+
+
+# ─── Превью ──────────────────────────────────────────────────────────────────
+
+_thumb_pool: Optional[ThreadPoolExecutor] = None
+_thumb_jobs: dict[Path, Future] = {}
+_thumb_lock = threading.Lock()
+
+
+def thumbnail_path(sha256: str) -> Path:
+    """Файл превью в кэше: имя зависит только от хэша исходника и ширины превью."""
+    return Path(config.IMAGE_CACHE_DIR) / "thumbs" / f"{sha256}_t{config.PHOTO_THUMB_WIDTH}.jpg"
+
+
+def make_thumbnail(path: str | Path, sha256: str) -> Optional[Path]:
+    """Создаёт превью фото (если его ещё нет). None — без Pillow или при ошибке."""
+    out = thumbnail_path(sha256)
+    if out.exists():
+        return out
+    if Image is None:
+        return None
+    try:
+        out.parent.mkdir(parents=True, exist_ok=True)
+        with Image.open(path) as src:
+            src.draft("RGB", (config.PHOTO_THUMB_WIDTH * 2, config.PHOTO_THUMB_WIDTH * 2))
+            im = ImageOps.exif_transpose(src)
+            im.thumbnail((config.PHOTO_THUMB_WIDTH, config.PHOTO_THUMB_WIDTH * 2), Image.LANCZOS)
+            if im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            _save_atomic(im, out, format="JPEG", quality=75, optimize=True)
+        return out
+    except Exception as e:
+        logger.warning(f"Thumbnail failed for {Path(path).name}: {e}")
+        return None
+
+
+def request_thumbnail(path: str | Path, sha256: str) -> Future:
+    """
+    Ставит создание превью в фоновый пул и возвращает Future с путём к нему.
+    Одновременные запросы одного превью получают один и тот же Future.
+    """
+    global _thumb_pool
+    out = thumbnail_path(sha256)
+    with _thumb_lock:
+        job = _thumb_jobs.get(out)
+        if job is not None:
+            return job
+        if out.exists():
+            job = Future()
+            job.set_result(out)
+            return job
+        if _thumb_pool is None:
+            _thumb_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbs")
+        job = _thumb_jobs[out] = _thumb_pool.submit(make_thumbnail, path, sha256)
+    job.add_done_callback(lambda _: _forget_job(out))
+    return job
+
+
+def _forget_job(out: Path) -> None:
+    with _thumb_lock:
+        _thumb_jobs.pop(out, None)
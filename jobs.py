@@ -0,0 +1,293 @@
+"""
+Очередь задач генерации для веб-интерфейса.
+Ограниченная очередь с приоритетами и фиксированным пулом воркеров: всплеск
+запросов не запускает десятки генераций сразу, а переполнение очереди сразу
+видно клиенту. Задачу можно отменить — в очереди или на ближайшей смене этапа.
+
+Очередь лежит в базе состояния: при нескольких процессах веб-сервера (gunicorn)
+лимит общий, задачу забирает ровно один воркер любого процесса, а отмена и
+позиция в очереди работают независимо от того, какой процесс принял запрос.
+Выполняющаяся задача арендована процессом (lease_until) и продлевается, пока
+он жив; задача с истёкшей арендой считается неудавшейся.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import config
+import storage
+
+logger = logging.getLogger(__name__)
+
+_POLL_INTERVAL = 1.0    # Как часто простаивающий воркер проверяет очередь (задачи других процессов)
+_PURGE_INTERVAL = 60
+LEASE_SECONDS = 60      # Аренда выполняющейся задачи; продлевается каждые LEASE_SECONDS / 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id               TEXT    PRIMARY KEY,
+    queue            TEXT    NOT NULL,
+    payload          TEXT    NOT NULL,
+    priority         INTEGER NOT NULL,
+    state            TEXT    NOT NULL,      -- queued | running | done | cancelled | failed
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    instance         TEXT,                  -- запуск процесса, выполняющего задачу (storage.instance_id)
+    lease_until      REAL,
+    created_at       REAL    NOT NULL,
+    started_at       REAL,
+    finished_at      REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (queue, state, priority, created_at);
+"""
+
+
+def _db():
+    return storage.connect(_SCHEMA)
+
+
+class QueueFull(Exception):
+    """В очереди нет места."""
+
+    def __init__(self, queued: int, max_queued: int):
+        super().__init__(f"Job queue is full ({queued}/{max_queued})")
+        self.queued = queued
+        self.max_queued = max_queued
+
+
+class JobCancelled(Exception):
+    """Задачу отменили во время выполнения."""
+
+
+@dataclass
+class Job:
+    id: str
+    payload: dict
+    priority: int = 0
+
+    def check_cancelled(self) -> None:
+        """Вызывается задачей между этапами: бросает JobCancelled, если её отменили."""
+        if storage.scalar(_db(), "SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,)):
+            raise JobCancelled(self.id)
+
+
+class JobQueue:
+    """
+    Очередь с приоритетами (больше — раньше, при равенстве — по порядку).
+    Оба лимита общие для всех процессов: одновременно выполняется не больше
+    `workers` задач, ожидающих больше `max_queued` submit не принимает. Потоков
+    в каждом процессе тоже `workers` — так все слоты может занять любой процесс. handler(job) выполняет задачу
+    по её payload — поэтому задачу может взять любой процесс.
+    """
+
+    def __init__(self, workers: int, max_queued: int, handler: Callable[[Job], None], name: str = "jobs"):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._handler = handler
+        self._name = name
+        self._wakeup = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._running_ids: set[str] = set()
+        self._heartbeat: Optional[threading.Thread] = None
+        self._busy_seconds = 0.0
+        self._started_at = time.monotonic()
+        self._purged_at = 0.0
+
+    def submit(self, job_id: str, payload: dict, priority: int = 0) -> int:
+        """Ставит задачу в очередь и возвращает её позицию (1 — следующая). QueueFull — мест нет."""
+        with storage.transaction(_SCHEMA) as tx:
+            queued = self._count(tx, "queued")
+            if queued >= self.max_queued:
+                raise QueueFull(queued, self.max_queued)
+            tx.execute(
+                "INSERT INTO jobs (id, queue, payload, priority, state, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, self._name, json.dumps(payload, ensure_ascii=False), priority, time.time()),
+            )
+        self._ensure_workers()
+        with self._wakeup:
+            self._wakeup.notify()
+        return self.position(job_id) or 1
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Отменяет задачу. Ожидающая снимается с очереди сразу, выполняющаяся —
+        на ближайшей проверке check_cancelled. False — задачи нет или она уже завершена.
+        """
+        with storage.transaction(_SCHEMA) as tx:
+            row = tx.execute("SELECT state FROM jobs WHERE id = ? AND queue = ?", (job_id, self._name)).fetchone()
+            if row is None or row["state"] not in ("queued", "running"):
+                return False
+            if row["state"] == "queued":
+                tx.execute(
+                    "UPDATE jobs SET state = 'cancelled', cancel_requested = 1, finished_at = ? WHERE id = ?",
+                    (time.time(), job_id),
+                )
+            else:
+                tx.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return True
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Место ожидающей задачи в очереди (1 — следующая) или None."""
+        conn = _db()
+        row = conn.execute(
+            "SELECT priority, created_at FROM jobs WHERE id = ? AND state = 'queued'", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        ahead = storage.scalar(
+            conn,
+            "SELECT COUNT(*) FROM jobs WHERE queue = ? AND state = 'queued' "
+            "AND (priority > ? OR (priority = ? AND created_at < ?))",
+            (self._name, row["priority"], row["priority"], row["created_at"]),
+        )
+        return ahead + 1
+
+    def stats(self) -> dict:
+        """Очередь и занятость: queued/running/utilisation — по всем процессам, running_here и busy_ratio — этого процесса."""
+        conn = _db()
+        counts = dict(conn.execute(
+            "SELECT state, COUNT(*) FROM jobs WHERE queue = ? GROUP BY state", (self._name,)
+        ).fetchall())
+        uptime = time.monotonic() - self._started_at
+        return {
+            "queued": counts.get("queued", 0),
+            "max_queued": self.max_queued,
+            "running": counts.get("running", 0),
+            "workers": self.workers,
+            "running_here": len(self._running_ids),
+            "utilisation": round(counts.get("running", 0) / self.workers, 2),
+            "busy_ratio": round(self._busy_seconds / (self.workers * uptime), 3) if uptime else 0.0,
+            "completed": counts.get("done", 0),
+            "cancelled": counts.get("cancelled", 0),
+            "failed": counts.get("failed", 0),
+            "pid": os.getpid(),
+        }
+
+    def start(self) -> None:
+        """Запускает воркеры (и подхватывает задачи, принятые другими процессами)."""
+        self._ensure_workers()
+
+    # ─── Внутреннее ──────────────────────────────────────────────────────────
+
+    def _count(self, conn, state: str) -> int:
+        return storage.scalar(conn, "SELECT COUNT(*) FROM jobs WHERE queue = ? AND state = ?", (self._name, state))
+
+    def _ensure_workers(self) -> None:
+        with self._wakeup:
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._work, name=f"{self._name}-{len(self._threads)}", daemon=True)
+                self._threads.append(t)
+                t.start()
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._renew_leases, name=f"{self._name}-leases", daemon=True)
+                self._heartbeat.start()
+
+    def _claim(self) -> Optional[Job]:
+        """Забирает следующую задачу атомарно относительно всех процессов."""
+        # Простаивающие воркеры всех процессов опрашивают очередь каждую секунду — без
+        # готовых задач обходимся чтением и не берём блокировку записи (BEGIN IMMEDIATE)
+        ready = _db().execute(
+            "SELECT 1 FROM jobs WHERE queue = ? AND (state = 'queued' OR (state = 'running' AND lease_until < ?)) LIMIT 1",
+            (self._name, time.time()),
+        ).fetchone()
+        if ready is None:
+            return None
+        with storage.transaction(_SCHEMA) as tx:
+            now = time.time()
+            self._reap_expired(tx, now)
+            # Слот проверяется в той же транзакции, что и захват, — лимит не превысить и гонкой процессов
+            if self._count(tx, "running") >= self.workers:
+                return None
+            row = tx.execute(
+                "SELECT id, payload, priority FROM jobs WHERE queue = ? AND state = 'queued' "
+                "ORDER BY priority DESC, created_at LIMIT 1",
+                (self._name,),
+            ).fetchone()
+            if row is None:
+                return None
+            tx.execute(
+                "UPDATE jobs SET state = 'running', instance = ?, lease_until = ?, started_at = ? WHERE id = ?",
+                (storage.instance_id(), now + LEASE_SECONDS, now, row["id"]),
+            )
+            # Аренду продлевает _renew_leases — отмечаем задачу до выхода из транзакции
+            with self._wakeup:
+                self._running_ids.add(row["id"])
+        return Job(row["id"], json.loads(row["payload"]), row["priority"])
+
+    def _finish(self, job: Job, state: str) -> None:
+        _db().execute(
+            "UPDATE jobs SET state = ?, lease_until = NULL, finished_at = ? WHERE id = ?",
+            (state, time.time(), job.id),
+        )
+
+    def _work(self) -> None:
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                logger.error(f"Job queue {self._name}: claim failed: {e}")
+                job = None
+            if job is None:
+                self._purge()
+                with self._wakeup:
+                    self._wakeup.wait(_POLL_INTERVAL)
+                continue
+
+            started = time.monotonic()
+            state = "done"
+            try:
+                self._handler(job)
+            except JobCancelled:
+                state = "cancelled"
+                logger.info(f"Job {job.id} cancelled while running")
+            except Exception as e:
+                state = "failed"
+                logger.error(f"Job {job.id} failed: {e}")
+            finally:
+                self._finish(job, state)
+                with self._wakeup:
+                    self._running_ids.discard(job.id)
+                    self._busy_seconds += time.monotonic() - started
+
+    def _renew_leases(self) -> None:
+        """Продлевает аренду задач, выполняющихся в этом процессе."""
+        while True:
+            time.sleep(LEASE_SECONDS / 4)
+            with self._wakeup:
+                running = list(self._running_ids)
+            if not running:
+                continue
+            try:
+                _db().executemany(
+                    "UPDATE jobs SET lease_until = ? WHERE id = ? AND instance = ? AND state = 'running'",
+                    [(time.time() + LEASE_SECONDS, job_id, storage.instance_id()) for job_id in running],
+                )
+            except Exception as e:
+                logger.error(f"Job queue {self._name}: cannot renew leases: {e}")
+
+    def _reap_expired(self, tx, now: float) -> None:
+        """Задачи, аренду которых никто не продлил (процесс умер), считаем неудавшимися."""
+        rows = tx.execute(
+            "SELECT id FROM jobs WHERE queue = ? AND state = 'running' AND lease_until < ?",
+            (self._name, now),
+        ).fetchall()
+        for row in rows:
+            tx.execute(
+                "UPDATE jobs SET state = 'failed', lease_until = NULL, finished_at = ? WHERE id = ?",
+                (now, row["id"]),
+            )
+            logger.warning(f"Job {row['id']} lease expired — its process is gone")
+
+    def _purge(self) -> None:
+        now = time.time()
+        if now - self._purged_at < _PURGE_INTERVAL:
+            return
+        self._purged_at = now
+        _db().execute(
+            "DELETE FROM jobs WHERE queue = ? AND state IN ('done', 'cancelled', 'failed') AND finished_at < ?",
+            (self._name, now - config.TASK_TTL),
+        )
@@ -16,6 +16,12 @@
 
   # Сбросить историю использования фото:
   python main.py --reset-photos
+
+  # Допубликовать статьи, оставшиеся в очереди публикации:
+  python main.py --drain-outbox
+
+  # Опубликовать в каждый блог из config.VC_TARGETS:
+  python main.py --all-targets
 """
 
 import argparse
@@ -29,10 +35,14 @@ from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
 
+import articles
 import config
+import outbox
+import publish_log
+from fanout import PublishTarget, publish_to_targets, targets_from_config
 from generator import generate_article
 from parser import collect_topics, Topic
-from photos import pick_photos, reset_usage
+from photos import pick_photos, release_photos, reset_usage
 from publisher import VcPublisher
 
 # ─── Логирование ─────────────────────────────────────────────────────────────
@@ -68,15 +78,36 @@ def save_processed(processed: set[str]) -> None:
 
 # ─── Основная логика ─────────────────────────────────────────────────────────
 
+def _pick_photos(keywords: list[str], headings: list[str]) -> list[Path]:
+    photos = pick_photos(
+        config.PHOTOS_DIR, count=config.PHOTOS_PER_ARTICLE, keywords=keywords, headings=headings,
+    )
+    if not photos:
+        logger.warning("No photos available — article will be published without images")
+    return photos
+
+
 def process_topic(
     topic: Topic,
     publisher: VcPublisher,
     publish: bool,
+    targets: list[PublishTarget] | None = None,
 ) -> bool:
-    """Генерирует статью по теме и публикует/сохраняет черновик. Возвращает True при успехе."""
+    """
+    Генерирует статью по теме и публикует/сохраняет черновик. Возвращает True при успехе.
+    targets — публиковать параллельно во все эти блоги вместо основного.
+    """
     logger.info(f"▶ Topic: «{topic.title}»")
 
-    # 1. Генерируем статью
+    # 1. Если фото грузятся параллельно с генерацией — выбираем их сразу по теме
+    #    и, пока Claude пишет статью, загружаем на VC.RU
+    photos, prefetch = None, None
+    if config.PIPELINE_UPLOADS and not targets:
+        photos = _pick_photos(keywords=[topic.title], headings=[topic.description])
+        if photos:
+            prefetch = publisher.prefetch_uploads(photos)
+
+    # 2. Генерируем статью
     try:
         article = generate_article(
             topic_title=topic.title,
@@ -92,22 +123,56 @@ def process_topic(
         )
     except Exception as e:
         logger.error(f"Generation failed for «{topic.title}»: {e}")
+        _discard_photos(photos, prefetch)
         return False
 
-    # 2. Выбираем фото
-    photos = pick_photos(config.PHOTOS_DIR, count=config.PHOTOS_PER_ARTICLE)
-    if not photos:
-        logger.warning("No photos available — article will be published without images")
+    # Без конвейера фото подбираем уже по ключевым словам и заголовкам статьи
+    if photos is None:
+        photos = _pick_photos(
+            keywords=article.keywords,
+            headings=[article.title] + [s.get("heading", "") for s in article.sections],
+        )
 
     # 3. Сохраняем статью локально (всегда, независимо от публикации)
-    _save_article_locally(article)
+    filepath = _save_article_locally(article, photos)
+    # Ключ по имени файла, как в веб-интерфейсе: там статья покажется опубликованной,
+    # а кнопка «Опубликовать» отредактирует эту же запись
+    key = publish_log.article_key(filepath.name, config.VC_SUBSITE_ID)
+
+    # 4. Публикуем: во все блоги, через очередь (outbox) или сразу
+    if targets:
+        results = publish_to_targets(article, photos, targets, publish=publish)
+        ok_count = sum(1 for r in results.values() if r["ok"])
+        for name, r in results.items():
+            if r["ok"]:
+                logger.info(f"✓ [{name}] «{article.title}» → {r['entry'].get('url', '?')}")
+            else:
+                logger.error(f"✗ [{name}] «{article.title}»: {r['error']}")
+        logger.info(f"Published to {ok_count}/{len(results)} targets")
+        return ok_count > 0
+
+    # Фоновые загрузки обычно уже закончились за время генерации
+    uploaded = prefetch.result() if prefetch else None
+
+    if config.PUBLISH_VIA_OUTBOX:
+        # Воркер очереди возьмёт загруженные фото из upload_cache
+        outbox.enqueue(
+            article,
+            photos,
+            subsite_id=config.VC_SUBSITE_ID,
+            publish=publish,
+            publish_key=key,
+        )
+        logger.info(f"✓ [QUEUED] «{article.title}»")
+        return True
 
-    # 4. Публикуем
     result = publisher.publish_article(
         article=article,
         image_paths=photos,
         subsite_id=config.VC_SUBSITE_ID,
         publish=publish,
+        publish_key=key,
+        uploaded_images=uploaded,
     )
 
     if result:
@@ -120,44 +185,32 @@ def process_topic(
         return False
 
 
-def _save_article_locally(article) -> None:
-    """Сохраняет статью в HTML-файл для просмотра/копипасты."""
-    output_dir = Path("articles")
-    output_dir.mkdir(exist_ok=True)
-
-    safe_name = "".join(c if c.isalnum() or c in " _-" else "_" for c in article.title)[:60]
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filepath = output_dir / f"{timestamp}_{safe_name}.html"
-
-    sections_html = ""
-    for section in article.sections:
-        sections_html += f'<h2>{section.get("heading", "")}</h2>\n'
-        for para in section.get("paragraphs", []):
-            sections_html += f"<p>{para}</p>\n"
-        items = section.get("list_items", [])
-        if items:
-            sections_html += "<ul>\n" + "".join(f"  <li>{it}</li>\n" for it in items) + "</ul>\n"
-        if section.get("has_image_placeholder"):
-            sections_html += "<p><em>[ФОТО]</em></p>\n"
-
-    html = f"""<!DOCTYPE html>
-<html lang="ru"><head><meta charset="utf-8">
-<title>{article.title}</title>
-<style>body{{max-width:860px;margin:40px auto;font-family:Georgia,serif;line-height:1.7;padding:0 20px}}
-h1{{font-size:2em;margin-bottom:.3em}}h2{{margin-top:1.8em;color:#222}}
-p{{margin:.8em 0}}ul{{margin:.5em 0 1em 1.5em}}
-.meta{{color:#888;font-size:.9em;margin-bottom:2em}}</style>
-</head><body>
-<h1>{article.title}</h1>
-<p class="meta">{article.meta_description}</p>
-{article.intro.replace(chr(10)*2, "</p><p>")}
-{sections_html}
-<h2>Заключение</h2>
-<p>{article.conclusion.replace(chr(10)*2, "</p><p>")}</p>
-</body></html>"""
-
-    filepath.write_text(html, encoding="utf-8")
+def _discard_photos(photos: list[Path] | None, prefetch) -> None:
+    """
+    Статья не получилась: фото возвращаются в ротацию, ещё не начатая загрузка отменяется.
+    Уже загруженные фото остаются в upload_cache и повторно не загружаются.
+    """
+    if prefetch:
+        prefetch.cancel()
+    if photos:
+        release_photos(config.PHOTOS_DIR, photos)
+
+
+def _save_article_locally(article, photos: list[Path]) -> Path:
+    """Сохраняет статью (запись + HTML для просмотра/копипасты) в articles/; возвращает путь к HTML."""
+    filepath = articles.save(article, photos=[p.name for p in photos])
     logger.info(f"Article saved locally: {filepath}")
+    return filepath
+
+
+def _make_publisher() -> VcPublisher:
+    return VcPublisher(
+        token=config.VC_TOKEN,
+        base_url=config.VC_BASE_URL,
+        upload_concurrency=config.VC_UPLOAD_CONCURRENCY,
+        rate_limit=config.VC_RATE_LIMIT,
+        max_rate_limit=config.VC_RATE_LIMIT_MAX,
+    )
 
 
 def run(
@@ -165,8 +218,15 @@ def run(
     forced_topic: str | None = None,
     publish: bool = False,
     list_only: bool = False,
+    all_targets: bool = False,
 ) -> None:
-    publisher = VcPublisher(token=config.VC_TOKEN, base_url=config.VC_BASE_URL)
+    publisher = _make_publisher()
+    targets = None
+    if all_targets:
+        targets = targets_from_config()
+        if not targets:
+            logger.error("--all-targets: VC_TARGETS in config.py has no targets with tokens")
+            return
     processed = load_processed()
 
     if forced_topic:
@@ -177,9 +237,10 @@ def run(
             source_url="",
             source="manual",
         )
-        process_topic(topic, publisher, publish=publish)
+        process_topic(topic, publisher, publish=publish, targets=targets)
         processed.add(forced_topic)
         save_processed(processed)
+        _drain_outbox(publisher)
         return
 
     # Собираем темы
@@ -208,7 +269,7 @@ def run(
 
     success_count = 0
     for topic in new_topics[:count]:
-        ok = process_topic(topic, publisher, publish=publish)
+        ok = process_topic(topic, publisher, publish=publish, targets=targets)
         if ok:
             processed.add(topic.title)
             save_processed(processed)
@@ -218,6 +279,16 @@ def run(
             time.sleep(5)
 
     logger.info(f"Done. {success_count}/{min(count, len(new_topics))} articles processed.")
+    _drain_outbox(publisher)
+
+
+def _drain_outbox(publisher: VcPublisher) -> None:
+    """Публикует всё, что накопилось в очереди и готово к отправке."""
+    if not config.PUBLISH_VIA_OUTBOX:
+        return
+    ok, failed = outbox.drain(publisher)
+    if ok or failed:
+        logger.info(f"Outbox: {ok} published, {failed} failed, {outbox.pending_count()} pending")
 
 
 # ─── CLI ─────────────────────────────────────────────────────────────────────
@@ -249,6 +320,16 @@ def main():
         action="store_true",
         help="Только показать найденные темы, без генерации",
     )
+    parser.add_argument(
+        "--all-targets",
+        action="store_true",
+        help="Публиковать параллельно во все блоги из VC_TARGETS (config.py)",
+    )
+    parser.add_argument(
+        "--drain-outbox",
+        action="store_true",
+        help="Только допубликовать статьи из очереди публикации",
+    )
     parser.add_argument(
         "--reset-photos",
         action="store_true",
@@ -276,11 +357,16 @@ def main():
     print(f"  VC.RU SEO Bot  |  {datetime.now():%Y-%m-%d %H:%M}  |  mode={mode_label}")
     print(f"{'='*60}\n")
 
+    if args.drain_outbox:
+        _drain_outbox(_make_publisher())
+        return
+
     run(
         count=args.count,
         forced_topic=args.topic,
         publish=publish_mode,
         list_only=args.list_topics,
+        all_targets=args.all_targets,
     )
 
 
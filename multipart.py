@@ -0,0 +1,94 @@
+"""
+Потоковое тело multipart/form-data для загрузки файлов.
+requests с files= собирает всё тело в памяти; StreamingMultipart читает файл
+кусками по мере отправки, а длина известна заранее (Content-Length) —
+память на одну загрузку не зависит от размера фото.
+"""
+
+import os
+import uuid
+from pathlib import Path
+from typing import Iterator
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _quote(value: str) -> str:
+    # Как в urllib3 (HTML5): UTF-8 как есть, экранируем только кавычку и переводы строк
+    return value.replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+class StreamingMultipart:
+    """
+    Файлоподобное тело запроса с одним файловым полем:
+        body = StreamingMultipart("file", path, "photo.jpg", "image/jpeg")
+        session.post(url, data=body, headers={"Content-Type": body.content_type})
+    requests берёт длину из len(body) и передаёт тело в http.client, который вызывает read() кусками.
+    """
+
+    def __init__(
+        self,
+        field: str,
+        path: str | Path,
+        filename: str,
+        content_type: str,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self._path = Path(path)
+        head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{_quote(field)}"; filename="{_quote(filename)}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+        tail = f"\r\n--{self.boundary}--\r\n".encode("ascii")
+        self._head, self._tail = head, tail
+        self._length = len(head) + os.path.getsize(self._path) + len(tail)
+        self._file = None
+        self._stage = 0        # 0 — заголовок части, 1 — файл, 2 — завершение, 3 — конец
+        self._pending = b""
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _next_piece(self, size: int) -> bytes:
+        if self._stage == 0:
+            self._stage = 1
+            self._file = open(self._path, "rb")
+            return self._head
+        if self._stage == 1:
+            data = self._file.read(size)
+            if data:
+                return data
+            self._file.close()
+            self._stage = 2
+        if self._stage == 2:
+            self._stage = 3
+            return self._tail
+        return b""
+
+    def read(self, size: int = -1) -> bytes:
+        """Отдаёт не больше size байт (size < 0 — кусок по chunk_size, а не всё тело)."""
+        if size is None or size < 0:
+            size = self.chunk_size
+        while len(self._pending) < size and self._stage < 3:
+            self._pending += self._next_piece(size - len(self._pending))
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._stage = 3
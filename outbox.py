@@ -0,0 +1,244 @@
+"""
+Очередь публикации (outbox).
+Сгенерированная статья сохраняется в базу состояния и сразу считается принятой;
+фоновый воркер публикует её на VC.RU с повторами и паузами между публикациями.
+Генерация не ждёт VC.RU, а статьи переживают падения API и перезапуски.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Optional
+
+import config
+import publish_log
+import storage
+from generator import GeneratedArticle
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 15 * 60   # Задача «sending» дольше этого срока считается брошенной
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    article         TEXT    NOT NULL,
+    image_paths     TEXT    NOT NULL,
+    subsite_id      TEXT,
+    publish         INTEGER NOT NULL,
+    publish_key     TEXT    NOT NULL,
+    update_existing INTEGER NOT NULL DEFAULT 0,
+    status          TEXT    NOT NULL DEFAULT 'queued',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL    NOT NULL,
+    locked_until    REAL,
+    last_error      TEXT,
+    result          TEXT,
+    created_at      REAL    NOT NULL,
+    updated_at      REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS outbox_key ON outbox (publish_key, status);
+"""
+
+
+def _db():
+    return storage.connect(_SCHEMA)
+
+
+def enqueue(
+    article: GeneratedArticle,
+    image_paths: list[str | Path],
+    subsite_id: Optional[int] = None,
+    publish: bool = False,
+    publish_key: Optional[str] = None,
+    update: bool = False,
+) -> int:
+    """
+    Ставит статью в очередь публикации. Возвращает id задачи.
+    update=True — отредактировать уже созданную по publish_key запись (см. VcPublisher.publish_article).
+    """
+    now = time.time()
+    key = publish_key or publish_log.make_key(article, subsite_id, publish)
+    conn = _db()
+    cur = conn.execute(
+        "INSERT INTO outbox (article, image_paths, subsite_id, publish, publish_key, update_existing, "
+        "next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            json.dumps(asdict(article), ensure_ascii=False),
+            json.dumps([str(p) for p in image_paths], ensure_ascii=False),
+            str(subsite_id) if subsite_id else None,
+            int(publish),
+            key,
+            int(update),
+            now, now, now,
+        ),
+    )
+    logger.info(f"Queued for publishing (#{cur.lastrowid}): «{article.title}»")
+    return cur.lastrowid
+
+
+def get(item_id: int) -> Optional[dict]:
+    """Состояние задачи: status (queued/sending/done/failed), attempts, last_error, result."""
+    conn = _db()
+    row = conn.execute(
+        "SELECT id, status, attempts, last_error, result FROM outbox WHERE id = ?", (item_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    item = dict(row)
+    item["result"] = json.loads(item["result"]) if item["result"] else None
+    return item
+
+
+def pending_count() -> int:
+    conn = _db()
+    return storage.scalar(conn, "SELECT COUNT(*) FROM outbox WHERE status IN ('queued', 'sending')")
+
+
+def claim() -> Optional[dict]:
+    """
+    Забирает одну готовую к отправке задачу (атомарно — безопасно для нескольких воркеров).
+    Задача ждёт, пока другая задача с тем же publish_key отправляется: обе правят одну запись.
+    """
+    now = time.time()
+    # Пустую очередь проверяем чтением, без блокировки записи
+    ready = _db().execute(
+        "SELECT 1 FROM outbox WHERE (status = 'queued' AND next_attempt_at <= ?) "
+        "OR (status = 'sending' AND locked_until < ?) LIMIT 1",
+        (now, now),
+    ).fetchone()
+    if ready is None:
+        return None
+    with storage.transaction(_SCHEMA) as conn:
+        now = time.time()
+        row = conn.execute(
+            "SELECT * FROM outbox AS o "
+            "WHERE ((status = 'queued' AND next_attempt_at <= ?) OR (status = 'sending' AND locked_until < ?)) "
+            "AND NOT EXISTS (SELECT 1 FROM outbox AS s WHERE s.publish_key = o.publish_key AND s.id != o.id "
+            "AND s.status = 'sending' AND s.locked_until >= ?) "
+            "ORDER BY next_attempt_at, id LIMIT 1",
+            (now, now, now),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE outbox SET status = 'sending', attempts = attempts + 1, locked_until = ?, updated_at = ? WHERE id = ?",
+            (now + LEASE_SECONDS, now, row["id"]),
+        )
+    item = dict(row)
+    item["attempts"] += 1
+    item["article"] = GeneratedArticle(**json.loads(item["article"]))
+    item["image_paths"] = json.loads(item["image_paths"])
+    item["subsite_id"] = int(item["subsite_id"]) if item["subsite_id"] else None
+    item["publish"] = bool(item["publish"])
+    item["update_existing"] = bool(item["update_existing"])
+    return item
+
+
+def complete(item_id: int, entry: dict) -> None:
+    conn = _db()
+    conn.execute(
+        "UPDATE outbox SET status = 'done', result = ?, last_error = NULL, locked_until = NULL, updated_at = ? WHERE id = ?",
+        (json.dumps(entry, ensure_ascii=False), time.time(), item_id),
+    )
+
+
+def fail(item_id: int, attempts: int, error: str, permanent: bool = False) -> None:
+    """
+    Откладывает задачу с экспоненциальной задержкой или помечает failed после OUTBOX_MAX_ATTEMPTS.
+    permanent=True — повтор не поможет (VC.RU отклонил запрос): failed сразу.
+    """
+    now = time.time()
+    if permanent or attempts >= config.OUTBOX_MAX_ATTEMPTS:
+        status, next_at = "failed", now
+    else:
+        delay = min(3600, 30 * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        status, next_at = "queued", now + delay
+    conn = _db()
+    conn.execute(
+        "UPDATE outbox SET status = ?, next_attempt_at = ?, last_error = ?, locked_until = NULL, updated_at = ? WHERE id = ?",
+        (status, next_at, error[:1000], now, item_id),
+    )
+
+
+def process_one(publisher) -> Optional[bool]:
+    """Публикует одну задачу. None — очередь пуста, иначе True/False по результату."""
+    item = claim()
+    if item is None:
+        return None
+    article = item["article"]
+    try:
+        entry = publisher.publish_article(
+            article=article,
+            image_paths=item["image_paths"],
+            subsite_id=item["subsite_id"],
+            publish=item["publish"],
+            publish_key=item["publish_key"],
+            update=item["update_existing"],
+        )
+        if not entry:
+            raise RuntimeError("empty response from VC.RU")
+    except Exception as e:
+        # Ошибки без признака transient (сеть, сбой проверки) считаем временными
+        permanent = getattr(e, "transient", True) is False
+        logger.error(
+            f"Outbox #{item['id']} attempt {item['attempts']} failed"
+            f"{' permanently' if permanent else ''} for «{article.title}»: {e}"
+        )
+        fail(item["id"], item["attempts"], str(e), permanent=permanent)
+        return False
+    complete(item["id"], entry)
+    logger.info(f"Outbox #{item['id']} published: «{article.title}» → {entry.get('url', '?')}")
+    return True
+
+
+def drain(publisher) -> tuple[int, int]:
+    """Публикует всё, что готово к отправке прямо сейчас. Возвращает (успешно, с ошибкой)."""
+    ok = failed = 0
+    while True:
+        result = process_one(publisher)
+        if result is None:
+            return ok, failed
+        if result:
+            ok += 1
+        else:
+            failed += 1
+        time.sleep(config.OUTBOX_MIN_INTERVAL)
+
+
+class OutboxWorker(threading.Thread):
+    """Фоновый поток, разбирающий очередь публикации."""
+
+    def __init__(self, publisher_factory: Callable[[], object]):
+        super().__init__(name="outbox-worker", daemon=True)
+        self._publisher_factory = publisher_factory
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+
+    def notify(self) -> None:
+        """Разбудить воркер — в очереди появилась задача."""
+        self._wakeup.set()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+
+    def run(self) -> None:
+        publisher = self._publisher_factory()
+        while not self._stopping.is_set():
+            try:
+                result = process_one(publisher)
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+                result = None
+            if result is None:
+                self._wakeup.wait(config.OUTBOX_POLL_INTERVAL)
+                self._wakeup.clear()
+            else:
+                # Пауза между публикациями, чтобы не нагружать API
+                self._stopping.wait(config.OUTBOX_MIN_INTERVAL)
@@ -1,87 +1,485 @@
 """
 Менеджер фотографий.
 Сканирует папку с вашими фото и выбирает изображения для статьи.
-Поддерживает ротацию — не повторяет одно фото в разных статьях подряд.
+Поддерживает ротацию — не повторяет одно фото в разных статьях подряд,
+подбирает снимки по теме статьи и не ставит в одну статью почти одинаковые кадры.
 """
 
+import hashlib
+import heapq
 import json
 import logging
+import os
 import random
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
+
+import config
+import storage
 
 logger = logging.getLogger(__name__)
 
 SUPPORTED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
-USAGE_LOG = Path(".photo_usage.json")  # Хранит историю использования
+USAGE_LOG = Path(".photo_usage.json")  # Хранит историю использования (старый формат)
+TAGS_FILE = "tags.json"                # Теги фото в папке: {"файл.jpg": ["кофе", "офис"]}
 
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS photo_index (
+    dir      TEXT    NOT NULL,
+    name     TEXT    NOT NULL,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width    INTEGER,
+    height   INTEGER,
+    sha256   TEXT    NOT NULL,
+    phash    TEXT,
+    tags     TEXT    NOT NULL DEFAULT '',
+    PRIMARY KEY (dir, name)
+);
+CREATE TABLE IF NOT EXISTS photo_dirs (
+    dir           TEXT PRIMARY KEY,
+    mtime_ns      INTEGER NOT NULL,
+    tags_mtime_ns INTEGER NOT NULL DEFAULT 0,
+    scanned_at    REAL    NOT NULL
+);
+"""
 
-def _load_usage() -> dict[str, int]:
-    """Загружает счётчик использования фото."""
-    if USAGE_LOG.exists():
-        try:
-            return json.loads(USAGE_LOG.read_text(encoding="utf-8"))
-        except Exception:
-            return {}
-    return {}
 
+@dataclass(frozen=True)
+class PhotoInfo:
+    path: Path
+    size: int
+    mtime_ns: int
+    width: Optional[int]
+    height: Optional[int]
+    sha256: str
+    phash: Optional[str] = None     # dHash, 16 hex-символов ("" / None — нет)
+    tags: tuple[str, ...] = ()      # Слова из имени файла и tags.json
 
-def _save_usage(usage: dict[str, int]) -> None:
-    USAGE_LOG.write_text(json.dumps(usage, ensure_ascii=False, indent=2), encoding="utf-8")
 
+_USAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS photo_usage (
+    name      TEXT PRIMARY KEY,
+    count     INTEGER NOT NULL DEFAULT 0,
+    last_used REAL
+);
+CREATE TABLE IF NOT EXISTS photo_usage_version (
+    id      INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+"""
 
-def scan_photos(photos_dir: str | Path) -> list[Path]:
-    """Возвращает список всех поддерживаемых изображений в папке."""
+
+_hash_memo: dict[tuple[str, int, int], str] = {}
+
+
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_hash(path: str | Path) -> str:
+    """
+    SHA-256 содержимого файла. Кэшируется в памяти по пути, размеру и mtime;
+    для фото из проиндексированной папки хэш берётся из индекса без чтения файла.
+    """
+    path = Path(path)
+    st = path.stat()
+    resolved = path.resolve()
+    key = (str(resolved), st.st_size, st.st_mtime_ns)
+    digest = _hash_memo.get(key)
+    if digest is None:
+        row = storage.connect(_INDEX_SCHEMA).execute(
+            "SELECT sha256 FROM photo_index WHERE dir = ? AND name = ? AND size = ? AND mtime_ns = ?",
+            (str(resolved.parent), resolved.name, st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        digest = row["sha256"] if row else _sha256_file(path)
+        _hash_memo[key] = digest
+    return digest
+
+
+# ─── Индекс фотографий ───────────────────────────────────────────────────────
+
+# dir → ((mtime_ns папки, mtime_ns tags.json), время сверки, индекс) — чтобы не ходить в базу на каждый вызов
+_index_memo: dict[str, tuple[tuple[int, int], float, list[PhotoInfo]]] = {}
+_index_lock = threading.Lock()
+
+
+def _words(text: str) -> list[str]:
+    """Слова из букв длиной от 3 символов в нижнем регистре."""
+    return re.findall(r"[^\W\d_]{3,}", text.lower())
+
+
+def _stem(word: str) -> str:
+    # Грубая основа: первые 5 букв сводят «кофейня/кофейни/кофейне» к одному ключу
+    return word[:5]
+
+
+def _load_sidecar(photos_dir: Path) -> dict[str, list[str]]:
+    path = photos_dir / TAGS_FILE
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except Exception as e:
+        logger.warning(f"Cannot read {path}: {e}")
+        return {}
+    return {
+        name: [tags] if isinstance(tags, str) else list(tags)
+        for name, tags in data.items()
+    }
+
+
+def _photo_tags(name: str, sidecar: dict[str, list[str]]) -> str:
+    words = _words(Path(name).stem) + [w for tag in sidecar.get(name, ()) for w in _words(tag)]
+    return " ".join(dict.fromkeys(words))
+
+
+def _refresh_index(photos_dir: Path, dir_key: str, stamp: tuple[int, int], force: bool) -> list[PhotoInfo]:
+    """
+    Сверяет индекс в базе с папкой. Если папка и tags.json не менялись (mtime) и сверка
+    свежая — читает только базу; иначе обходит папку и пересчитывает только новые и
+    изменённые файлы (у остальных при необходимости обновляются теги).
+    """
+    dir_mtime, tags_mtime = stamp
+    conn = storage.connect(_INDEX_SCHEMA)
+    rows = {
+        r["name"]: r for r in conn.execute("SELECT * FROM photo_index WHERE dir = ?", (dir_key,))
+    }
+    state = conn.execute(
+        "SELECT mtime_ns, tags_mtime_ns, scanned_at FROM photo_dirs WHERE dir = ?", (dir_key,)
+    ).fetchone()
+    fresh = (
+        state is not None
+        and state["mtime_ns"] == dir_mtime
+        and state["tags_mtime_ns"] == tags_mtime
+        and time.time() - state["scanned_at"] < config.PHOTO_INDEX_RESCAN
+    )
+    if force or not fresh:
+        import images   # images импортирует photos — импорт здесь, а не наверху
+
+        sidecar = _load_sidecar(photos_dir)
+        seen = set()
+        changed = []
+        with os.scandir(photos_dir) as it:
+            for entry in it:
+                if not entry.is_file() or Path(entry.name).suffix.lower() not in SUPPORTED_EXTENSIONS:
+                    continue
+                seen.add(entry.name)
+                st = entry.stat()
+                tags = _photo_tags(entry.name, sidecar)
+                row = rows.get(entry.name)
+                same = row is not None and row["size"] == st.st_size and row["mtime_ns"] == st.st_mtime_ns
+                # Строки из индекса до появления phash досчитываем, когда есть Pillow
+                need_phash = not same or (row["phash"] is None and images.Image is not None)
+                if same and not need_phash and row["tags"] == tags:
+                    continue
+                path = Path(entry.path)
+                if same:
+                    width, height, digest = row["width"], row["height"], row["sha256"]
+                else:
+                    width, height = images.image_size(path)
+                    digest = _sha256_file(path)
+                phash = images.perceptual_hash(path) if need_phash else row["phash"]
+                changed.append(
+                    (dir_key, entry.name, st.st_size, st.st_mtime_ns, width, height, digest, phash, tags)
+                )
+        removed = [name for name in rows if name not in seen]
+
+        with storage.transaction(_INDEX_SCHEMA) as tx:
+            tx.executemany(
+                "INSERT OR REPLACE INTO photo_index "
+                "(dir, name, size, mtime_ns, width, height, sha256, phash, tags) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                changed,
+            )
+            tx.executemany("DELETE FROM photo_index WHERE dir = ? AND name = ?", [(dir_key, n) for n in removed])
+            tx.execute(
+                "INSERT OR REPLACE INTO photo_dirs (dir, mtime_ns, tags_mtime_ns, scanned_at) VALUES (?, ?, ?, ?)",
+                (dir_key, dir_mtime, tags_mtime, time.time()),
+            )
+        if changed or removed:
+            logger.info(f"Photo index {photos_dir}: {len(changed)} new/changed, {len(removed)} removed")
+        rows = {
+            r["name"]: r for r in conn.execute("SELECT * FROM photo_index WHERE dir = ?", (dir_key,))
+        }
+
+    infos = [
+        PhotoInfo(
+            path=photos_dir / r["name"],
+            size=r["size"],
+            mtime_ns=r["mtime_ns"],
+            width=r["width"],
+            height=r["height"],
+            sha256=r["sha256"],
+            phash=r["phash"],
+            tags=tuple(r["tags"].split()),
+        )
+        for r in rows.values()
+    ]
+    infos.sort(key=lambda p: p.path.name)
+    return infos
+
+
+def photo_index(photos_dir: str | Path, force: bool = False) -> list[PhotoInfo]:
+    """
+    Индекс фото в папке: размер, mtime, размеры в пикселях, SHA-256, перцептивный хэш
+    и теги каждого файла. Хранится в базе состояния и обновляется инкрементально;
+    force=True — полная сверка.
+    """
     photos_dir = Path(photos_dir)
     if not photos_dir.exists():
         logger.warning(f"Photos directory not found: {photos_dir}")
         return []
 
-    photos = [
-        p for p in photos_dir.iterdir()
-        if p.is_file() and p.suffix.lower() in SUPPORTED_EXTENSIONS
-    ]
-    photos.sort(key=lambda p: p.name)
-    logger.info(f"Found {len(photos)} photos in {photos_dir}")
-    return photos
+    dir_key = str(photos_dir.resolve())
+    tags_path = photos_dir / TAGS_FILE
+    stamp = (photos_dir.stat().st_mtime_ns, tags_path.stat().st_mtime_ns if tags_path.exists() else 0)
+    with _index_lock:
+        memo = _index_memo.get(dir_key)
+        if (
+            memo is not None
+            and not force
+            and memo[0] == stamp
+            and time.time() - memo[1] < config.PHOTO_INDEX_RESCAN
+        ):
+            return memo[2]
+        infos = _refresh_index(photos_dir, dir_key, stamp, force)
+        _index_memo[dir_key] = (stamp, time.time(), infos)
+    logger.info(f"Found {len(infos)} photos in {photos_dir}")
+    return infos
+
+
+def scan_photos(photos_dir: str | Path) -> list[Path]:
+    """Возвращает список всех поддерживаемых изображений в папке (из индекса)."""
+    return [info.path for info in photo_index(photos_dir)]
+
+
+# ─── Учёт использования ──────────────────────────────────────────────────────
+
+class _UsageState:
+    """
+    Снимок счётчиков для папки: куча (count, name) наименее использованных —
+    общая и по каждой основе слова из тегов. Перестраивается, только если поменялся
+    индекс или счётчики изменил кто-то другой (другой процесс, reset_usage).
+    """
+
+    def __init__(self, infos: list[PhotoInfo], version: int, counts: dict[str, int]):
+        self.infos = infos
+        self.version = version
+        self.by_name = {info.path.name: info for info in infos}
+        self.counts = {name: counts.get(name, 0) for name in self.by_name}
+        self.heap = [(used, name) for name, used in self.counts.items()]
+        heapq.heapify(self.heap)
+        self.stems = {info.path.name: {_stem(tag) for tag in info.tags} for info in infos}
+        self.by_stem: dict[str, list[tuple[int, str]]] = defaultdict(list)
+        for name, stems in self.stems.items():
+            for stem in stems:
+                self.by_stem[stem].append((self.counts[name], name))
+        self.stem_sizes = {stem: len(heap) for stem, heap in self.by_stem.items()}
+        for heap in self.by_stem.values():
+            heapq.heapify(heap)
+
+    def _take(self, heap: list[tuple[int, str]], n: int) -> list[str]:
+        """n наименее использованных из кучи за O(n log N); куча не меняется."""
+        found: list[tuple[int, str]] = []
+        while heap and len(found) < n:
+            used, name = heapq.heappop(heap)
+            if self.counts.get(name) == used:   # устаревшие записи (после bump) отбрасываем
+                found.append((used, name))
+        for item in found:
+            heapq.heappush(heap, item)
+        return [name for _, name in found]
+
+    def least_used(self, n: int) -> list[str]:
+        return self._take(self.heap, n)
+
+    def relevant(self, stems: set[str], n: int) -> list[str]:
+        """По n наименее использованных фото на каждую основу — сколько бы фото её ни делили."""
+        found: list[str] = []
+        for stem in sorted(stems):
+            heap = self.by_stem.get(stem)
+            if heap:
+                found.extend(self._take(heap, n))
+        return found
+
+    def bump(self, names: list[str]) -> None:
+        for name in names:
+            self.counts[name] += 1
+            heapq.heappush(self.heap, (self.counts[name], name))
+            for stem in self.stems[name]:
+                heapq.heappush(self.by_stem[stem], (self.counts[name], name))
+        if len(self.heap) > 2 * len(self.counts) + 64:
+            self.heap = self._rebuilt(self.counts)
+        for stem in {stem for name in names for stem in self.stems[name]}:
+            if len(self.by_stem[stem]) > 2 * self.stem_sizes[stem] + 64:
+                self.by_stem[stem] = self._rebuilt({n for _, n in self.by_stem[stem]})
+
+    def _rebuilt(self, names: Iterable[str]) -> list[tuple[int, str]]:
+        """Куча без устаревших записей."""
+        heap = [(self.counts[name], name) for name in names]
+        heapq.heapify(heap)
+        return heap
+
+
+_usage_states: dict[str, _UsageState] = {}
+_usage_lock = threading.Lock()
+
+
+def _hamming(a: Optional[str], b: Optional[str]) -> int:
+    if not a or not b:
+        return 64
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def _migrate_legacy_usage(tx) -> None:
+    """Переносит счётчики из старого .photo_usage.json в базу (один раз)."""
+    if not USAGE_LOG.exists():
+        return
+    try:
+        legacy = json.loads(USAGE_LOG.read_text(encoding="utf-8"))
+    except Exception:
+        legacy = {}
+    tx.executemany(
+        "INSERT INTO photo_usage (name, count) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET count = count + excluded.count",
+        [(name, int(n)) for name, n in legacy.items()],
+    )
+    _bump_version(tx)
+    USAGE_LOG.rename(USAGE_LOG.with_name(USAGE_LOG.name + ".migrated"))
+    logger.info(f"Photo usage migrated from {USAGE_LOG}: {len(legacy)} photos")
+
+
+def _usage_version(conn) -> int:
+    return storage.scalar(conn, "SELECT version FROM photo_usage_version WHERE id = 1") or 0
+
+
+def _bump_version(tx) -> int:
+    version = _usage_version(tx) + 1
+    tx.execute(
+        "INSERT INTO photo_usage_version (id, version) VALUES (1, ?) "
+        "ON CONFLICT(id) DO UPDATE SET version = excluded.version",
+        (version,),
+    )
+    return version
+
+
+def _usage_state(tx, dir_key: str, infos: list[PhotoInfo], version: int) -> _UsageState:
+    state = _usage_states.get(dir_key)
+    if state is not None and state.infos is infos and state.version == version:
+        return state
+    counts = {r["name"]: r["count"] for r in tx.execute("SELECT name, count FROM photo_usage")}
+    return _UsageState(infos, version, counts)
+
+
+def _select(state: _UsageState, count: int, words: list[str], rng) -> list[str]:
+    """
+    Кандидаты — по 2·count наименее использованных фото на каждую основу слова
+    из темы и столько же наименее использованных вообще: их число не зависит от
+    размера библиотеки, даже если тег вроде «кресло» есть у большинства фото.
+    Порядок — по совпадениям тегов за вычетом PHOTO_USAGE_PENALTY за каждое прошлое
+    использование: лучшие по теме фото не попадают в каждую статью, а чередуются
+    с менее подходящими. Равные — в случайном порядке. Жадно набираем `count`,
+    пропуская почти одинаковые кадры; если без них не хватает — добираем из пропущенных.
+    """
+    stems = {_stem(w) for w in words}
+    candidates = list(dict.fromkeys(state.relevant(stems, count * 2) + state.least_used(count * 2)))
+    scores = {name: len(state.stems[name] & stems) for name in candidates}
+    rng.shuffle(candidates)
+    candidates.sort(key=lambda n: config.PHOTO_USAGE_PENALTY * state.counts[n] - scores[n])
+
+    picked: list[str] = []
+    skipped: list[str] = []
+    for name in candidates:
+        if len(picked) == count:
+            break
+        phash = state.by_name[name].phash
+        if any(_hamming(phash, state.by_name[p].phash) <= config.PHOTO_DUP_DISTANCE for p in picked):
+            skipped.append(name)
+        else:
+            picked.append(name)
+    return picked + skipped[:count - len(picked)]
 
 
 def pick_photos(
     photos_dir: str | Path,
     count: int = 3,
     seed: Optional[int] = None,
+    keywords: Optional[list[str]] = None,
+    headings: Optional[list[str]] = None,
 ) -> list[Path]:
     """
     Выбирает `count` фото с ротацией (наименее использованные идут первыми).
     Позволяет избежать постоянного повторения одних и тех же снимков.
+    keywords/headings — ключевые слова и заголовки статьи: фото с совпадающими тегами
+    ставятся вперёд, пока их не использовали заметно чаще остальных (см. _select);
+    почти одинаковые кадры (по перцептивному хэшу) в одну статью не попадают.
+    Счётчики хранятся в базе состояния и обновляются в одной транзакции с выбором,
+    поэтому параллельные вызовы из потоков и процессов не теряют использование.
     """
-    all_photos = scan_photos(photos_dir)
-    if not all_photos:
+    infos = photo_index(photos_dir)
+    if not infos:
         return []
 
-    usage = _load_usage()
-
-    # Сортируем по частоте использования (редко используемые — первые)
-    sorted_photos = sorted(all_photos, key=lambda p: usage.get(p.name, 0))
-
-    if seed is not None:
-        random.seed(seed)
+    rng = random.Random(seed) if seed is not None else random
+    dir_key = str(Path(photos_dir).resolve())
+    words = [w for text in (keywords or []) + (headings or []) for w in _words(text)]
 
-    # Берём пул из наименее использованных (2×count), затем рандомно выбираем
-    pool = sorted_photos[:max(count * 2, len(sorted_photos) // 2 + 1)]
-    selected = random.sample(pool, min(count, len(pool)))
-
-    # Обновляем счётчик
-    for photo in selected:
-        usage[photo.name] = usage.get(photo.name, 0) + 1
-    _save_usage(usage)
+    with _usage_lock:
+        try:
+            with storage.transaction(_USAGE_SCHEMA) as tx:
+                _migrate_legacy_usage(tx)
+                state = _usage_state(tx, dir_key, infos, _usage_version(tx))
+                picked = _select(state, count, words, rng)
+                tx.executemany(
+                    "INSERT INTO photo_usage (name, count, last_used) VALUES (?, 1, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET count = count + 1, last_used = excluded.last_used",
+                    [(name, time.time()) for name in picked],
+                )
+                state.version = _bump_version(tx)
+                state.bump(picked)
+        except BaseException:
+            _usage_states.pop(dir_key, None)
+            raise
+        _usage_states[dir_key] = state
 
+    selected = [state.by_name[name].path for name in picked]
     logger.info(f"Selected photos: {[p.name for p in selected]}")
     return selected
 
 
+def release_photos(photos_dir: str | Path, photos: list[Path]) -> None:
+    """
+    Отменяет использование фото, выбранных pick_photos для статьи, которая так и не
+    сохранилась (ошибка или отмена генерации), — они вернутся в ротацию.
+    Учёт ведётся сразу при выборе, чтобы параллельные генерации получали разные фото.
+    """
+    names = [Path(p).name for p in photos]
+    if not names:
+        return
+    with _usage_lock:
+        with storage.transaction(_USAGE_SCHEMA) as tx:
+            tx.executemany("UPDATE photo_usage SET count = MAX(count - 1, 0) WHERE name = ?", [(n,) for n in names])
+            _bump_version(tx)
+        # Снимок перестроится при следующем выборе
+        _usage_states.pop(str(Path(photos_dir).resolve()), None)
+    logger.info(f"Photos returned to rotation: {names}")
+
+
 def reset_usage() -> None:
     """Сбрасывает историю использования фотографий."""
-    if USAGE_LOG.exists():
-        USAGE_LOG.unlink()
+    with _usage_lock, storage.transaction(_USAGE_SCHEMA) as tx:
+        tx.execute("DELETE FROM photo_usage")
+        _bump_version(tx)
+        if USAGE_LOG.exists():
+            USAGE_LOG.unlink()
+        _usage_states.clear()
     logger.info("Photo usage history reset")
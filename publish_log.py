@@ -0,0 +1,189 @@
+"""
+Журнал публикаций на VC.RU.
+Для каждой статьи хранится ключ публикации и результат: pending — запрос
+отправлялся, но исход неизвестен; done — запись создана (id, url).
+По журналу create_entry не создаёт дубликаты при повторах и перезапусках,
+а update-режим знает id записи и последние отправленные блоки и фото.
+
+Ключ в статусе pending закреплён за одним публикатором (owner, lease_until):
+пока аренда действует, другой поток или процесс с тем же ключом запрос не отправляет.
+"""
+
+import hashlib
+import json
+import time
+from dataclasses import asdict
+from typing import Optional
+
+import storage
+
+CLAIM_SECONDS = 5 * 60   # Аренда ключа pending; публикатор продлевает её перед каждой попыткой
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS published_entries (
+    key         TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    title       TEXT NOT NULL,
+    subsite_id  TEXT,
+    entry_id    TEXT,
+    url         TEXT,
+    entry       TEXT,
+    blocks      TEXT,           -- отправленные блоки и фото — для правки записи на месте
+    images      TEXT,
+    published   INTEGER,
+    owner       TEXT,           -- кто сейчас создаёт запись (пока действует lease_until)
+    lease_until REAL,
+    updated_at  REAL NOT NULL
+);
+"""
+
+
+def _db():
+    return storage.connect(_SCHEMA)
+
+
+def make_key(article, subsite_id: Optional[int], publish: bool, account: str = "") -> str:
+    """
+    Ключ по содержимому статьи (GeneratedArticle): повторы той же статьи совпадают,
+    а новая статья с тем же заголовком получает свой ключ и публикуется.
+    """
+    content = json.dumps(asdict(article), ensure_ascii=False, sort_keys=True)
+    parts = [
+        article.title.strip(), str(subsite_id or ""), bool(publish),
+        hashlib.sha256(content.encode("utf-8")).hexdigest(),
+    ]
+    if account:
+        parts.append(account)
+    raw = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def article_key(article_id: str, subsite_id: Optional[int]) -> str:
+    """Постоянный ключ статьи с собственным идентификатором (например, имени файла) — не меняется при правках."""
+    raw = json.dumps(["article", article_id, str(subsite_id or "")], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _record(row) -> dict:
+    record = dict(row)
+    for name in ("entry", "blocks", "images"):
+        record[name] = json.loads(record[name]) if record[name] else None
+    return record
+
+
+def get(key: str) -> Optional[dict]:
+    row = _db().execute("SELECT * FROM published_entries WHERE key = ?", (key,)).fetchone()
+    return _record(row) if row else None
+
+
+def statuses(keys: list[str]) -> dict[str, dict]:
+    """Статус, url и режим (опубликовано/черновик) по многим ключам одним проходом."""
+    result = {}
+    conn = _db()
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        rows = conn.execute(
+            f"SELECT key, status, url, published FROM published_entries "
+            f"WHERE key IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        for row in rows:
+            result[row["key"]] = {
+                "status": row["status"],
+                "url": row["url"],
+                "published": None if row["published"] is None else bool(row["published"]),
+            }
+    return result
+
+
+def entry_ids(title: str, exclude_key: str) -> set[str]:
+    """id записей VC.RU с этим заголовком, уже учтённых за другими ключами (то есть за другими статьями)."""
+    rows = _db().execute(
+        "SELECT entry_id FROM published_entries WHERE title = ? AND key != ? AND entry_id IS NOT NULL",
+        (title, exclude_key),
+    )
+    return {row["entry_id"] for row in rows}
+
+
+def claim(key: str, title: str, subsite_id: Optional[int], owner: str) -> tuple[bool, Optional[dict]]:
+    """
+    Захватывает ключ для создания записи — атомарно для всех потоков и процессов.
+    Возвращает (захвачен ли ключ, прежняя запись журнала):
+      (True, None)     — ключ был свободен;
+      (True, pending)  — прошлая попытка бросила ключ с неизвестным исходом: сначала проверить VC.RU;
+      (False, done)    — запись уже создана;
+      (False, pending) — ключ держит другой живой публикатор, запрос отправлять нельзя.
+    """
+    now = time.time()
+    with storage.transaction(_SCHEMA) as tx:
+        row = tx.execute("SELECT * FROM published_entries WHERE key = ?", (key,)).fetchone()
+        record = _record(row) if row else None
+        if record and record["status"] == "done":
+            return False, record
+        if record and record["owner"] != owner and (record["lease_until"] or 0) > now:
+            return False, record
+        tx.execute(
+            "INSERT INTO published_entries (key, status, title, subsite_id, owner, lease_until, updated_at) "
+            "VALUES (?, 'pending', ?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET status = 'pending', owner = excluded.owner, "
+            "lease_until = excluded.lease_until, updated_at = excluded.updated_at",
+            (key, title, str(subsite_id or ""), owner, now + CLAIM_SECONDS, now),
+        )
+    return True, record
+
+
+def renew(key: str, owner: str) -> bool:
+    """Продлевает аренду ключа. False — ключ уже не наш (аренда истекла и его забрали)."""
+    cur = _db().execute(
+        "UPDATE published_entries SET lease_until = ? WHERE key = ? AND owner = ? AND status = 'pending'",
+        (time.time() + CLAIM_SECONDS, key, owner),
+    )
+    return cur.rowcount > 0
+
+
+def release(key: str, owner: str) -> None:
+    """Отпускает ключ, оставляя pending: исход попытки неизвестен, следующая сначала проверит VC.RU."""
+    _db().execute(
+        "UPDATE published_entries SET owner = NULL, lease_until = NULL WHERE key = ? AND owner = ? AND status = 'pending'",
+        (key, owner),
+    )
+
+
+def mark_done(
+    key: str,
+    entry: dict,
+    title: Optional[str] = None,
+    blocks: Optional[list[dict]] = None,
+    images: Optional[list[dict]] = None,
+    published: Optional[bool] = None,
+) -> None:
+    """
+    Запоминает созданную/обновлённую запись; blocks и images — что именно ушло на VC.RU.
+    Не переданные blocks/images/published остаются прежними (запись, найденная
+    после сбоя, не знает, что в ней отправлено).
+    """
+    entry_id = entry.get("id") or entry.get("entryId")
+    _db().execute(
+        "UPDATE published_entries SET status = 'done', entry_id = COALESCE(?, entry_id), "
+        "url = COALESCE(?, url), entry = ?, title = COALESCE(?, title), blocks = COALESCE(?, blocks), "
+        "images = COALESCE(?, images), published = COALESCE(?, published), owner = NULL, lease_until = NULL, "
+        "updated_at = ? WHERE key = ?",
+        (
+            str(entry_id) if entry_id else None,
+            entry.get("url"),
+            json.dumps(entry, ensure_ascii=False),
+            title,
+            json.dumps(blocks, ensure_ascii=False) if blocks is not None else None,
+            json.dumps(images, ensure_ascii=False) if images is not None else None,
+            None if published is None else int(published),
+            time.time(),
+            key,
+        ),
+    )
+
+
+def forget(key: str, owner: str) -> None:
+    """Удаляет запись — запрос точно не создал статью и его можно повторить с нуля."""
+    _db().execute(
+        "DELETE FROM published_entries WHERE key = ? AND owner = ? AND status = 'pending'", (key, owner)
+    )
@@ -5,27 +5,159 @@
 Формат контента: EditorJS-совместимые блоки.
 """
 
+import difflib
 import json
 import logging
 import mimetypes
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 
+import publish_log
+import upload_cache
 from generator import GeneratedArticle
+from images import prepare_image
+from multipart import StreamingMultipart
+from photos import file_hash
+from retry import AdaptiveRateLimiter, backoff_delay, parse_retry_after
 
 logger = logging.getLogger(__name__)
 
+CLAIM_WAIT = 60       # Сек. ожидания, пока ключ публикации держит другой публикатор
+_CLAIM_POLL = 0.5
+
+
+class RateLimited(requests.HTTPError):
+    """VC.RU отвечает 429 и после всех повторов ограничителя скорости."""
+
+
+class PublishError(RuntimeError):
+    """Ошибка публикации. transient=False — повтор не поможет (VC.RU отклонил запрос по существу)."""
+
+    def __init__(self, message: str, transient: bool = True):
+        super().__init__(message)
+        self.transient = transient
+
+
+class PublishInProgress(PublishError):
+    """Ту же статью сейчас публикует другой поток или процесс — второй запрос не отправляется."""
+
+
+def _classify_error(exc: Exception) -> tuple[bool, bool]:
+    """
+    (временная ли ошибка, мог ли запрос всё же выполниться на сервере).
+    Неоднозначные ошибки перед повтором требуют проверки, чтобы не создать дубль.
+    """
+    if isinstance(exc, RateLimited):
+        # Повторы с паузами уже сделал _request — ещё один круг только умножит попытки
+        return False, False
+    if isinstance(exc, requests.ConnectTimeout):
+        return True, False
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True, True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        code = exc.response.status_code
+        if code >= 500:
+            return True, True
+        return False, False
+    return False, True
+
+
+def _retry_delay(exc: Exception, attempt: int) -> float:
+    response = getattr(exc, "response", None)
+    if response is not None:
+        delay = parse_retry_after(response.headers.get("Retry-After"))
+        if delay is not None:
+            return delay
+    return backoff_delay(attempt, base=2.0, cap=30.0)
+
+
+def _is_permanent(exc: Exception) -> bool:
+    """Ответ 4xx (кроме 408 и 429): запрос отклонён по существу, и тот же запрос позже не пройдёт."""
+    if isinstance(exc, RateLimited) or not isinstance(exc, requests.HTTPError) or exc.response is None:
+        return False
+    code = exc.response.status_code
+    return 400 <= code < 500 and code not in (408, 429)
+
+
+def _api_error(operation: str, exc: Exception) -> PublishError:
+    api_response = ""
+    if getattr(exc, "response", None) is not None:
+        api_response = exc.response.text[:500]
+        logger.error(f"{operation} failed: {exc} | Response: {api_response}")
+    else:
+        logger.error(f"{operation} failed: {exc}")
+    return PublishError(
+        f"VC.RU API error: {exc}" + (f" | {api_response}" if api_response else ""),
+        transient=not _is_permanent(exc),
+    )
+
+
+def diff_blocks(old: list[dict], new: list[dict]) -> list[tuple[str, int, int, int, int]]:
+    """
+    Отличия между двумя списками EditorJS-блоков — opcodes difflib без 'equal'
+    (вставленные, удалённые и заменённые диапазоны). Пустой список — изменений нет.
+    """
+    a = [json.dumps(b, sort_keys=True, ensure_ascii=False) for b in old]
+    b = [json.dumps(b, sort_keys=True, ensure_ascii=False) for b in new]
+    matcher = difflib.SequenceMatcher(a=a, b=b, autojunk=False)
+    return [op for op in matcher.get_opcodes() if op[0] != "equal"]
+
+
+def _parse_entry(data: dict) -> dict:
+    return data.get("result", {}).get("entry") or data.get("entry") or data
+
+
+_limiters: dict[tuple[str, str], AdaptiveRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def shared_rate_limiter(base_url: str, token: str, rate: float, max_rate: float) -> AdaptiveRateLimiter:
+    """Один ограничитель на аккаунт: все VcPublisher с этим токеном делят лимит API."""
+    key = (base_url.rstrip("/"), token)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = AdaptiveRateLimiter(rate=rate, max_rate=max_rate)
+        return limiter
+
 
 class VcPublisher:
     """Клиент для публикации статей на VC.RU через Osnova API."""
 
-    def __init__(self, token: str, base_url: str = "https://api.vc.ru/v2.8"):
+    def __init__(
+        self,
+        token: str,
+        base_url: str = "https://api.vc.ru/v2.8",
+        upload_concurrency: int = 4,
+        use_upload_cache: bool = True,
+        max_retries: int = 3,
+        rate_limit: float = 2.0,
+        max_rate_limit: float = 10.0,
+    ):
         self.token = token
         self.base_url = base_url.rstrip("/")
+        self.upload_concurrency = max(1, upload_concurrency)
+        self.use_upload_cache = use_upload_cache
+        self.max_retries = max_retries
+        self.limiter = shared_rate_limiter(self.base_url, token, rate_limit, max_rate_limit)
+        # Последняя успешная проверка токена: (результат, time.monotonic())
+        self._token_check: tuple[Optional[dict], float] = (None, 0.0)
+        self._token_check_lock = threading.Lock()
+        self._prefetch_pool: Optional[ThreadPoolExecutor] = None
+        self._prefetch_lock = threading.Lock()
         self.session = requests.Session()
+        # Keep-alive пул не меньше числа параллельных загрузок (+ запросы других потоков)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.upload_concurrency + 4)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         self.session.headers.update({
             "X-Device-Token": token,
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
@@ -35,25 +167,67 @@ class VcPublisher:
         self.session.proxies = {"http": None, "https": None}
         self.session.trust_env = False
 
+    @property
+    def rate(self) -> float:
+        """Текущая допустимая скорость запросов к API (запросов/сек)."""
+        return self.limiter.rate
+
+    def _request(self, method: str, url: str, body=None, **kwargs) -> requests.Response:
+        """
+        Запрос к API через общий ограничитель скорости.
+        На 429 скорость снижается для всех потоков, запрос повторяется после паузы
+        (Retry-After или backoff); если 429 не проходит за max_retries повторов — RateLimited.
+        Скорость растёт только на успешных ответах (2xx/3xx), не на ошибках сервера.
+        body — функция, возвращающая аргументы тела (data, headers) заново для каждой попытки.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            resp = self.session.request(method, url, **kwargs, **(body() if body else {}))
+            if resp.status_code != 429:
+                if resp.status_code < 400:
+                    self.limiter.on_success()
+                return resp
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            self.limiter.on_throttle(retry_after or backoff_delay(attempt, base=1.0, cap=30.0))
+            logger.warning(f"VC.RU throttled {url} (429), rate → {self.limiter.rate:.2f} req/s")
+        raise RateLimited(f"429 Too Many Requests after {self.max_retries + 1} attempts: {url}", response=resp)
+
     # ─── Загрузка фото ───────────────────────────────────────────────────────
 
     def upload_image(self, image_path: str | Path) -> Optional[dict]:
         """
         Загружает изображение на VC.RU.
         Возвращает dict с uuid, width, height, url — или None при ошибке.
+        Уже загруженные файлы (по хэшу содержимого) берутся из upload_cache без запроса к API.
         """
         image_path = Path(image_path)
-        mime, _ = mimetypes.guess_type(str(image_path))
-        mime = mime or "image/jpeg"
-
         url = f"{self.base_url}/uploader/upload"
         try:
-            with open(image_path, "rb") as f:
-                resp = self.session.post(
-                    url,
-                    files={"file": (image_path.name, f, mime)},
-                    timeout=60,
-                )
+            # Загружаем уменьшенную копию без EXIF (images.prepare_image)
+            prepared = prepare_image(image_path)
+            upload_path = prepared.path
+            mime, _ = mimetypes.guess_type(str(upload_path))
+            mime = mime or "image/jpeg"
+
+            digest = file_hash(upload_path) if self.use_upload_cache else None
+            if digest:
+                cached = upload_cache.get(digest, self.base_url)
+                if cached:
+                    logger.info(f"Image cached: {image_path.name} → {cached.get('url', '?')}")
+                    return cached
+            # Тело multipart отдаётся потоком: в памяти не больше одного куска файла
+            bodies: list[StreamingMultipart] = []
+
+            def body():
+                encoder = StreamingMultipart("file", upload_path, image_path.stem + upload_path.suffix, mime)
+                bodies.append(encoder)
+                return {"data": encoder, "headers": {"Content-Type": encoder.content_type}}
+
+            try:
+                resp = self._request("POST", url, body=body, timeout=60)
+            finally:
+                for encoder in bodies:
+                    encoder.close()
             resp.raise_for_status()
             data = resp.json()
             img_data = (
@@ -61,12 +235,40 @@ class VcPublisher:
                 or data.get("data")
                 or data
             )
+            # Реальные размеры — чтобы _image_block не подставлял 1200×630 по умолчанию
+            if prepared.width and not img_data.get("width"):
+                img_data["width"], img_data["height"] = prepared.width, prepared.height
             logger.info(f"Image uploaded: {image_path.name} → {img_data.get('url', '?')}")
+            if digest:
+                upload_cache.put(digest, self.base_url, img_data)
             return img_data
         except Exception as e:
             logger.error(f"Upload failed for {image_path.name}: {e}")
             return None
 
+    def upload_images(self, image_paths: list[str | Path]) -> list[dict]:
+        """
+        Загружает фото параллельно (не более upload_concurrency одновременно).
+        Порядок результатов совпадает с image_paths, неудачные загрузки пропускаются.
+        """
+        if not image_paths:
+            return []
+        workers = min(self.upload_concurrency, len(image_paths))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vc-upload") as pool:
+            results = list(pool.map(self.upload_image, image_paths))
+        return [img for img in results if img]
+
+    def prefetch_uploads(self, image_paths: list[str | Path]) -> Future:
+        """
+        Запускает upload_images в фоне и сразу возвращает Future со списком результатов —
+        фото загружаются, пока идёт генерация статьи. Результат передаётся
+        в publish_article(uploaded_images=...), а загрузки в любом случае попадают в upload_cache.
+        """
+        with self._prefetch_lock:
+            if self._prefetch_pool is None:
+                self._prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="vc-prefetch")
+        return self._prefetch_pool.submit(self.upload_images, list(image_paths))
+
     # ─── Сборка блоков контента (EditorJS) ───────────────────────────────────
 
     @staticmethod
@@ -154,12 +356,138 @@ class VcPublisher:
         blocks: list[dict],
         subsite_id: Optional[int] = None,
         publish: bool = False,
+        publish_key: Optional[str] = None,
+        images: Optional[list[dict]] = None,
     ) -> Optional[dict]:
         """
         Создаёт запись на VC.RU.
         publish=False → сохраняет как черновик.
         publish=True  → публикует немедленно.
+
+        Идемпотентно по publish_key (по умолчанию: содержимое статьи + субсайт + режим).
+        Уже созданная запись возвращается из publish_log без повторной публикации.
+        Ключ захватывается в журнале: если его держит другой публикатор, ждём до
+        CLAIM_WAIT секунд его результата, затем PublishInProgress — без запроса к API.
+        Временные ошибки повторяются с backoff; после неоднозначного сбоя
+        (таймаут, обрыв, 5xx) сначала проверяем, не появилась ли запись на VC.RU.
+        images — загруженные фото из blocks; запоминаются для update-режима.
+        """
+        key = publish_key or publish_log.make_key(article, subsite_id, publish)
+        owner = uuid.uuid4().hex
+        record = self._claim_key(key, article.title, subsite_id, owner)
+        if record and record["status"] == "done":
+            logger.info(f"Already on VC.RU, not creating again: «{article.title}» → {record['url']}")
+            return record["entry"] or {"id": record["entry_id"], "url": record["url"]}
+        try:
+            return self._create_claimed(key, owner, record, article, blocks, subsite_id, publish, images)
+        finally:
+            # После mark_done или forget ключа уже нет за нами — release ничего не меняет
+            publish_log.release(key, owner)
+
+    def _claim_key(self, key: str, title: str, subsite_id: Optional[int], owner: str) -> Optional[dict]:
+        """Захватывает ключ публикации, дожидаясь другого публикатора. Возвращает прежнюю запись журнала."""
+        deadline = time.monotonic() + CLAIM_WAIT
+        while True:
+            claimed, record = publish_log.claim(key, title, subsite_id, owner)
+            if claimed or record["status"] == "done":
+                return record
+            if time.monotonic() >= deadline:
+                raise PublishInProgress(
+                    f"«{title}» is being published by another worker; not posting a duplicate"
+                )
+            time.sleep(_CLAIM_POLL)
+
+    def _create_claimed(
+        self,
+        key: str,
+        owner: str,
+        record: Optional[dict],
+        article: GeneratedArticle,
+        blocks: list[dict],
+        subsite_id: Optional[int],
+        publish: bool,
+        images: Optional[list[dict]],
+    ) -> Optional[dict]:
+        """create_entry под захваченным ключом: record — запись журнала до захвата."""
+        if record and record["status"] == "pending":
+            # Прошлая попытка закончилась с неизвестным исходом
+            existing = self._find_created_entry(key, article.title, subsite_id)
+            if existing:
+                return existing
+
+        payload = self._entry_payload(article, blocks, subsite_id, publish)
+        url = f"{self.base_url}/entry/create"
+
+        for attempt in range(self.max_retries + 1):
+            if not publish_log.renew(key, owner):
+                raise PublishInProgress(f"Lost the publish key of «{article.title}»; not posting a duplicate")
+            try:
+                resp = self._request("POST", url, data=payload, timeout=30)
+                resp.raise_for_status()
+                entry = _parse_entry(resp.json())
+            except Exception as e:
+                transient, ambiguous = _classify_error(e)
+                if not transient or attempt >= self.max_retries:
+                    if not ambiguous:
+                        # Запись точно не создана — повторный вызов начнёт с чистого листа
+                        publish_log.forget(key, owner)
+                    raise _api_error("create_entry", e)
+                if ambiguous:
+                    existing = self._find_created_entry(key, article.title, subsite_id)
+                    if existing:
+                        return existing
+                delay = _retry_delay(e, attempt)
+                logger.warning(f"create_entry: {e} — retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            publish_log.mark_done(key, entry, title=article.title, blocks=blocks, images=images, published=publish)
+            entry_id = entry.get("id") or entry.get("entryId")
+            entry_url = entry.get("url") or f"https://vc.ru/u/me/{entry_id}"
+            logger.info(
+                f"{'Published' if publish else 'Draft saved'}: «{article.title}» → {entry_url}"
+            )
+            return entry
+
+    def update_entry(
+        self,
+        entry_id: int | str,
+        article: GeneratedArticle,
+        blocks: list[dict],
+        subsite_id: Optional[int] = None,
+        publish: bool = False,
+    ) -> dict:
+        """
+        Редактирует существующую запись (entry/edit) — фото не перезагружаются,
+        новая запись не создаётся. Правка идемпотентна, поэтому временные ошибки просто повторяются.
         """
+        payload = self._entry_payload(article, blocks, subsite_id, publish)
+        payload["id"] = str(entry_id)
+        url = f"{self.base_url}/entry/edit"
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = self._request("POST", url, data=payload, timeout=30)
+                resp.raise_for_status()
+                entry = _parse_entry(resp.json())
+            except Exception as e:
+                transient, _ = _classify_error(e)
+                if not transient or attempt >= self.max_retries:
+                    raise _api_error("update_entry", e)
+                delay = _retry_delay(e, attempt)
+                logger.warning(f"update_entry: {e} — retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            entry.setdefault("id", entry_id)
+            logger.info(f"Entry updated: «{article.title}» → {entry.get('url') or entry_id}")
+            return entry
+
+    @staticmethod
+    def _entry_payload(
+        article: GeneratedArticle,
+        blocks: list[dict],
+        subsite_id: Optional[int],
+        publish: bool,
+    ) -> dict:
         payload = {
             "title": article.title,
             "text": json.dumps({"blocks": blocks, "version": "2.14"}),
@@ -168,27 +496,50 @@ class VcPublisher:
             payload["subsite_id"] = str(subsite_id)
         if not publish:
             payload["is_published"] = "0"
-        url = f"{self.base_url}/entry/create"
+        return payload
 
+    def find_entry(
+        self,
+        title: str,
+        subsite_id: Optional[int] = None,
+        exclude_ids: set[str] = frozenset(),
+    ) -> Optional[dict]:
+        """
+        Ищет запись с таким заголовком среди последних записей автора (или субсайта).
+        exclude_ids — id записей, которые заведомо не подходят (другие статьи с тем же заголовком).
+        Ошибки запроса пробрасываются: «не нашли» и «не смогли проверить» — разные ответы.
+        """
+        if subsite_id:
+            url = f"{self.base_url}/subsite/{subsite_id}/timeline/new"
+        else:
+            url = f"{self.base_url}/user/me/entries"
+        resp = self._request("GET", url, params={"count": 50}, timeout=15)
+        resp.raise_for_status()
+        result = resp.json().get("result", [])
+        items = result.get("items", []) if isinstance(result, dict) else result
+        wanted = title.strip().casefold()
+        for item in items:
+            entry = item.get("data", item) if isinstance(item, dict) else {}
+            if not isinstance(entry, dict) or str(entry.get("id")) in exclude_ids:
+                continue
+            if (entry.get("title") or "").strip().casefold() == wanted:
+                return entry
+        return None
+
+    def _find_created_entry(self, key: str, title: str, subsite_id: Optional[int]) -> Optional[dict]:
+        """Проверяет, создал ли запись предыдущий запрос. Если проверить нельзя — не рискуем дублем."""
         try:
-            resp = self.session.post(url, data=payload, timeout=30)
-            resp.raise_for_status()
-            data = resp.json()
-            entry = data.get("result", {}).get("entry") or data.get("entry") or data
-            entry_id = entry.get("id") or entry.get("entryId")
-            entry_url = entry.get("url") or f"https://vc.ru/u/me/{entry_id}"
-            logger.info(
-                f"{'Published' if publish else 'Draft saved'}: «{article.title}» → {entry_url}"
-            )
-            return entry
+            # Записи других статей с тем же заголовком уже есть в журнале — их не принимаем за свою
+            entry = self.find_entry(title, subsite_id, exclude_ids=publish_log.entry_ids(title, key))
         except Exception as e:
-            api_response = ""
-            if hasattr(e, "response") and e.response is not None:
-                api_response = e.response.text[:500]
-                logger.error(f"create_entry failed: {e} | Response: {api_response}")
-            else:
-                logger.error(f"create_entry failed: {e}")
-            raise RuntimeError(f"VC.RU API error: {e}" + (f" | {api_response}" if api_response else ""))
+            raise RuntimeError(
+                f"VC.RU API error: cannot verify whether «{title}» was already created ({e}); "
+                f"not retrying to avoid a duplicate post"
+            )
+        if entry:
+            logger.info(f"Entry «{title}» was created by an earlier attempt — not posting again")
+            publish_log.mark_done(key, entry)
+        return entry
 
     def publish_article(
         self,
@@ -196,35 +547,102 @@ class VcPublisher:
         image_paths: list[str | Path],
         subsite_id: Optional[int] = None,
         publish: bool = False,
+        publish_key: Optional[str] = None,
+        update: bool = False,
+        uploaded_images: Optional[list[dict]] = None,
     ) -> Optional[dict]:
         """
         Полный цикл: загрузить фото → собрать блоки → создать запись.
         Возвращает dict записи или None при ошибке.
+        publish_key — ключ идемпотентности (см. create_entry).
+        update=True — если по этому ключу запись уже создана, она редактируется на месте
+        (для правок нужен постоянный publish_key, не зависящий от заголовка).
+        uploaded_images — уже загруженные фото (см. prefetch_uploads); тогда image_paths не загружаются.
         """
-        uploaded = []
-        for path in image_paths:
-            img = self.upload_image(path)
-            if img:
-                uploaded.append(img)
+        key = publish_key or publish_log.make_key(article, subsite_id, publish)
+        if update:
+            record = publish_log.get(key)
+            if record and record["status"] == "done" and record["entry_id"]:
+                return self._update_published(key, record, article, image_paths, subsite_id, publish)
+
+        if uploaded_images is not None:
+            uploaded = uploaded_images
+        else:
+            uploaded = self.upload_images(image_paths)
 
         blocks = self.build_blocks(article, uploaded)
 
-        return self.create_entry(
+        entry = self.create_entry(
             article=article,
             blocks=blocks,
             subsite_id=subsite_id,
             publish=publish,
+            publish_key=key,
+            images=uploaded,
         )
+        if update:
+            record = publish_log.get(key)
+            if record and record["status"] == "done" and record["entry_id"] and record["blocks"] is not None:
+                # Пока мы ждали ключ, запись мог создать другой публикатор со своей версией статьи —
+                # доводим её до нашей (если версии совпадают, запроса к API не будет)
+                return self._update_published(key, record, article, image_paths, subsite_id, publish)
+        return entry
+
+    def _update_published(
+        self,
+        key: str,
+        record: dict,
+        article: GeneratedArticle,
+        image_paths: list[str | Path],
+        subsite_id: Optional[int],
+        publish: bool,
+    ) -> dict:
+        """Сравнивает новые блоки с отправленными в прошлый раз и правит запись, только если есть отличия."""
+        # Фото уже на VC.RU — берём те же, загружаем только если их не запомнили
+        if record["images"] is not None:
+            images = record["images"]
+        elif image_paths:
+            images = self.upload_images(image_paths)
+        else:
+            # Иначе правка убрала бы из опубликованной записи все фото
+            raise PublishError(
+                f"Photos of entry {record['entry_id']} are unknown and none were given; "
+                f"not updating «{article.title}» to avoid stripping its images",
+                transient=False,
+            )
+        blocks = self.build_blocks(article, images)
+
+        changes = diff_blocks(record["blocks"] or [], blocks)
+        same_state = record["published"] is not None and bool(record["published"]) == publish
+        if not changes and record["title"] == article.title and same_state:
+            logger.info(f"No changes in «{article.title}» — entry {record['entry_id']} left as is")
+            return record["entry"] or {"id": record["entry_id"], "url": record["url"]}
+
+        changed_blocks = sum(max(i2 - i1, j2 - j1) for _, i1, i2, j1, j2 in changes)
+        logger.info(f"Updating entry {record['entry_id']}: {changed_blocks} of {len(blocks)} blocks changed")
+        entry = self.update_entry(record["entry_id"], article, blocks, subsite_id, publish)
+        publish_log.mark_done(key, entry, title=article.title, blocks=blocks, images=images, published=publish)
+        return entry
 
-    def check_token(self) -> dict:
-        """Проверяет валидность токена. Возвращает {'ok': bool, 'user': str, 'error': str}."""
+    def check_token(self, max_age: float = 0) -> dict:
+        """
+        Проверяет валидность токена. Возвращает {'ok': bool, 'user': str, 'error': str}.
+        max_age > 0 — успешный результат не старше max_age секунд берётся из кэша без запроса.
+        """
+        with self._token_check_lock:
+            cached, checked_at = self._token_check
+            if cached and max_age > 0 and time.monotonic() - checked_at < max_age:
+                return dict(cached)
         try:
-            resp = self.session.get(f"{self.base_url}/auth/me", timeout=15)
+            resp = self._request("GET", f"{self.base_url}/auth/me", timeout=15)
             resp.raise_for_status()
             data = resp.json()
             user = data.get("result", {})
             name = user.get("name") or user.get("login") or str(user.get("id", "?"))
-            return {"ok": True, "user": name}
+            result = {"ok": True, "user": name}
+            with self._token_check_lock:
+                self._token_check = (result, time.monotonic())
+            return dict(result)
         except Exception as e:
             api_response = ""
             if hasattr(e, "response") and e.response is not None:
@@ -0,0 +1,130 @@
+"""
+Политики повторов для внешних API.
+Экспоненциальная задержка с джиттером, разбор заголовка Retry-After
+и общий ограничитель параллельности, который умеет притормозить всех сразу.
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Задержка перед повтором № attempt (с нуля): «full jitter» в [0, min(cap, base·2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает Retry-After: число секунд или HTTP-дата. Возвращает секунды или None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class ConcurrencyGate:
+    """
+    Ограничивает число одновременных вызовов API внутри процесса.
+    pause() ставит на паузу всех участников — когда сервер сообщает о перегрузке,
+    параллельные задачи замедляются вместе, а не штурмуют API по очереди.
+    """
+
+    def __init__(self, limit: int):
+        self._sem = threading.BoundedSemaphore(max(1, limit))
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_pause(self) -> None:
+        while True:
+            with self._lock:
+                remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    @contextmanager
+    def slot(self):
+        self._wait_pause()
+        with self._sem:
+            # Пауза могла начаться, пока мы ждали свободный слот
+            self._wait_pause()
+            yield
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket с адаптивной скоростью (AIMD), общий для потоков.
+    Каждый 429 вдвое снижает скорость и, если сервер прислал Retry-After,
+    останавливает всех до указанного момента; успешные ответы понемногу
+    возвращают скорость к максимуму. Так limiter держится у предела, который принимает API.
+    """
+
+    def __init__(
+        self,
+        rate: float = 2.0,
+        max_rate: float = 10.0,
+        min_rate: float = 0.1,
+        increase: float = 0.05,
+    ):
+        self._rate = rate
+        self._max_rate = max_rate
+        self._min_rate = min_rate
+        self._increase = increase
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        """Текущая разрешённая скорость, запросов в секунду."""
+        return self._rate
+
+    def acquire(self) -> None:
+        """Блокируется, пока не будет разрешён следующий запрос."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                else:
+                    # Ёмкость ведра — примерно секунда запросов на текущей скорости
+                    capacity = max(1.0, self._rate)
+                    self._tokens = min(capacity, self._tokens + (now - self._updated) * self._rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self._rate = min(self._max_rate, self._rate + self._increase)
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._rate = max(self._min_rate, self._rate / 2)
+            self._tokens = 0.0
+            self._updated = now
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
@@ -0,0 +1,79 @@
+"""
+Локальное хранилище состояния бота (SQLite в режиме WAL).
+Один файл базы делят все процессы — cron, веб-интерфейс, воркеры;
+каждому потоку выдаётся своё соединение.
+"""
+
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import config
+
+_local = threading.local()
+_instance_id = uuid.uuid4().hex
+
+
+def _new_instance_id() -> None:
+    global _instance_id
+    _instance_id = uuid.uuid4().hex
+
+
+# Процесс после fork — уже другой экземпляр (gunicorn с preload_app)
+os.register_at_fork(after_in_child=_new_instance_id)
+
+
+def instance_id() -> str:
+    """
+    Идентификатор этого запуска процесса. В отличие от PID не повторяется
+    после перезапуска (в контейнере PID 1 будет у каждого нового запуска) —
+    по нему строки в базе помечаются владельцем.
+    """
+    return _instance_id
+
+
+def connect(schema: str = "", path: str | Path | None = None) -> sqlite3.Connection:
+    """
+    Возвращает соединение текущего потока с базой состояния.
+    schema — DDL с `CREATE ... IF NOT EXISTS`, выполняется один раз на соединение.
+    """
+    path = str(path or config.STATE_DB)
+    conns = _local.__dict__.setdefault("conns", {})
+    entry = conns.get(path)
+    if entry is None:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        entry = conns[path] = (conn, set())
+    conn, applied = entry
+    if schema and schema not in applied:
+        conn.executescript(schema)
+        applied.add(schema)
+    return conn
+
+
+@contextmanager
+def transaction(schema: str = "", path: str | Path | None = None):
+    """
+    Транзакция с блокировкой на запись (BEGIN IMMEDIATE): читаем и пишем
+    атомарно относительно других потоков и процессов.
+    """
+    conn = connect(schema, path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+
+def scalar(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> Optional[object]:
+    row = conn.execute(sql, params).fetchone()
+    return row[0] if row else None
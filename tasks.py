@@ -0,0 +1,194 @@
+"""
+Реестр фоновых задач веб-интерфейса (генерация статьи и т.п.).
+Состояние каждой задачи пишется в базу состояния — оно переживает перезапуск
+и видно всем процессам. В памяти держится ограниченный LRU-кэш; завершённые
+задачи удаляются из базы через TASK_TTL секунд.
+
+Незавершённую задачу ведёт процесс, который последним обновил её состояние:
+он продлевает аренду (lease_until), пока жив. Задача с истёкшей арендой
+считается прерванной — так клиент не ждёт вечно задачу умершего процесса.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import config
+import storage
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ("done", "error", "cancelled")
+_PURGE_INTERVAL = 60       # Не чаще раза в минуту чистим устаревшие задачи в базе
+_POLL_INTERVAL = 1.0       # Как часто wait() заглядывает в базу (задачу может вести другой процесс)
+LEASE_SECONDS = 60         # Аренда незавершённой задачи; продлевается каждые LEASE_SECONDS / 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id          TEXT    PRIMARY KEY,
+    state       TEXT    NOT NULL,
+    seq         INTEGER NOT NULL,
+    final       INTEGER NOT NULL,
+    instance    TEXT    NOT NULL,       -- запуск процесса, который последним обновил задачу
+    lease_until REAL,                   -- NULL — задачу никто не ведёт (завершена или ждёт в очереди)
+    updated_at  REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_final ON tasks (final, updated_at);
+"""
+
+
+def _db():
+    return storage.connect(_SCHEMA)
+
+
+class TaskRegistry:
+    """
+    Состояния задач: {"status", "seq", ...поля}. seq растёт с каждым обновлением —
+    по нему SSE-поток понимает, что пора отправить событие.
+    """
+
+    def __init__(self, ttl: float = config.TASK_TTL, max_cached: int = config.TASK_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self._cache: OrderedDict[str, dict] = OrderedDict()
+        self._changed = threading.Condition()
+        self._owned: set[str] = set()
+        self._heartbeat: Optional[threading.Thread] = None
+        self._purged_at = 0.0
+
+    def set(self, task_id: str, status: str, lease: bool = True, **fields) -> dict:
+        """
+        Обновляет состояние задачи, сохраняет его и будит ожидающих wait().
+        Незавершённую задачу этот процесс теперь ведёт и продлевает её аренду;
+        lease=False — задачу никто не ведёт (ждёт в очереди), аренды нет.
+        """
+        final = status in FINAL_STATUSES
+        leased = lease and not final
+        with self._changed:
+            prev = self.get(task_id)
+            state = {"status": status, "seq": (prev or {}).get("seq", 0) + 1, **fields}
+            now = time.time()
+            _db().execute(
+                "INSERT OR REPLACE INTO tasks (id, state, seq, final, instance, lease_until, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    task_id, json.dumps(state, ensure_ascii=False), state["seq"], int(final),
+                    storage.instance_id(), now + LEASE_SECONDS if leased else None, now,
+                ),
+            )
+            self._remember(task_id, state)
+            if leased:
+                self._owned.add(task_id)
+            else:
+                self._owned.discard(task_id)
+            self._changed.notify_all()
+        if leased:
+            self._ensure_heartbeat()
+        self._purge()
+        return state
+
+    def get(self, task_id: str) -> Optional[dict]:
+        """Состояние задачи из памяти, иначе из базы (после перезапуска или из другого процесса)."""
+        with self._changed:
+            state = self._cache.get(task_id)
+            if state is not None and state["status"] in FINAL_STATUSES:
+                self._cache.move_to_end(task_id)
+                return dict(state)
+        # Незавершённую задачу может вести другой процесс — её читаем из базы
+        row = _db().execute("SELECT state, final, lease_until FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if row is None:
+            return None
+        if not row["final"] and row["lease_until"] is not None and row["lease_until"] < time.time():
+            return self._expire(task_id)
+        state = json.loads(row["state"])
+        with self._changed:
+            self._remember(task_id, state)
+        return dict(state)
+
+    def discard(self, task_id: str) -> None:
+        with self._changed:
+            self._cache.pop(task_id, None)
+            self._owned.discard(task_id)
+            _db().execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def wait(self, task_id: str, seen: int, timeout: float) -> Optional[dict]:
+        """
+        Ждёт, пока seq задачи станет отличен от `seen` (или задача пропадёт), не дольше timeout.
+        Возвращает текущее состояние (None — задачи нет).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            state = self.get(task_id)
+            remaining = deadline - time.monotonic()
+            if state is None or state["seq"] != seen or remaining <= 0:
+                return state
+            with self._changed:
+                self._changed.wait(min(remaining, _POLL_INTERVAL))
+
+    # ─── Внутреннее ──────────────────────────────────────────────────────────
+
+    def _remember(self, task_id: str, state: dict) -> None:
+        """Кладёт состояние в LRU-кэш; вытесняет самые давние завершённые задачи."""
+        self._cache[task_id] = state
+        self._cache.move_to_end(task_id)
+        excess = len(self._cache) - self.max_cached
+        if excess > 0:
+            for old_id in [k for k, v in self._cache.items() if v["status"] in FINAL_STATUSES][:excess]:
+                del self._cache[old_id]
+
+    def _ensure_heartbeat(self) -> None:
+        with self._changed:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._renew_leases, name="task-leases", daemon=True)
+                self._heartbeat.start()
+
+    def _renew_leases(self) -> None:
+        """Продлевает аренду задач, которые ведёт этот процесс; чужие и завершённые забывает."""
+        while True:
+            time.sleep(LEASE_SECONDS / 4)
+            with self._changed:
+                owned = list(self._owned)
+            try:
+                conn = _db()
+                until = time.time() + LEASE_SECONDS
+                for task_id in owned:
+                    cur = conn.execute(
+                        "UPDATE tasks SET lease_until = ? WHERE id = ? AND instance = ? AND final = 0 "
+                        "AND lease_until IS NOT NULL",
+                        (until, task_id, storage.instance_id()),
+                    )
+                    if not cur.rowcount:
+                        with self._changed:
+                            self._owned.discard(task_id)
+            except Exception as e:
+                logger.error(f"Cannot renew task leases: {e}")
+
+    def _expire(self, task_id: str) -> Optional[dict]:
+        """Задачу с истёкшей арендой помечает ошибкой (если её не успели продлить или обновить)."""
+        now = time.time()
+        with storage.transaction(_SCHEMA) as tx:
+            expired = tx.execute(
+                "SELECT 1 FROM tasks WHERE id = ? AND final = 0 AND lease_until < ?", (task_id, now)
+            ).fetchone()
+            if expired:
+                # Снимаем аренду сразу — другой читатель не пометит задачу второй раз
+                tx.execute("UPDATE tasks SET lease_until = NULL WHERE id = ?", (task_id,))
+        if not expired:
+            return self.get(task_id)
+        logger.warning(f"Task {task_id} lease expired — its process is gone")
+        return self.set(task_id, "error", stage="error", error="Задача прервана перезапуском сервера")
+
+    def _purge(self) -> None:
+        now = time.time()
+        if now - self._purged_at < _PURGE_INTERVAL:
+            return
+        self._purged_at = now
+        cur = _db().execute("DELETE FROM tasks WHERE final = 1 AND updated_at < ?", (now - self.ttl,))
+        if cur.rowcount:
+            logger.info(f"Purged {cur.rowcount} finished tasks older than {self.ttl:.0f}s")
+        # Задачи с истёкшей арендой, которые никто не спрашивает
+        for row in _db().execute("SELECT id FROM tasks WHERE final = 0 AND lease_until < ?", (now,)).fetchall():
+            self._expire(row["id"])
@@ -0,0 +1,58 @@
+"""
+Общие фикстуры тестов. Модули бота лежат в корне репозитория — добавляем его в sys.path.
+Каждый тест получает свою базу состояния, папку статей и кэш фото; фоновые потоки,
+пережившие тест, пишут во временную папку сессии, а не в рабочую папку бота.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import articles  # noqa: E402
+import config  # noqa: E402
+from fake_osnova import FakeOsnova, FakeOsnovaOptions  # noqa: E402
+from generator import GeneratedArticle  # noqa: E402
+
+_session_dir = Path(tempfile.mkdtemp(prefix="seo-bot-tests-"))
+config.STATE_DB = str(_session_dir / "bot_state.db")
+config.IMAGE_CACHE_DIR = str(_session_dir / "image_cache")
+# app при импорте создаёт папку статей — до импорта она должна смотреть во временную
+articles.ARTICLES_DIR = _session_dir / "articles"
+
+
+@pytest.fixture(autouse=True)
+def state_db(tmp_path, monkeypatch):
+    path = tmp_path / "bot_state.db"
+    monkeypatch.setattr(config, "STATE_DB", str(path))
+    monkeypatch.setattr(config, "IMAGE_CACHE_DIR", str(tmp_path / "image_cache"))
+    (tmp_path / "articles").mkdir()
+    monkeypatch.setattr(articles, "ARTICLES_DIR", tmp_path / "articles")
+    if "app" in sys.modules:
+        monkeypatch.setattr(sys.modules["app"], "ARTICLES_DIR", articles.ARTICLES_DIR)
+    return path
+
+
+@pytest.fixture
+def fake_api():
+    """Заглушка Osnova API; опции можно менять прямо в тесте: fake_api.options.rate_429 = 1.0."""
+    with FakeOsnova(options=FakeOsnovaOptions(retry_after=0.01)) as api:
+        yield api
+
+
+@pytest.fixture
+def make_article():
+    """Фабрика статей: make_article(title=..., intro=...)."""
+    def make(title: str = "Как выбрать массажное кресло", intro: str = "Вступление.") -> GeneratedArticle:
+        return GeneratedArticle(
+            title=title,
+            intro=intro,
+            sections=[{"heading": "Раздел", "paragraphs": ["Абзац."], "list_items": [], "has_image_placeholder": True}],
+            conclusion="Вывод.",
+            meta_description="Описание",
+            keywords=["массажное кресло"],
+        )
+    return make
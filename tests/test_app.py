@@ -0,0 +1,30 @@
+"""API веб-интерфейса: список статей и статус их публикации."""
+
+import pytest
+
+import app
+import articles
+import config
+import publish_log
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def test_article_list_shows_publish_state(client, make_article):
+    published = articles.save(make_article(title="Опубликованная"), articles_dir=app.ARTICLES_DIR)
+    draft = articles.save(make_article(title="Черновик"), articles_dir=app.ARTICLES_DIR)
+    articles.save(make_article(title="Не отправлялась"), articles_dir=app.ARTICLES_DIR)
+    for path, is_published in ((published, True), (draft, False)):
+        key = publish_log.article_key(path.name, config.VC_SUBSITE_ID)
+        publish_log.claim(key, path.stem, config.VC_SUBSITE_ID, "test")
+        publish_log.mark_done(key, {"id": 1, "url": f"https://vc.ru/{path.stem}"}, published=is_published)
+
+    by_title = {a["title"]: a["publish"] for a in client.get("/api/articles").get_json()}
+
+    assert by_title["Опубликованная"]["published"] is True
+    assert by_title["Черновик"]["status"] == "done"
+    assert by_title["Черновик"]["published"] is False
+    assert by_title["Не отправлялась"] is None
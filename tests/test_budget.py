@@ -0,0 +1,72 @@
+"""Бюджет токенов: резерв, расчёт по факту, отмена и ожидание освобождения окна."""
+
+import time
+
+import pytest
+
+import budget
+from budget import BudgetExceeded, TokenBudget
+
+
+def test_headroom_lowers_limits():
+    b = TokenBudget(per_minute=1000, per_day=0, headroom=0.9)
+    assert b.per_minute == 900
+    assert b.per_day == 0
+
+
+def test_reserve_settle_and_release():
+    b = TokenBudget(per_minute=1000, per_day=5000, headroom=1.0, max_wait=0)
+    first = b.reserve(400)
+    second = b.reserve(300)
+    assert b.usage()["tokens_last_minute"] == 700
+
+    b.settle(first, 150)
+    b.release(second)
+    usage = b.usage()
+    assert usage["tokens_last_minute"] == 150
+    assert usage["tokens_last_day"] == 150
+
+
+def test_over_limit_is_rejected_without_waiting():
+    b = TokenBudget(per_minute=1000, per_day=0, headroom=1.0, max_wait=600)
+    started = time.monotonic()
+    with pytest.raises(BudgetExceeded):
+        b.reserve(1001)
+    assert time.monotonic() - started < 1
+
+
+def test_full_window_rejects_when_wait_exceeds_max_wait():
+    b = TokenBudget(per_minute=1000, per_day=0, headroom=1.0, max_wait=1)
+    b.reserve(800)
+    with pytest.raises(BudgetExceeded, match="max wait"):
+        b.reserve(300)
+
+
+def test_reserve_waits_for_the_window_to_free_up(monkeypatch):
+    monkeypatch.setattr(budget, "MINUTE", 0.5)
+    b = TokenBudget(per_minute=1000, per_day=0, headroom=1.0, max_wait=5)
+    b.reserve(800)
+
+    started = time.monotonic()
+    b.reserve(300)
+    # Ждём ровно до выхода первого резерва из «минутного» окна
+    assert 0.4 <= time.monotonic() - started < 2
+
+
+def test_day_limit_applies_too():
+    b = TokenBudget(per_minute=0, per_day=1000, headroom=1.0, max_wait=0)
+    b.reserve(900)
+    with pytest.raises(BudgetExceeded):
+        b.reserve(200)
+
+
+def test_reservation_releases_on_error_and_settles_on_success():
+    b = TokenBudget(per_minute=1000, per_day=0, headroom=1.0, max_wait=0)
+    with pytest.raises(ValueError):
+        with b.reservation(500):
+            raise ValueError("request failed")
+    assert b.usage()["tokens_last_minute"] == 0
+
+    with b.reservation(500) as settle:
+        settle(120)
+    assert b.usage()["tokens_last_minute"] == 120
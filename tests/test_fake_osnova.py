@@ -0,0 +1,16 @@
+"""Заглушка Osnova API: записанные запросы видны сразу после ответа."""
+
+import requests
+
+
+def test_request_is_recorded_before_response(fake_api):
+    with requests.Session() as session:
+        for i in range(1, 21):
+            session.post(f"{fake_api.url}/entry/create", data={"title": f"t{i}"}, timeout=5)
+            assert fake_api.count("/entry/create", status=200) == i
+
+
+def test_edit_of_unknown_entry_is_404(fake_api):
+    resp = requests.post(f"{fake_api.url}/entry/edit", data={"id": "5"}, timeout=5)
+    assert resp.status_code == 404
+    assert fake_api.count("/entry/edit", status=404) == 1
@@ -0,0 +1,151 @@
+"""Повторы запросов к Claude: какие ошибки временные, задержка от сервера, общая пауза."""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import anthropic
+import pytest
+
+import config
+import generator
+import storage
+from retry import ConcurrencyGate
+
+
+def _status_error(status: int, headers: dict | None = None) -> anthropic.APIStatusError:
+    response = SimpleNamespace(status_code=status, headers=headers or {}, request=None)
+    return anthropic.APIStatusError(f"HTTP {status}", response=response, body=None)
+
+
+def _message(text: str = "{}", tokens: tuple[int, int] = (10, 20)):
+    usage = SimpleNamespace(input_tokens=tokens[0], output_tokens=tokens[1])
+    return SimpleNamespace(content=[SimpleNamespace(text=text)], usage=usage)
+
+
+class _Client:
+    """Подставной клиент: messages.create по очереди отдаёт ответы или бросает ошибки."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.messages = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(config, "CLAUDE_MAX_RETRIES", 3)
+    monkeypatch.setattr(config, "CLAUDE_RETRY_BASE_DELAY", 0.01)
+    monkeypatch.setattr(config, "CLAUDE_RETRY_MAX_DELAY", 0.02)
+    monkeypatch.setattr(generator, "_claude_gate", ConcurrencyGate(2))
+
+
+@pytest.mark.parametrize("status", [408, 409, 429, 500, 503, 529])
+def test_transient_statuses_are_retryable(status):
+    assert generator._is_retryable(_status_error(status))
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404, 413])
+def test_client_errors_are_not_retryable(status):
+    assert not generator._is_retryable(_status_error(status))
+
+
+def test_connection_errors_are_retryable():
+    assert generator._is_retryable(anthropic.APIConnectionError(request=None))
+    assert generator._is_retryable(anthropic.APITimeoutError(request=None))
+    assert not generator._is_retryable(ValueError("bad json"))
+
+
+def test_server_retry_delay_prefers_milliseconds():
+    assert generator._server_retry_delay(_status_error(429, {"retry-after-ms": "1500", "retry-after": "9"})) == 1.5
+    assert generator._server_retry_delay(_status_error(429, {"retry-after-ms": "soon", "retry-after": "9"})) == 9.0
+    assert generator._server_retry_delay(_status_error(429, {"retry-after": "3"})) == 3.0
+    assert generator._server_retry_delay(_status_error(429)) is None
+    assert generator._server_retry_delay(anthropic.APIConnectionError(request=None)) is None
+
+
+def test_create_message_retries_until_success_and_settles_usage():
+    client = _Client(
+        _status_error(529, {"retry-after-ms": "10"}),
+        anthropic.APIConnectionError(request=None),
+        _message(tokens=(100, 200)),
+    )
+    message = generator._create_message(client, max_tokens=1000, messages=[{"role": "user", "content": "тема"}])
+
+    assert message.usage.output_tokens == 200
+    assert client.calls == 3
+    # Резервы неудачных попыток сняты, у удачной — фактический расход
+    rows = storage.connect().execute("SELECT tokens, pending FROM token_usage").fetchall()
+    assert [(r["tokens"], r["pending"]) for r in rows] == [(300, 0)]
+
+
+def test_create_message_gives_up_after_max_retries():
+    client = _Client(*[_status_error(503) for _ in range(4)])
+    with pytest.raises(anthropic.APIStatusError):
+        generator._create_message(client, max_tokens=10, messages=[])
+    assert client.calls == 4
+    assert storage.connect().execute("SELECT COUNT(*) FROM token_usage").fetchone()[0] == 0
+
+
+def test_create_message_does_not_retry_client_errors():
+    client = _Client(_status_error(400), _message())
+    with pytest.raises(anthropic.APIStatusError):
+        generator._create_message(client, max_tokens=10, messages=[])
+    assert client.calls == 1
+
+
+def test_overload_pauses_the_shared_gate(monkeypatch):
+    paused = []
+    monkeypatch.setattr(generator._claude_gate, "pause", paused.append)
+    client = _Client(_status_error(429, {"retry-after": "0"}), _status_error(500), _message())
+
+    generator._create_message(client, max_tokens=10, messages=[])
+    # Паузу для всех ставит только перегрузка (429/529), а не любая 5xx
+    assert paused == [0.0]
+
+
+def test_gate_pause_holds_every_caller():
+    gate = ConcurrencyGate(2)
+    gate.pause(0.2)
+    started = time.monotonic()
+    waited = []
+
+    def call():
+        with gate.slot():
+            waited.append(time.monotonic() - started)
+
+    threads = [threading.Thread(target=call) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(waited) == 2
+    assert min(waited) >= 0.19
+
+
+def test_gate_limits_concurrency():
+    gate = ConcurrencyGate(1)
+    inside, peak, lock = [0], [0], threading.Lock()
+
+    def call():
+        with gate.slot():
+            with lock:
+                inside[0] += 1
+                peak[0] = max(peak[0], inside[0])
+            time.sleep(0.05)
+            with lock:
+                inside[0] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 1
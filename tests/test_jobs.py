@@ -0,0 +1,110 @@
+"""Очередь генераций: общий лимит, переполнение, аренда и разбор брошенных задач."""
+
+import threading
+import time
+import uuid
+
+import pytest
+
+import jobs
+import storage
+
+
+@pytest.fixture
+def short_leases(monkeypatch):
+    monkeypatch.setattr(jobs, "LEASE_SECONDS", 0.8)
+
+
+def _wait(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_job_of_dead_process_is_reaped_and_live_one_is_not(short_leases):
+    done = []
+    q = jobs.JobQueue(1, 5, lambda job: (time.sleep(1.5), done.append(job.id)), name=f"lease-{uuid.uuid4().hex[:6]}")
+    # Задача, которую вёл умерший процесс (тот же PID у нового запуска не спасает)
+    jobs._db().execute(
+        "INSERT INTO jobs (id, queue, payload, priority, state, instance, lease_until, created_at, started_at) "
+        "VALUES ('orphan', ?, '{}', 0, 'running', 'dead-instance', ?, 0, 0)",
+        (q._name, time.time() - 1),
+    )
+    q.submit("live", {})
+    # Живая задача дольше аренды: её продлевает heartbeat, и она завершается успешно
+    _wait(lambda: done == ["live"])
+    stats = q.stats()
+    assert stats["failed"] == 1
+    assert stats["completed"] == 1
+
+
+def test_queue_full():
+    q = jobs.JobQueue(1, 1, lambda job: None, name=f"full-{uuid.uuid4().hex[:6]}")
+    # Воркеры не запускаются, пока нет submit — кладём задачу в обход и проверяем лимит
+    with storage.transaction(jobs._SCHEMA) as tx:
+        tx.execute(
+            "INSERT INTO jobs (id, queue, payload, priority, state, created_at) VALUES ('x', ?, '{}', 0, 'queued', 0)",
+            (q._name,),
+        )
+    with pytest.raises(jobs.QueueFull):
+        q.submit("y", {})
+
+
+def test_priority_and_cancel_before_start():
+    q = jobs.JobQueue(1, 5, lambda job: None, name=f"prio-{uuid.uuid4().hex[:6]}")
+    now = time.time()
+    with storage.transaction(jobs._SCHEMA) as tx:
+        for job_id, priority in (("low", 0), ("high", 5), ("low2", 0)):
+            tx.execute(
+                "INSERT INTO jobs (id, queue, payload, priority, state, created_at) VALUES (?, ?, '{}', ?, 'queued', ?)",
+                (job_id, q._name, priority, now),
+            )
+            now += 1
+    assert [q.position(j) for j in ("high", "low", "low2")] == [1, 2, 3]
+    assert q.cancel("low")
+    assert q.position("low") is None
+    assert q.position("low2") == 2
+    assert not q.cancel("low")
+
+
+def test_workers_limit_is_shared_by_all_processes():
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def handler(job):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.3)
+        with lock:
+            running[0] -= 1
+
+    # Две очереди с одним именем — как два процесса gunicorn с общей базой
+    name = f"gen-{uuid.uuid4().hex[:6]}"
+    a = jobs.JobQueue(2, 20, handler, name=name)
+    b = jobs.JobQueue(2, 20, handler, name=name)
+    for i in range(6):
+        (a if i % 2 else b).submit(f"job-{i}", {})
+    _wait(lambda: a.stats()["completed"] == 6)
+    assert peak[0] == 2
+
+
+def test_failed_handler_counts_as_failed():
+    def handler(job):
+        raise ValueError("boom")
+
+    q = jobs.JobQueue(1, 5, handler, name=f"fail-{uuid.uuid4().hex[:6]}")
+    q.submit("j", {})
+    _wait(lambda: q.stats()["failed"] == 1)
+    assert q.stats()["completed"] == 0
+
+
+def test_idle_claim_does_not_take_the_write_lock(monkeypatch):
+    q = jobs.JobQueue(1, 5, lambda job: None, name=f"idle-{uuid.uuid4().hex[:6]}")
+    jobs._db()
+
+    def locked(*args, **kwargs):
+        raise AssertionError("write transaction on an empty queue")
+
+    monkeypatch.setattr(storage, "transaction", locked)
+    assert q._claim() is None
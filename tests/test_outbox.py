@@ -0,0 +1,109 @@
+"""Очередь публикации: захват с арендой, повторы с задержкой, публикация на заглушке."""
+
+import time
+
+import config
+import outbox
+import publish_log
+from publisher import VcPublisher
+
+
+def test_items_of_one_key_are_not_sent_together(make_article):
+    key = publish_log.article_key("a.html", None)
+    first = outbox.enqueue(make_article(), [], publish_key=key)
+    second = outbox.enqueue(make_article(intro="Правка."), [], publish_key=key, update=True)
+    other = outbox.enqueue(make_article(title="Другая статья"), [])
+
+    assert outbox.claim()["id"] == first
+    # Правка той же записи ждёт, пока первая задача отправляется; другие задачи — нет
+    assert outbox.claim()["id"] == other
+    assert outbox.claim() is None
+
+    outbox.complete(first, {"id": 1000})
+    assert outbox.claim()["id"] == second
+
+
+def test_claim_is_exclusive_until_lease_expires(make_article, monkeypatch):
+    item_id = outbox.enqueue(make_article(), [])
+
+    item = outbox.claim()
+    assert item["id"] == item_id
+    assert item["attempts"] == 1
+    assert item["article"].title == make_article().title
+    # Задача «sending» с действующей арендой другому воркеру не достаётся
+    assert outbox.claim() is None
+
+    monkeypatch.setattr(outbox, "LEASE_SECONDS", -1)
+    item_id2 = outbox.enqueue(make_article(intro="Вторая."), [])
+    stale = outbox.claim()
+    assert stale["id"] == item_id2
+    # Аренда уже истекла — воркер, который её взял, считается упавшим
+    again = outbox.claim()
+    assert again["id"] == item_id2
+    assert again["attempts"] == 2
+
+
+def test_fail_backs_off_then_gives_up(make_article, monkeypatch):
+    monkeypatch.setattr(config, "OUTBOX_MAX_ATTEMPTS", 2)
+    item_id = outbox.enqueue(make_article(), [])
+
+    outbox.fail(item_id, 1, "boom")
+    state = outbox.get(item_id)
+    assert state["status"] == "queued"
+    assert state["last_error"] == "boom"
+    assert outbox.claim() is None     # следующая попытка — не раньше чем через ~15–30 с
+
+    outbox.fail(item_id, 2, "boom again")
+    assert outbox.get(item_id)["status"] == "failed"
+    assert outbox.pending_count() == 0
+
+
+def test_process_one_publishes_and_completes(fake_api, make_article):
+    pub = VcPublisher("token", base_url=fake_api.url, rate_limit=100, max_rate_limit=200)
+    item_id = outbox.enqueue(make_article(), [], publish=True)
+
+    assert outbox.process_one(pub) is True
+    state = outbox.get(item_id)
+    assert state["status"] == "done"
+    assert state["result"]["id"] == 1000
+    assert outbox.process_one(pub) is None
+    assert fake_api.count("/entry/create") == 1
+
+
+def test_process_one_reschedules_on_api_error(fake_api, make_article):
+    fake_api.options.rate_429 = 1.0
+    pub = VcPublisher("token", base_url=fake_api.url, max_retries=1, rate_limit=100, max_rate_limit=200)
+    item_id = outbox.enqueue(make_article(), [])
+
+    started = time.monotonic()
+    assert outbox.process_one(pub) is False
+    state = outbox.get(item_id)
+    assert state["status"] == "queued"
+    assert state["attempts"] == 1
+    assert "429" in state["last_error"]
+    assert time.monotonic() - started < 5
+
+
+def test_rejected_update_fails_without_retries(fake_api, make_article):
+    pub = VcPublisher("token", base_url=fake_api.url, rate_limit=100, max_rate_limit=200)
+    key = publish_log.article_key("a.html", None)
+    publish_log.claim(key, "Заголовок", None, "owner")
+    # Запись удалена на VC.RU: entry/edit отвечает 404, повтор через час ничего не изменит
+    publish_log.mark_done(key, {"id": 999, "url": "u"}, blocks=[], images=[], published=False)
+    item_id = outbox.enqueue(make_article(), [], publish_key=key, update=True)
+
+    assert outbox.process_one(pub) is False
+    state = outbox.get(item_id)
+    assert state["status"] == "failed"
+    assert state["attempts"] == 1
+    assert "404" in state["last_error"]
+
+
+def test_empty_queue_is_checked_without_write_lock(monkeypatch):
+    outbox.pending_count()
+
+    def locked(*args, **kwargs):
+        raise AssertionError("write transaction on an empty queue")
+
+    monkeypatch.setattr(outbox.storage, "transaction", locked)
+    assert outbox.claim() is None
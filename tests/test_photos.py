@@ -0,0 +1,73 @@
+"""Подбор фото: ротация с учётом тегов и возврат фото неудавшейся статьи."""
+
+from collections import Counter
+
+import pytest
+
+import photos
+import storage
+
+
+@pytest.fixture
+def photos_dir(tmp_path):
+    folder = tmp_path / "photos"
+    folder.mkdir()
+    for name in ("massage_chair_home.jpg", "massage_chair.jpg", "chair_office.jpg", "beach.jpg", "forest.jpg"):
+        (folder / name).write_bytes(name.encode() * 50)
+    return folder
+
+
+def _usage() -> dict[str, int]:
+    return {r["name"]: r["count"] for r in storage.connect().execute("SELECT name, count FROM photo_usage")}
+
+
+def test_release_returns_photos_to_rotation(photos_dir):
+    picked = photos.pick_photos(photos_dir, count=2, seed=3)
+    assert sum(_usage().values()) == 2
+
+    photos.release_photos(photos_dir, picked)
+    assert sum(_usage().values()) == 0
+    # Снимок счётчиков перестроен: те же фото снова наименее использованные
+    again = photos.pick_photos(photos_dir, count=5, seed=3)
+    assert len(again) == 5
+    assert set(_usage().values()) == {1}
+
+
+def test_without_keywords_least_used_go_first(photos_dir):
+    names = set()
+    for seed in range(5):
+        names.update(p.name for p in photos.pick_photos(photos_dir, count=1, seed=seed))
+    assert len(names) == 5
+    assert set(_usage().values()) == {1}
+
+
+def test_best_match_comes_first(photos_dir):
+    picked = photos.pick_photos(photos_dir, count=1, keywords=["massage chair home"], seed=1)
+    assert [p.name for p in picked] == ["massage_chair_home.jpg"]
+
+
+def test_relevant_photos_rotate_instead_of_repeating(photos_dir):
+    seen = Counter()
+    for seed in range(6):
+        picked = photos.pick_photos(photos_dir, count=1, keywords=["massage chair home"], seed=seed)
+        seen.update(p.name for p in picked)
+    # Лучшее по тегам фото не попадает в каждую статью, но подходящие идут раньше остальных
+    assert seen["massage_chair_home.jpg"] < 6
+    assert set(seen) <= {"massage_chair_home.jpg", "massage_chair.jpg", "chair_office.jpg"}
+
+
+def test_candidates_per_tag_are_capped(tmp_path):
+    folder = tmp_path / "library"
+    folder.mkdir()
+    for i in range(300):
+        (folder / f"chair_{i:03d}.jpg").write_bytes(f"photo {i}".encode() * 20)
+    infos = photos.photo_index(folder)
+    state = photos._UsageState(infos, 0, {"chair_000.jpg": 5})
+
+    # Тег есть у всех 300 фото, но в ранжирование идут только наименее использованные
+    relevant = state.relevant({photos._stem("chair")}, 6)
+    assert len(relevant) == 6
+    assert "chair_000.jpg" not in relevant
+
+    state.bump(relevant)
+    assert not set(relevant) & set(state.relevant({photos._stem("chair")}, 6))
@@ -0,0 +1,152 @@
+"""Журнал публикаций: ключи идемпотентности, захват ключа и create_entry на заглушке API."""
+
+import threading
+import time
+
+import pytest
+import requests
+
+import publish_log
+import publisher
+import storage
+from publisher import PublishInProgress, VcPublisher
+
+
+def _publisher(api, **kwargs) -> VcPublisher:
+    return VcPublisher("token", base_url=api.url, rate_limit=100, max_rate_limit=200, **kwargs)
+
+
+def _abandon(key: str, title: str) -> None:
+    """Ключ pending, который бросил упавший публикатор: аренда истекла."""
+    publish_log.claim(key, title, None, "crashed")
+    storage.connect().execute("UPDATE published_entries SET lease_until = 0 WHERE key = ?", (key,))
+
+
+def test_make_key_depends_on_content_not_only_title(make_article):
+    a = make_article(intro="Первая статья.")
+    b = make_article(intro="Другая статья с тем же заголовком.")
+    assert publish_log.make_key(a, None, False) == publish_log.make_key(make_article(intro="Первая статья."), None, False)
+    assert publish_log.make_key(a, None, False) != publish_log.make_key(b, None, False)
+    assert publish_log.make_key(a, None, False) != publish_log.make_key(a, None, True)
+    assert publish_log.make_key(a, None, False) != publish_log.make_key(a, None, False, account="other")
+
+
+def test_claim_is_exclusive_until_lease_expires():
+    assert publish_log.claim("k", "Заголовок", None, "a") == (True, None)
+    claimed, record = publish_log.claim("k", "Заголовок", None, "b")
+    assert not claimed and record["owner"] == "a"
+
+    _abandon("k2", "Заголовок")
+    claimed, record = publish_log.claim("k2", "Заголовок", None, "b")
+    # Брошенный ключ забирается, но исход прошлой попытки надо проверить
+    assert claimed and record["status"] == "pending"
+    assert not publish_log.renew("k2", "crashed")
+    assert publish_log.renew("k2", "b")
+
+
+def test_mark_done_keeps_known_blocks_and_images():
+    publish_log.claim("k", "Заголовок", None, "owner")
+    publish_log.mark_done("k", {"id": 7, "url": "u"}, blocks=[{"type": "paragraph"}], images=[{"uuid": "x"}], published=True)
+    # Запись, найденная после сбоя, не знает отправленных блоков — прежние не затираются
+    publish_log.mark_done("k", {"id": 7})
+
+    record = publish_log.get("k")
+    assert record["status"] == "done"
+    assert record["blocks"] == [{"type": "paragraph"}]
+    assert record["images"] == [{"uuid": "x"}]
+    assert record["published"] == 1
+    assert record["url"] == "u"
+
+
+def test_create_entry_is_idempotent(fake_api, make_article):
+    pub = _publisher(fake_api)
+    article = make_article()
+    first = pub.publish_article(article, [])
+    second = pub.publish_article(article, [])
+
+    assert first["id"] == second["id"]
+    assert fake_api.count("/entry/create") == 1
+
+
+def test_new_article_with_same_title_is_posted(fake_api, make_article):
+    pub = _publisher(fake_api)
+    first = pub.publish_article(make_article(intro="Первая."), [])
+    second = pub.publish_article(make_article(intro="Вторая."), [])
+
+    assert first["id"] != second["id"]
+    assert fake_api.count("/entry/create") == 2
+
+
+def test_concurrent_publishers_create_one_entry(fake_api, make_article):
+    fake_api.options.latency = 0.3
+    pub = _publisher(fake_api)
+    key = publish_log.article_key("a.html", None)
+    results = []
+
+    def publish():
+        results.append(pub.publish_article(make_article(), [], publish_key=key, update=True))
+
+    threads = [threading.Thread(target=publish) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [r["id"] for r in results] == [1000, 1000]
+    assert fake_api.count("/entry/create") == 1
+    assert fake_api.count("/entry/edit") == 0
+
+
+def test_waiting_publisher_applies_its_own_version(fake_api, make_article):
+    fake_api.options.latency = 0.3
+    pub = _publisher(fake_api)
+    key = publish_log.article_key("a.html", None)
+    first = threading.Thread(target=pub.publish_article, args=(make_article(), []), kwargs={"publish_key": key, "update": True})
+    first.start()
+    while publish_log.get(key) is None:
+        time.sleep(0.01)
+
+    # Вторая версия ждёт ключ, получает созданную запись и правит её, а не создаёт новую
+    entry = pub.publish_article(make_article(intro="Правка."), [], publish_key=key, update=True)
+    first.join()
+    assert entry["id"] == 1000
+    assert fake_api.count("/entry/create") == 1
+    assert fake_api.count("/entry/edit") == 1
+
+
+def test_busy_key_is_not_posted(fake_api, make_article, monkeypatch):
+    monkeypatch.setattr(publisher, "CLAIM_WAIT", 0.2)
+    article = make_article()
+    publish_log.claim(publish_log.make_key(article, None, False), article.title, None, "other-process")
+
+    with pytest.raises(PublishInProgress):
+        _publisher(fake_api).publish_article(article, [])
+    assert fake_api.count("/entry/create") == 0
+
+
+def test_pending_entry_found_on_vc_is_not_created_again(fake_api, make_article):
+    article = make_article()
+    key = publish_log.make_key(article, None, False)
+    # Прошлый запрос создал запись, но ответ потерялся
+    requests.post(f"{fake_api.url}/entry/create", data={"title": article.title}, timeout=5)
+    _abandon(key, article.title)
+
+    entry = _publisher(fake_api).publish_article(article, [])
+
+    assert entry["id"] == 1000
+    assert fake_api.count("/entry/create") == 1
+    assert publish_log.get(key)["status"] == "done"
+
+
+def test_pending_lookup_skips_entries_of_other_articles(fake_api, make_article):
+    pub = _publisher(fake_api)
+    pub.publish_article(make_article(intro="Старая статья."), [])
+    article = make_article(intro="Новая статья.")
+    key = publish_log.make_key(article, None, False)
+    _abandon(key, article.title)
+
+    entry = pub.publish_article(article, [])
+
+    # Старая запись с тем же заголовком принадлежит другой статье — создаётся новая
+    assert entry["id"] != 1000
+    assert fake_api.count("/entry/create") == 2
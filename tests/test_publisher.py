@@ -0,0 +1,62 @@
+"""Сборка блоков, diff_blocks и правка уже опубликованной записи на месте."""
+
+import pytest
+
+import publish_log
+from publisher import VcPublisher, diff_blocks
+
+
+def _publisher(api) -> VcPublisher:
+    return VcPublisher("token", base_url=api.url, rate_limit=100, max_rate_limit=200)
+
+
+def test_diff_blocks():
+    a = {"type": "paragraph", "data": {"text": "a"}}
+    b = {"type": "paragraph", "data": {"text": "b"}}
+    c = {"type": "paragraph", "data": {"text": "c"}}
+    assert diff_blocks([a, b], [a, b]) == []
+    assert diff_blocks([a, b], [a, c]) == [("replace", 1, 2, 1, 2)]
+    assert diff_blocks([a], [a, b]) == [("insert", 1, 1, 1, 2)]
+    assert diff_blocks([a, b], [b]) == [("delete", 0, 1, 0, 0)]
+
+
+def test_update_edits_entry_in_place(fake_api, make_article):
+    pub = _publisher(fake_api)
+    key = publish_log.article_key("article.html", None)
+    created = pub.publish_article(make_article(), [], publish_key=key, update=True)
+
+    # Без изменений запрос к API не нужен
+    same = pub.publish_article(make_article(), [], publish_key=key, update=True)
+    assert same["id"] == created["id"]
+    assert fake_api.count("/entry/edit") == 0
+
+    edited = pub.publish_article(make_article(intro="Новое вступление."), [], publish_key=key, update=True)
+    assert edited["id"] == created["id"]
+    assert fake_api.count("/entry/create") == 1
+    assert fake_api.count("/entry/edit") == 1
+
+
+def test_update_keeps_photos_of_recovered_entry(fake_api, make_article, tmp_path):
+    pub = _publisher(fake_api)
+    key = publish_log.article_key("article.html", None)
+    photo = tmp_path / "photo.jpg"
+    photo.write_bytes(b"not really a jpeg" * 10)
+    pub.publish_article(make_article(), [photo], publish_key=key, update=True)
+    images = publish_log.get(key)["images"]
+    assert images
+
+    # Восстановление после сбоя (mark_done без блоков и фото) не теряет фото
+    publish_log.mark_done(key, {"id": 1000})
+    pub.publish_article(make_article(intro="Правка."), [], publish_key=key, update=True)
+    assert publish_log.get(key)["images"] == images
+    assert fake_api.count("/uploader/upload") == 1
+
+
+def test_update_refuses_to_strip_unknown_photos(fake_api, make_article):
+    key = publish_log.article_key("article.html", None)
+    publish_log.claim(key, "Заголовок", None, "owner")
+    publish_log.mark_done(key, {"id": 1000, "url": "u"})
+
+    with pytest.raises(RuntimeError, match="avoid stripping"):
+        _publisher(fake_api).publish_article(make_article(), [], publish_key=key, update=True)
+    assert fake_api.count("/entry/edit") == 0
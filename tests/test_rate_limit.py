@@ -0,0 +1,71 @@
+"""Адаптивный ограничитель скорости (AIMD), Retry-After и повторы 429 в публикаторе."""
+
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+import publish_log
+from publisher import RateLimited, VcPublisher
+from retry import AdaptiveRateLimiter, parse_retry_after
+
+
+def test_limiter_halves_on_throttle_and_grows_additively():
+    limiter = AdaptiveRateLimiter(rate=4.0, max_rate=4.2, min_rate=0.5, increase=0.1)
+    limiter.on_throttle()
+    assert limiter.rate == 2.0
+    for _ in range(3):
+        limiter.on_throttle()
+    assert limiter.rate == 0.5                      # не ниже min_rate
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.rate == pytest.approx(4.2)       # не выше max_rate
+
+
+def test_limiter_blocks_everyone_for_retry_after():
+    limiter = AdaptiveRateLimiter(rate=1000.0, max_rate=1000.0)
+    limiter.on_throttle(retry_after=0.2)
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.19
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    when = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < parse_retry_after(format_datetime(when, usegmt=True)) <= 30
+
+
+def test_server_errors_do_not_raise_the_rate(fake_api, make_article):
+    fake_api.options.rate_5xx = 1.0
+    pub = VcPublisher("token-5xx", base_url=fake_api.url, max_retries=0, rate_limit=2.0, max_rate_limit=10.0)
+
+    with pytest.raises(RuntimeError):
+        pub.update_entry(1, make_article(), [])
+    assert pub.rate == 2.0
+
+
+def test_persistent_429_is_not_retried_twice(fake_api, make_article):
+    fake_api.options.rate_429 = 1.0
+    pub = VcPublisher("token-429", base_url=fake_api.url, max_retries=2, rate_limit=100, max_rate_limit=200)
+    article = make_article()
+
+    with pytest.raises(RuntimeError, match="429"):
+        pub.publish_article(article, [])
+    # Повторы делает только ограничитель: max_retries + 1 попыток, а не (max_retries + 1)²
+    assert fake_api.count("/entry/create") == 3
+    assert pub.rate < 100
+    # 429 — запись точно не создана: ключ свободен для следующей попытки
+    assert publish_log.get(publish_log.make_key(article, None, False)) is None
+
+
+def test_request_raises_rate_limited(fake_api):
+    fake_api.options.rate_429 = 1.0
+    pub = VcPublisher("token-raw", base_url=fake_api.url, max_retries=1, rate_limit=100, max_rate_limit=200)
+    with pytest.raises(RateLimited) as exc:
+        pub._request("GET", f"{fake_api.url}/auth/me", timeout=5)
+    assert exc.value.response.status_code == 429
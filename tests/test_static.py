@@ -0,0 +1,42 @@
+"""Статические ответы веб-интерфейса: сжатие, ETag и 304."""
+
+import gzip
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client():
+    import app
+    return app.app.test_client()
+
+
+@pytest.mark.parametrize("path", ["/", "/manifest.json", "/icon.svg", "/sw.js"])
+def test_etag_and_not_modified(client, path):
+    resp = client.get(path)
+    assert resp.status_code == 200
+    etag = resp.headers["ETag"]
+    assert resp.headers["Vary"] == "Accept-Encoding"
+
+    cached = client.get(path, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+    assert cached.headers["ETag"] == etag
+
+
+def test_gzip_variant_has_its_own_etag(client):
+    plain = client.get("/")
+    packed = client.get("/", headers={"Accept-Encoding": "gzip, deflate"})
+
+    assert packed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(packed.data) == plain.data
+    assert packed.headers["ETag"] != plain.headers["ETag"]
+    # ETag другого варианта не подходит — тело отдаётся целиком
+    assert client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": plain.headers["ETag"]}).status_code == 200
+    assert plain.headers["Cache-Control"] == "no-cache"
+
+
+def test_service_worker_cache_follows_shell_version(client):
+    import app
+    sw = client.get("/sw.js").data.decode()
+    assert f"seo-bot-{app.STATIC_ASSETS['/'].version}" in sw
@@ -0,0 +1,42 @@
+"""Реестр задач веб-интерфейса: аренда, продление и задачи умерших процессов."""
+
+import time
+
+import pytest
+
+import tasks
+
+
+@pytest.fixture
+def short_leases(monkeypatch):
+    monkeypatch.setattr(tasks, "LEASE_SECONDS", 0.8)
+
+
+def test_task_of_dead_process_ends_with_error(short_leases):
+    registry = tasks.TaskRegistry()
+    tasks._db().execute(
+        "INSERT INTO tasks (id, state, seq, final, instance, lease_until, updated_at) "
+        "VALUES ('t', '{\"status\": \"running\", \"seq\": 1}', 1, 0, 'dead-instance', ?, 0)",
+        (time.time() - 1,),
+    )
+    state = registry.wait("t", seen=1, timeout=2)
+    assert state["status"] == "error"
+
+
+def test_own_task_lease_is_renewed_and_queued_task_has_none(short_leases):
+    registry = tasks.TaskRegistry()
+    registry.set("mine", "running", stage="generating")
+    registry.set("queued", "running", lease=False, stage="queued")
+    time.sleep(1.5)
+    assert registry.get("mine")["status"] == "running"
+    assert registry.get("queued")["status"] == "running"
+    registry.set("mine", "done", stage="done")
+    registry.set("queued", "cancelled", stage="cancelled")
+
+
+def test_final_state_is_kept_and_seq_grows():
+    registry = tasks.TaskRegistry()
+    first = registry.set("t", "running", stage="generating")
+    last = registry.set("t", "done", stage="done", filename="a.html")
+    assert last["seq"] == first["seq"] + 1
+    assert tasks.TaskRegistry().get("t")["filename"] == "a.html"
@@ -0,0 +1,75 @@
+"""
+Кэш загрузок на VC.RU: SHA-256 содержимого файла → метаданные с CDN (uuid, url, width, height).
+Одно и то же фото из ротации загружается один раз; записи старше
+UPLOAD_CACHE_TTL_DAYS и записи без uuid/url считаются недействительными.
+"""
+
+import json
+import logging
+import time
+from typing import Optional
+
+import config
+import storage
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_cache (
+    sha256     TEXT NOT NULL,
+    base_url   TEXT NOT NULL,
+    data       TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (sha256, base_url)
+);
+"""
+
+
+def _is_valid(img_data: object) -> bool:
+    return (
+        isinstance(img_data, dict)
+        and bool(img_data.get("uuid"))
+        and isinstance(img_data.get("url"), str)
+        and img_data["url"].startswith("http")
+    )
+
+
+def get(sha256: str, base_url: str) -> Optional[dict]:
+    """Возвращает сохранённые метаданные загрузки или None (нет, истекло, повреждено)."""
+    conn = storage.connect(_SCHEMA)
+    row = conn.execute(
+        "SELECT data, created_at FROM upload_cache WHERE sha256 = ? AND base_url = ?",
+        (sha256, base_url),
+    ).fetchone()
+    if row is None:
+        return None
+    try:
+        img_data = json.loads(row["data"])
+    except ValueError:
+        img_data = None
+    expired = time.time() - row["created_at"] > config.UPLOAD_CACHE_TTL_DAYS * 86400
+    if expired or not _is_valid(img_data):
+        invalidate(sha256, base_url)
+        return None
+    return img_data
+
+
+def put(sha256: str, base_url: str, img_data: dict) -> None:
+    if not _is_valid(img_data):
+        logger.warning(f"Upload response without uuid/url is not cached: {img_data}")
+        return
+    conn = storage.connect(_SCHEMA)
+    conn.execute(
+        "INSERT OR REPLACE INTO upload_cache (sha256, base_url, data, created_at) VALUES (?, ?, ?, ?)",
+        (sha256, base_url, json.dumps(img_data, ensure_ascii=False), time.time()),
+    )
+
+
+def invalidate(sha256: str, base_url: str) -> None:
+    conn = storage.connect(_SCHEMA)
+    conn.execute("DELETE FROM upload_cache WHERE sha256 = ? AND base_url = ?", (sha256, base_url))
+
+
+def clear() -> None:
+    conn = storage.connect(_SCHEMA)
+    conn.execute("DELETE FROM upload_cache")